@@ -0,0 +1,323 @@
+#! /usr/bin/env python
+
+""" Copyright 2021 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ Local stand-in for the Imaging API policy endpoints the CLI calls:
+
+    GET    /imaging/v2/network/{network}/policies
+    GET    /imaging/v2/network/{network}/policies/{policyId}
+    PUT    /imaging/v2/network/{network}/policies/{policyId}
+    DELETE /imaging/v2/network/{network}/policies/{policyId}
+    GET    /imaging/v2/network/{network}/policies/history/{policyId}
+    GET    /imaging/v2/network/{network}/images
+    GET    /imaging/v2/network/{network}/imagecollections
+
+ Policies are kept in memory per policy set (Luna-Token header) and
+ network. Images and image collections are generated on the fly, and
+ listed by pages (limit and continuationToken query parameters).
+ Requests must carry an EdgeGrid Authorization header, whose signature
+ is verified when --client-secret is given. Latency, server errors and
+ throttling (429) can be injected. Point the CLI to it with a
+ credentials file section such as:
+
+    [mock]
+    host = http://127.0.0.1:8080
+    client_token = akab-client
+    client_secret = secret
+    access_token = akab-access
+"""
+from __future__ import print_function
+import re
+import sys
+import json
+import time
+import hmac
+import base64
+import random
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HISTORY_PATH = re.compile(r"^/imaging/v2/network/(staging|production)/policies/history/([^/?]+)/?(?:\?.*)?$")
+POLICY_PATH = re.compile(r"^/imaging/v2/network/(staging|production)/policies(?:/([^/?]+))?/?(?:\?.*)?$")
+LISTING_PATH = re.compile(r"^/imaging/v2/network/(staging|production)/(images|imagecollections)/?$")
+MAX_PAGE_SIZE = 1000
+SERVER_FIELDS = ["id", "version", "previousVersion", "dateCreated", "user"]
+AUTH_HEADER = re.compile(r"^EG1-HMAC-SHA256 client_token=([^;]+);access_token=([^;]+);"
+                         r"timestamp=([^;]+);nonce=([^;]+);signature=(.+)$")
+
+
+def base64HmacSha256(data, key):
+    return base64.b64encode(hmac.new(key.encode('utf-8'), data.encode('utf-8'),
+                                     hashlib.sha256).digest()).decode('utf-8')
+
+
+def now():
+    return time.strftime("%Y-%m-%d %H:%M:%S+0000", time.gmtime())
+
+
+def samplePolicy(policyId, version=1):
+    return {
+        "id": policyId,
+        "version": version,
+        "dateCreated": now(),
+        "user": "mock",
+        "breakpoints": {"widths": [320, 640, 1024, 2048, 5000]},
+        "output": {"perceptualQuality": "mediumHigh", "allowedFormats": ["avif", "webp", "jpeg"]},
+        "transformations": [{"transformation": "MaxColors", "colors": 256}],
+    }
+
+
+def sampleListing(kind, index, policies):
+    if kind == "images":
+        return {"id": "https://www.example.com/images/img%06d.jpg" % index,
+                "policyId": "policy%05d" % (index % max(1, policies)),
+                "type": "jpeg", "size": 20000 + index % 50000,
+                "dateCreated": "2021-01-01 00:00:00+0000"}
+    return {"id": "collection%05d" % index,
+            "definition": {"items": ["https://www.example.com/images/img%06d.jpg" % item
+                                     for item in range(index * 3, index * 3 + 3)]},
+            "dateCreated": "2021-01-01 00:00:00+0000"}
+
+
+def listingPage(kind, total, policies, query):
+    """ Page of a generated listing. The continuation token is the
+    offset of the next item, base64 encoded """
+    limit = min(int(query.get("limit", ["100"])[0]), MAX_PAGE_SIZE)
+    token = query.get("continuationToken", [None])[0]
+    start = int(base64.urlsafe_b64decode(token.encode('ascii'))) if token else 0
+    end = min(start + limit, total)
+    page = {"items": [sampleListing(kind, index, policies) for index in range(start, end)],
+            "totalItems": total}
+    if end < total:
+        page["continuationToken"] = base64.urlsafe_b64encode(str(end).encode('ascii')).decode('ascii')
+    return page
+
+
+class PolicyStore():
+    """ In memory policies per (policy set, network) """
+
+    def __init__(self, policies=0):
+        self.lock = threading.Lock()
+        self.policies = {}
+        self.history = {}
+        self.seed = policies
+
+    def network(self, lunaToken, network):
+        key = (lunaToken, network)
+        if key not in self.policies:
+            self.policies[key] = dict(("policy%05d" % index, samplePolicy("policy%05d" % index))
+                                      for index in range(self.seed))
+        return self.policies[key]
+
+    def record(self, lunaToken, network, policy, action):
+        """ Appends a version to the history of a policy """
+        self.history.setdefault((lunaToken, network, policy["id"]), []).append(
+            {"id": policy["id"], "version": policy["version"], "user": policy["user"],
+             "dateCreated": policy["dateCreated"], "action": action})
+
+
+class MockImagingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockImagingAPI/1.0"
+    # Headers and body are written separately, Nagle would delay the body
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.options.log:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def reply(self, status, body, headers=None):
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def problem(self, status, title, detail, headers=None):
+        self.reply(status, {"type": "https://problems.luna.akamaiapis.net/image-policy-manager/error",
+                            "title": title, "status": status, "detail": detail,
+                            "instance": self.path}, headers)
+
+    def checkAuth(self, body):
+        """ Returns an error message if the EdgeGrid signature is invalid """
+        options = self.server.options
+        match = AUTH_HEADER.match(self.headers.get("Authorization", ""))
+        if not match:
+            return "Missing or malformed EG1-HMAC-SHA256 Authorization header"
+        client_token, access_token, timestamp, nonce, signature = match.groups()
+        if options.client_token and client_token != options.client_token:
+            return "Unknown client token"
+        if options.access_token and access_token != options.access_token:
+            return "Unknown access token"
+        if not options.client_secret:
+            return None
+        content_hash = ""
+        if self.command == "POST" and body:
+            content_hash = base64.b64encode(hashlib.sha256(body[:131072]).digest()).decode('utf-8')
+        auth_header = self.headers["Authorization"][:-len("signature=" + signature)]
+        data_to_sign = "\t".join([self.command, self.server.scheme,
+                                  self.headers.get("Host", ""), self.path, "",
+                                  content_hash, auth_header])
+        signing_key = base64HmacSha256(timestamp, options.client_secret)
+        if not hmac.compare_digest(base64HmacSha256(data_to_sign, signing_key), signature):
+            return "The signature does not match"
+        return None
+
+    def handle_one(self):
+        options = self.server.options
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+
+        if options.latency or options.jitter:
+            time.sleep((options.latency + random.uniform(0, options.jitter)) / 1000.0)
+
+        error = self.checkAuth(body)
+        if error:
+            return self.problem(401, "Not authorized", error)
+        if random.random() < options.throttle_rate:
+            return self.problem(429, "Too Many Requests", "Rate limit exceeded",
+                                {"Retry-After": str(options.retry_after),
+                                 "X-RateLimit-Remaining": "0"})
+        if random.random() < options.error_rate:
+            return self.problem(503, "Service Unavailable", "Injected server error")
+
+        lunaToken = self.headers.get("Luna-Token")
+        if not lunaToken:
+            return self.problem(400, "Bad Request", "Missing Luna-Token header")
+        store = self.server.store
+
+        url = urlsplit(self.path)
+        match = LISTING_PATH.match(url.path)
+        if match and self.command == "GET":
+            kind = match.group(2)
+            total = options.images if kind == "images" else options.collections
+            try:
+                return self.reply(200, listingPage(kind, total, options.policies,
+                                                   parse_qs(url.query)))
+            except ValueError:
+                return self.problem(400, "Bad Request", "Invalid limit or continuationToken")
+
+        match = HISTORY_PATH.match(self.path)
+        if match and self.command == "GET":
+            network, policyId = match.groups()
+            with store.lock:
+                policies = store.network(lunaToken, network)
+                history = store.history.get((lunaToken, network, policyId))
+                if history is None and policyId in policies:
+                    history = [dict((key, policies[policyId][key]) for key in
+                                    ["id", "version", "user", "dateCreated"]), ]
+                    history[0]["action"] = "UPSERT"
+                if not history:
+                    return self.problem(404, "Not Found", "Policy %s does not exist" % policyId)
+                items = sorted(history, key=lambda entry: -entry["version"])
+                return self.reply(200, {"items": items, "totalItems": len(items)})
+
+        match = POLICY_PATH.match(self.path)
+        if not match:
+            return self.problem(404, "Not Found", "Unknown endpoint")
+        network, policyId = match.groups()
+
+        with store.lock:
+            policies = store.network(lunaToken, network)
+            if policyId is None:
+                if self.command != "GET":
+                    return self.problem(405, "Method Not Allowed", "Unsupported method")
+                items = list(policies.values())
+                return self.reply(200, {"items": items, "totalItems": len(items)})
+            if self.command == "GET":
+                if policyId not in policies:
+                    return self.problem(404, "Not Found", "Policy %s does not exist" % policyId)
+                return self.reply(200, policies[policyId])
+            if self.command == "PUT":
+                try:
+                    policy = json.loads(body.decode('utf-8'))
+                except ValueError:
+                    return self.problem(400, "Bad Request", "Invalid JSON")
+                if not isinstance(policy, dict):
+                    return self.problem(400, "Bad Request", "A policy must be a JSON object")
+                previous = policies.get(policyId)
+                policy = dict((key, value) for key, value in policy.items()
+                              if key not in SERVER_FIELDS)
+                policy.update(id=policyId, version=previous["version"] + 1 if previous else 1,
+                              dateCreated=now(), user="mock")
+                if previous:
+                    policy["previousVersion"] = previous["version"]
+                if previous and (lunaToken, network, policyId) not in store.history:
+                    store.record(lunaToken, network, previous, "UPSERT")
+                policies[policyId] = policy
+                store.record(lunaToken, network, policy, "UPSERT")
+                operation = "UPDATED" if previous else "CREATED"
+                return self.reply(201 if operation == "CREATED" else 200,
+                                  {"operationPerformed": operation, "id": policyId,
+                                   "description": "Policy %s updated." % policyId})
+            if self.command == "DELETE":
+                if policies.pop(policyId, None) is None:
+                    return self.problem(404, "Not Found", "Policy %s does not exist" % policyId)
+                return self.reply(200, {"operationPerformed": "DELETED", "id": policyId,
+                                        "description": "Policy %s deleted." % policyId})
+        return self.problem(405, "Method Not Allowed", "Unsupported method")
+
+    do_GET = do_PUT = do_DELETE = do_POST = handle_one
+
+
+def createServer(options):
+    server = ThreadingHTTPServer((options.bind, options.port), MockImagingHandler)
+    server.daemon_threads = True
+    server.options = options
+    server.scheme = "http"
+    server.store = PolicyStore(options.policies)
+    return server
+
+
+def parseOptions(arguments=None):
+    parser = argparse.ArgumentParser(description='Mock Imaging API server.')
+    parser.add_argument('--bind', default='127.0.0.1', help='Address to listen on. Default is 127.0.0.1')
+    parser.add_argument('--port', '-p', type=int, default=8080, help='Port to listen on (0 picks a free one). Default is 8080')
+    parser.add_argument('--policies', type=int, default=10, help='Policies seeded per policy set and network. Default is 10')
+    parser.add_argument('--images', type=int, default=1000, help='Images listed per network. Default is 1000')
+    parser.add_argument('--collections', type=int, default=50, help='Image collections listed per network. Default is 50')
+    parser.add_argument('--latency', type=float, default=0.0, help='Latency added to every response, in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra latency (up to this many ms)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with a 503')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fraction of requests answered with a 429')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After seconds sent with a 429. Default is 1')
+    parser.add_argument('--client-token', default=None, help='Only accept this client token')
+    parser.add_argument('--access-token', default=None, help='Only accept this access token')
+    parser.add_argument('--client-secret', default=None, help='Verify the EdgeGrid signatures with this client secret')
+    parser.add_argument('--log', default=False, action='store_true', help='Log every request')
+    return parser.parse_args(arguments)
+
+
+def main():
+    options = parseOptions()
+    server = createServer(options)
+    print("Listening on http://%s:%d" % server.server_address[:2])
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
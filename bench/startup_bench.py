@@ -0,0 +1,101 @@
+#! /usr/bin/env python
+
+""" Copyright 2021 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ Cold start benchmark: runs the CLI entry point with arguments that do not
+ need the API (--version, --help) and reports the wall time and the
+ slowest imports (python -X importtime). Fails if the median wall time
+ goes over the threshold, or if any module that only API calls need is
+ imported on these paths.
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+BIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin")
+ENTRY_POINT = os.path.join(BIN_DIR, "akamai-image-manager")
+
+# Modules that must stay off the --help/--version path
+HEAVY_MODULES = ["requests", "urllib3", "akamai.edgegrid", "texttable", "future",
+                 "http_calls", "aiohttp"]
+
+COMMANDS = [["--version"], ["--help"], ["--policy-set", "x", "list-policies", "--help"]]
+
+
+def runOnce(arguments, importtime=False):
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + arguments
+    start = time.time()
+    process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             cwd=BIN_DIR, universal_newlines=True)
+    return (time.time() - start) * 1000, process.stderr
+
+
+def parseImportTime(stderr):
+    """ Returns (module, self us, cumulative us) for every import """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        imports.append((module.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CLI cold start benchmark.')
+    parser.add_argument('--runs', '-r', type=int, default=10, help='Runs per command. Default is 10')
+    parser.add_argument('--max-ms', type=float, default=150.0,
+                        help='Highest accepted median wall time (over a bare interpreter start). Default is 150')
+    parser.add_argument('--top', type=int, default=10, help='Slowest imports to show. Default is 10')
+    args = parser.parse_args()
+
+    baseline = median([runOnce(["-c", "pass"])[0] for _ in range(args.runs)])
+    print("Bare interpreter start: %.1f ms" % baseline)
+
+    failed = False
+    for arguments in COMMANDS:
+        label = " ".join(arguments)
+        wall = median([runOnce([ENTRY_POINT] + arguments)[0] for _ in range(args.runs)])
+        imports = parseImportTime(runOnce([ENTRY_POINT] + arguments, True)[1])
+        heavy = sorted(set(heavy_module for module, _, _ in imports
+                           for heavy_module in HEAVY_MODULES
+                           if module == heavy_module or module.startswith(heavy_module + ".")))
+
+        print("\n%s: %.1f ms median (+%.1f ms over a bare start), %d imports"
+              % (label, wall, wall - baseline, len(imports)))
+        for module, self_us, cumulative_us in sorted(imports, key=lambda item: -item[1])[:args.top]:
+            print("  %-40s %8.1f ms self %8.1f ms cumulative" % (module, self_us / 1000.0,
+                                                                 cumulative_us / 1000.0))
+        if wall - baseline > args.max_ms:
+            print("FAILED: over the %.0f ms threshold" % args.max_ms)
+            failed = True
+        if heavy:
+            print("FAILED: imports %s" % ", ".join(heavy))
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
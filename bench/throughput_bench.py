@@ -0,0 +1,187 @@
+#! /usr/bin/env python
+
+""" Copyright 2021 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ Throughput benchmark: drives listPolicies, getPolicy, setPolicy,
+ deletePolicy and the bulk commands against the local mock Imaging API
+ (mock_imaging_server.py), for several policy counts, and reports
+ requests/sec, latency percentiles and the peak RSS of the CLI process.
+ Every policy count runs in its own process, so peak RSS is per size.
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import importlib.util
+import resource
+import tempfile
+import contextlib
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BIN_DIR = os.path.join(BENCH_DIR, "..", "bin")
+sys.path.insert(0, BIN_DIR)
+
+CLIENT_SECRET = "bW9jay1zZWNyZXQ="
+EDGERC = """[bench]
+host = http://127.0.0.1:%d
+client_token = akab-bench-client
+client_secret = %s
+access_token = akab-bench-access
+"""
+COLUMNS = "%7s %-24s %8s %8s %9s %8s %8s %8s %8s"
+
+
+def startServer(options, policies):
+    command = [sys.executable, os.path.join(BENCH_DIR, "mock_imaging_server.py"),
+               "--port", "0", "--policies", str(policies), "--client-secret", CLIENT_SECRET,
+               "--latency", str(options.latency), "--jitter", str(options.jitter),
+               "--error-rate", str(options.error_rate), "--throttle-rate", str(options.throttle_rate),
+               "--retry-after", "0.05"]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, universal_newlines=True)
+    port = int(server.stdout.readline().strip().rsplit(":", 1)[1])
+    return server, port
+
+
+def peakRss():
+    """ Peak resident set size of this process, in MB """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def benchOperations(common, options, policies, work_dir):
+    """ (name, function) of every benchmarked operation, in running order """
+    names = ["policy%05d" % index for index in range(policies)][:options.max_calls]
+    policyJSON = json.dumps({"breakpoints": {"widths": [320, 640, 1280]},
+                             "output": {"perceptualQuality": "high"}})
+    export_dir = os.path.join(work_dir, "export")
+    operations = [
+        ("listPolicies", lambda: [common.listPolicies("bench", "production")
+                                  for _ in range(options.repeat)]),
+        ("getPolicy", lambda: [common.getPolicy("bench", name, "production") for name in names]),
+        ("setPolicy", lambda: [common.setPolicy("bench", name, policyJSON, "staging")
+                               for name in names]),
+        ("export-policies", lambda: common.exportPolicies(
+            "bench", "production", export_dir, options.workers)),
+        ("sync-policies --plan", lambda: common.syncPolicies(
+            "bench", export_dir, "production", options.workers, True)),
+    ]
+    if importlib.util.find_spec("aiohttp") is not None:
+        operations.append(("export-policies --async", lambda: common.exportPolicies(
+            "bench", "production", os.path.join(work_dir, "export-async"), options.workers,
+            use_async=True)))
+    operations.append(("deletePolicy", lambda: [common.deletePolicy("bench", name, "staging")
+                                                for name in names]))
+    return operations
+
+
+def runSize(options, policies):
+    """ Benchmarks every operation against a server seeded with a number of
+    policies, returns one result dict per operation """
+    server, port = startServer(options, policies)
+    work_dir = tempfile.mkdtemp(prefix="im-bench-")
+    edgerc = os.path.join(work_dir, "edgerc")
+    with open(edgerc, "w") as edgerc_file:
+        edgerc_file.write(EDGERC % (port, CLIENT_SECRET))
+
+    sys.argv = ["akamai-image-manager", "--edgerc", edgerc, "--section", "bench",
+                "--policy-set", "bench", "list-policies"]
+    import common
+    from timings import TimingRecorder, percentile
+    common.loadConfig()
+    common.connect()
+    common.HttpCaller.timings = TimingRecorder()
+
+    results = []
+    try:
+        for operation, run in benchOperations(common, options, policies, work_dir):
+            common.HttpCaller.timings.spans = []
+            start = time.time()
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                run()
+            elapsed = time.time() - start
+            spans = common.HttpCaller.timings.spans
+            totals = sorted(span["total"] for span in spans)
+            results.append({
+                "policies": policies, "operation": operation, "requests": len(spans),
+                "errors": len([span for span in spans if span["status"] not in [200, 201]]),
+                "seconds": round(elapsed, 3),
+                "requests_per_second": round(len(spans) / elapsed, 1) if elapsed else 0.0,
+                "p50_ms": percentile(totals, 0.50), "p95_ms": percentile(totals, 0.95),
+                "p99_ms": percentile(totals, 0.99), "peak_rss_mb": round(peakRss(), 1)})
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def printResult(result):
+    print(COLUMNS % (result["policies"], result["operation"], result["requests"],
+                     "%.2f" % result["seconds"], "%.1f" % result["requests_per_second"],
+                     "%.1f" % result["p50_ms"], "%.1f" % result["p95_ms"],
+                     "%.1f" % result["p99_ms"], "%.1f" % result["peak_rss_mb"]))
+    sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CLI throughput benchmark against the mock Imaging API.')
+    parser.add_argument('--sizes', default='10,1000,10000', help='Comma separated policy counts. Default is 10,1000,10000')
+    parser.add_argument('--workers', '-w', type=int, default=16, help='Workers of the bulk commands. Default is 16')
+    parser.add_argument('--max-calls', type=int, default=1000, help='Policies used by the per-policy operations. Default is 1000')
+    parser.add_argument('--repeat', type=int, default=3, help='listPolicies calls. Default is 3')
+    parser.add_argument('--latency', type=float, default=0.0, help='Latency added by the server, in ms')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra server latency, in ms')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of 503 responses')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fraction of 429 responses')
+    parser.add_argument('--json', default=None, metavar='file_name', help='Also save the results as JSON')
+    parser.add_argument('--child', default=False, action='store_true', help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    sizes = [int(size) for size in options.sizes.split(",")]
+    if options.child:
+        for result in runSize(options, sizes[0]):
+            print(json.dumps(result))
+        return
+
+    print(COLUMNS % ("SIZE", "OPERATION", "REQUESTS", "SECONDS", "REQ/S", "P50 ms", "P95 ms",
+                     "P99 ms", "PEAK MB"))
+    child_options = ["--workers", str(options.workers), "--max-calls", str(options.max_calls),
+                     "--repeat", str(options.repeat), "--latency", str(options.latency),
+                     "--jitter", str(options.jitter), "--error-rate", str(options.error_rate),
+                     "--throttle-rate", str(options.throttle_rate)]
+    results = []
+    for size in sizes:
+        child = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child",
+                                  "--sizes", str(size)] + child_options,
+                                 stdout=subprocess.PIPE, universal_newlines=True)
+        for line in child.stdout:
+            result = json.loads(line)
+            results.append(result)
+            printResult(result)
+        if child.wait() != 0:
+            sys.exit("ERROR: benchmark for %d policies failed" % size)
+
+    if options.json:
+        with open(options.json, "w") as json_file:
+            json.dump(results, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+# Python edgegrid module - asyncio HTTP caller for ImgMan CLI module
+""" Copyright 2021 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+import os
+import sys
+import time
+import asyncio
+import json
+import logging
+import aiohttp
+import requests
+import json_codec
+from http_calls import EdgeGridHttpCaller, AdaptiveLimiter, IDEMPOTENT_METHODS, \
+    RETRY_STATUSES, DEFAULT_MAX_RETRIES, CHUNK_SIZE, retryDelay, isThrottled
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAdaptiveLimiter(AdaptiveLimiter):
+    """ AdaptiveLimiter for coroutines running on the same event loop """
+
+    def __init__(self, max_limit, min_limit=1, cooldown=1.0):
+        AdaptiveLimiter.__init__(self, max_limit, min_limit, cooldown)
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, throttled=False):
+        async with self.condition:
+            self.in_flight -= 1
+            self.adjust(throttled)
+            self.condition.notify_all()
+
+
+class AsyncEdgeGridHttpCaller(EdgeGridHttpCaller):
+    """ asyncio counterpart of EdgeGridHttpCaller. Requests are prepared (and
+    signed) by the requests session, so they carry the same headers and
+    EdgeGrid signature, then sent over a pooled aiohttp connector. The
+    number of requests in flight is capped by an adaptive semaphore, which
+    shrinks when the API throttles and grows back up to the concurrency """
+
+    def __init__(self, session, debug, verbose, baseurl, cache=None, concurrency=50,
+                 max_retries=DEFAULT_MAX_RETRIES, timeout=None, keep_alive=True):
+        EdgeGridHttpCaller.__init__(self, session, debug, verbose, baseurl, cache,
+                                    max_retries, timeout)
+        self.concurrency = max(1, concurrency)
+        self.keep_alive = keep_alive
+        self.client = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency,
+                                         force_close=not self.keep_alive)
+        timeout = aiohttp.ClientTimeout(total=None)
+        if self.timeout is not None:
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout[0],
+                                            sock_read=self.timeout[1])
+        self.client = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        self.limiter = AsyncAdaptiveLimiter(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.client.close()
+        self.client = None
+
+    async def request(self, method, endpoint, body=None, headers=None, parameters=None,
+                      output=None):
+        """ Signs and sends a request, returns (status, JSON). Idempotent
+        requests are retried like EdgeGridHttpCaller.send does. With an
+        output file, a successful response body is written to it in chunks
+        instead of being decoded """
+        attempt = 0
+        started = None
+        while True:
+            await self.limiter.acquire()
+            error, throttled = None, False
+            try:
+                # Signatures are timestamped, so every attempt is signed
+                # again, once it got its slot
+                signed = self.session.prepare_request(requests.Request(
+                    method, self.urlJoin(self.baseurl, endpoint), data=body,
+                    headers=headers, params=parameters))
+                sent = time.time()
+                started = started or sent
+                async with self.client.request(method, signed.url, data=signed.body,
+                                               headers=dict(signed.headers)) as endpoint_result:
+                    ttfb = (time.time() - sent) * 1000
+                    status = endpoint_result.status
+                    response_headers = endpoint_result.headers
+                    if output is not None and status == 200:
+                        async for chunk in endpoint_result.content.iter_chunked(CHUNK_SIZE):
+                            output.write(chunk)
+                        content = b''
+                    else:
+                        content = await endpoint_result.read()
+                    throttled = isThrottled(status, response_headers)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as caught:
+                error, throttled = caught, True
+            finally:
+                # Released whatever is raised, a lost slot would stall the calls
+                await self.limiter.release(throttled)
+            if error is not None:
+                if method not in IDEMPOTENT_METHODS or attempt >= self.max_retries:
+                    if self.timings is not None:
+                        self.timings.record(method, endpoint, "error", 0, attempt, 0.0,
+                                            (time.time() - started) * 1000)
+                    raise error
+                if output is not None:
+                    # Part of the body may be written, the retry writes it whole
+                    output.seek(0)
+                    output.truncate()
+                delay = retryDelay({}, attempt)
+                reason = error.__class__.__name__
+            else:
+                if (status not in RETRY_STATUSES or method not in IDEMPOTENT_METHODS
+                        or attempt >= self.max_retries):
+                    break
+                delay = retryDelay(response_headers, attempt)
+                reason = status
+            if self.verbose:
+                print("LOG: %s %s %s, retrying in %.1fs" % (method, endpoint, reason, delay),
+                      file=sys.stderr)
+            await asyncio.sleep(delay)
+            attempt += 1
+        if self.timings is not None:
+            # aiohttp does not expose the connection setup, only ttfb/total
+            size = int(response_headers.get("Content-Length") or len(content))
+            self.timings.record(method, endpoint, status, size, attempt, ttfb,
+                                (time.time() - started) * 1000)
+        content_type = response_headers.get("content-type")
+        if self.verbose:
+            print("LOG: %s %s %s %s" % (method, endpoint, status, content_type), file=sys.stderr)
+        result = json_codec.loads(content) if content else {}
+        if self.verbose and result:
+            print(">>>\n" + json.dumps(result, indent=2) + "\n<<<\n", file=sys.stderr)
+        return status, result
+
+    async def getResult(self, endpoint, parameters=None, cached=True, headers=None):
+        """ Executes a GET API call and returns the JSON output """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cacheKey(endpoint, parameters, headers)
+            if cached:
+                cached_result = self.cache.get(cache_key)
+                if cached_result is not None:
+                    if self.verbose: print("LOG: GET %s (cached)" % endpoint, file=sys.stderr)
+                    return cached_result
+        status, result = await self.request("GET", endpoint, headers=headers,
+                                            parameters=parameters)
+        self.httpErrors(status, endpoint, result)
+        if cache_key is not None and status == 200:
+            self.cache.set(cache_key, result)
+        return result
+
+    async def getRaw(self, endpoint, output, parameters=None, headers=None):
+        """ Executes a GET API call and writes the response body as is to a
+        binary file object, like EdgeGridHttpCaller.getRaw """
+        if self.cache is not None:
+            cached_raw = self.cache.getRaw(self.cacheKey(endpoint, parameters, headers))
+            if cached_raw is not None:
+                if self.verbose: print("LOG: GET %s (cached)" % endpoint, file=sys.stderr)
+                output.write(cached_raw)
+                return
+        status, result = await self.request("GET", endpoint, headers=headers,
+                                            parameters=parameters, output=output)
+        if status >= 300:
+            self.httpErrors(status, endpoint, result)
+            sys.exit("ERROR: Call to %s failed with a %s result\n" % (endpoint, status))
+
+    async def postResult(self, endpoint, body, parameters=None, headers=None):
+        """ Executes a POST API call and returns the JSON output """
+        headers = dict({'content-type': 'application/json'}, **(headers or {}))
+        status, result = await self.request("POST", endpoint, body, headers, parameters)
+        if status == 204:
+            return {}
+        self.httpErrors(status, endpoint, result)
+        return result
+
+    async def putResult(self, endpoint, body, parameters=None, headers=None):
+        """ Executes a PUT API call and returns the JSON output """
+        headers = dict({'content-type': 'application/json'}, **(headers or {}))
+        status, result = await self.request("PUT", endpoint, body, headers, parameters)
+        self.invalidateCache(endpoint, headers)
+        if status == 204:
+            return {}
+        self.httpErrors(status, endpoint, result)
+        return result
+
+    async def deleteResult(self, endpoint, headers=None):
+        """ Executes a DELETE API call and returns the JSON output """
+        status, result = await self.request("DELETE", endpoint, headers=headers)
+        self.invalidateCache(endpoint, headers)
+        if status == 204:
+            return {}
+        self.httpErrors(status, endpoint, result)
+        return result
+
+    async def runCall(self, call, cached=True):
+        """ Runs a (method, endpoint, body, headers) call, returning (result,
+        error). A DOWNLOAD call saves a GET response body into the file named
+        by body. httpErrors exits on fatal API errors, so SystemExit is
+        captured before it can reach (and stop) the event loop """
+        method, endpoint, body, headers = call
+        try:
+            if method == "GET":
+                return (await self.getResult(endpoint, cached=cached, headers=headers), None)
+            if method == "DOWNLOAD":
+                try:
+                    with open(body + ".tmp", "wb") as output:
+                        await self.getRaw(endpoint, output, headers=headers)
+                    os.replace(body + ".tmp", body)
+                except BaseException:
+                    # No partial file is left behind, e.g. on an error response
+                    if os.path.exists(body + ".tmp"):
+                        os.remove(body + ".tmp")
+                    raise
+                return (body, None)
+            if method == "PUT":
+                return (await self.putResult(endpoint, body, headers=headers), None)
+            if method == "POST":
+                return (await self.postResult(endpoint, body, headers=headers), None)
+            return (await self.deleteResult(endpoint, headers), None)
+        except (SystemExit, Exception) as error:
+            return (None, str(error).strip() or error.__class__.__name__)
+
+    async def gatherCalls(self, calls, cached=True):
+        async with self:
+            return await asyncio.gather(*[self.runCall(call, cached) for call in calls])
+
+    def runAll(self, calls, cached=True):
+        """ Runs every call concurrently from the current thread and returns
+        a list of (call, result, error) tuples in submission order """
+        calls = list(calls)
+        outcomes = asyncio.run(self.gatherCalls(calls, cached))
+        return [(call, result, error) for call, (result, error) in zip(calls, outcomes)]
@@ -0,0 +1,147 @@
+# Python edgegrid module - response cache for ImgMan CLI module
+""" Copyright 2021 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+import os
+import time
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get('AKAMAI_CLI_CACHE_PATH', os.path.join('~', '.akamai-cli', 'cache')),
+    'image-manager')
+# Durable data (policy index, version history) is kept apart from the
+# cache, which can be cleared at any time
+DEFAULT_DATA_DIR = os.path.join(
+    os.environ.get('AKAMAI_CLI_HOME', '~'), '.akamai-cli', 'data', 'image-manager')
+DEFAULT_TTL = 300
+DEFAULT_MAX_SIZE = 100
+
+
+class ResponseCache():
+    """ Persistent cache of GET responses. Every entry is a JSON file named
+    after the hash of its key; the file modification time tracks the last
+    use, which drives the least recently used eviction """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL,
+                 max_size=DEFAULT_MAX_SIZE, refresh=False):
+        self.directory = os.path.expanduser(directory)
+        self.ttl = float(ttl)
+        self.max_size = int(float(max_size) * 1024 * 1024)
+        self.refresh = refresh
+        self.size = None
+        self.lock = threading.Lock()
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def key(self, host, lunaToken, endpoint, parameters=None):
+        """ Cache key of a call. The endpoint carries the network and the
+        account switch key, the Luna token identifies the policy set """
+        raw_key = json.dumps([host, lunaToken, endpoint, parameters], sort_keys=True)
+        return hashlib.sha256(raw_key.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        """ Returns the cached response, or None if missing or expired """
+        entry = self.read(key)
+        if entry is None:
+            return None
+        if "raw" in entry:
+            return json.loads(entry["raw"])
+        return entry["body"]
+
+    def getRaw(self, key):
+        """ Returns the cached response body as the API sent it (bytes), or
+        None if missing, expired or only stored decoded """
+        entry = self.read(key)
+        if entry is None or "raw" not in entry:
+            return None
+        return entry["raw"].encode('utf-8')
+
+    def read(self, key):
+        """ Returns the cache entry of a key, or None if missing or expired """
+        if self.refresh:
+            return None
+        file_name = self.path(key)
+        try:
+            with open(file_name) as cache_file:
+                entry = json.load(cache_file)
+        except (IOError, OSError, ValueError):
+            return None
+        if time.time() - entry["stored"] > self.ttl:
+            self.remove(file_name)
+            return None
+        try:
+            os.utime(file_name, None)
+        except OSError:
+            pass
+        return entry
+
+    def set(self, key, body, raw=None):
+        """ Stores a response, as the API sent it when its bytes (raw) are
+        given, then evicts the least recently used entries if the cache
+        grew over its size limit """
+        if raw is not None:
+            entry = json.dumps({"stored": time.time(), "raw": raw.decode('utf-8')})
+        else:
+            entry = json.dumps({"stored": time.time(), "body": body})
+        handle, temp_name = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(handle, "w") as cache_file:
+            cache_file.write(entry)
+        os.replace(temp_name, self.path(key))
+        with self.lock:
+            if self.size is None:
+                self.size = self.evict()
+            self.size += len(entry)
+            if self.size > self.max_size:
+                self.size = self.evict()
+
+    def invalidate(self, key):
+        self.remove(self.path(key))
+
+    def remove(self, file_name):
+        try:
+            os.remove(file_name)
+        except OSError:
+            pass
+
+    def evict(self):
+        """ Removes the least recently used entries until the cache fits
+        in its size limit and returns the resulting size """
+        entries = []
+        total_size = 0
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, file_name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, file_name))
+            total_size += stat.st_size
+        for _, size, file_name in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            logger.debug("Evicting cache entry %s", file_name)
+            self.remove(os.path.join(self.directory, file_name))
+            total_size -= size
+        return total_size
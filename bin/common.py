@@ -23,33 +23,34 @@
 
 """
 # Libraries commmon to python 2 and 3
+# Heavy modules (requests, akamai.edgegrid, texttable...) are imported on
+# the code paths that use them, so that --help and --version start fast
 from __future__ import print_function
 import sys
 import os
-import logging
-import random
-import re
-import requests
 import json
-import urllib
-import texttable as tt
-from future import standard_library
-from future.builtins import next
-from future.builtins import object
-from http_calls import EdgeGridHttpCaller
-from akamai.edgegrid import EdgeGridAuth
+import time
+import json_codec
+from fnmatch import fnmatch
+from concurrent.futures import ThreadPoolExecutor
+from policy_utils import policyHash, normalizePolicy, readPolicyDir, parsePolicyJSON, \
+    diffPolicies
+from output import outputWriter, fieldValue, INVENTORY_FIELDS, INDEX_FIELDS, PROMOTE_FIELDS
 from config import EdgeGridConfig
-from subprocess import call
-standard_library.install_aliases()
 
-if sys.version_info[0] >= 3:
-     # python3
-	from urllib.parse import urljoin
-else:
-     # python2.7
-     from urlparse import urljoin
+if sys.version_info[0] < 3:
+    # python2.7
+    from future import standard_library
+    standard_library.install_aliases()
 
-session = requests.Session()
+session = None
+transport = None
+config = None
+baseurl = None
+responseCache = None
+HttpCaller = None
+profiler = None
+max_retries = None
 debug = False
 verbose = False
 cache = False
@@ -57,54 +58,144 @@ format = "json"
 section_name = "default"
 network = "production"
 
-# If all parameters are set already, use them.  Otherwise
-# use the config
-config = EdgeGridConfig({"verbose": False}, section_name)
 
-if hasattr(config, "debug") and config.debug:
-    debug = True
+def loadConfig():
+    """ Parses the command line and the credentials file """
+    global config, debug, verbose, cache
 
-if hasattr(config, "verbose") and config.verbose:
-    verbose = True
+    # If all parameters are set already, use them.  Otherwise
+    # use the config
+    config = EdgeGridConfig({"verbose": False}, section_name)
 
-if hasattr(config, "cache") and config.cache:
-    cache = True
+    if hasattr(config, "debug") and config.debug:
+        debug = True
 
+    if hasattr(config, "verbose") and config.verbose:
+        verbose = True
 
-# Set the config options
-session.auth = EdgeGridAuth(
-    client_token=config.client_token,
-    client_secret=config.client_secret,
-    access_token=config.access_token
-)
+    if hasattr(config, "cache") and str(config.cache).lower() in ["true", "1", "yes", "on"]:
+        cache = True
 
-if hasattr(config, 'headers'):
-    session.headers.update(config.headers)
+    if config.no_cache:
+        cache = False
 
-session.headers.update({'User-Agent': "AkamaiCLI"})
 
-baseurl = '%s://%s/' % ('https', config.host)
+def configFlag(name, default=True):
+    """ Boolean setting given as a flag or as a credentials file key """
+    value = getattr(config, name, None)
+    if value is None:
+        return default
+    return str(value).lower() in ["true", "1", "yes", "on"]
 
-HttpCaller = EdgeGridHttpCaller(session, debug, verbose, baseurl)
 
+def configNumber(name, default, convert=float):
+    value = getattr(config, name, None)
+    return default if value is None else convert(value)
+
+
+def mountTransport(pool_maxsize):
+    """ (Re)mounts the session's transport adapters with a pool of a
+    given size. Remounting drops the pooled connections, so the pool is
+    only ever grown """
+    from transport import TransportAdapter
+    transport["pool_maxsize"] = pool_maxsize
+    for prefix in ['https://', 'http://']:
+        session.mount(prefix, TransportAdapter(transport["pool_connections"], pool_maxsize,
+                                               transport["keep_alive"],
+                                               transport["ssl_context"], transport["timed"]))
+
+
+def connect():
+    """ Sets up the session and the HTTP caller out of the loaded config """
+    global session, transport, baseurl, responseCache, max_retries, HttpCaller
+    import requests
+    from akamai.edgegrid import EdgeGridAuth
+    from http_calls import EdgeGridHttpCaller, DEFAULT_MAX_RETRIES
+
+    session = requests.Session()
+
+    # Set the config options
+    session.auth = EdgeGridAuth(
+        client_token=config.client_token,
+        client_secret=config.client_secret,
+        access_token=config.access_token
+    )
+
+    if hasattr(config, 'headers'):
+        session.headers.update(config.headers)
+
+    session.headers.update({'User-Agent': "AkamaiCLI"})
+
+    if "://" in config.host:
+        # An explicit scheme, e.g. a local mock server: http://127.0.0.1:8080
+        baseurl = config.host.rstrip('/') + '/'
+    else:
+        baseurl = '%s://%s/' % ('https', config.host)
+
+    responseCache = None
+    if cache:
+        from cache import ResponseCache, DEFAULT_CACHE_DIR, DEFAULT_TTL, DEFAULT_MAX_SIZE
+        responseCache = ResponseCache(getattr(config, "cache_dir", None) or DEFAULT_CACHE_DIR,
+                                      getattr(config, "cache_ttl", None) or DEFAULT_TTL,
+                                      getattr(config, "cache_max_size", None) or DEFAULT_MAX_SIZE,
+                                      config.refresh)
+
+    max_retries = DEFAULT_MAX_RETRIES
+    if getattr(config, "max_retries", None) is not None:
+        max_retries = int(config.max_retries)
+
+    from transport import ResumingSSLContext, DEFAULT_POOL_CONNECTIONS, \
+        DEFAULT_POOL_MAXSIZE, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT
+    timed = bool(config.timings or config.timings_file or config.prometheus_file)
+    transport = {
+        "pool_connections": configNumber("pool_connections", DEFAULT_POOL_CONNECTIONS, int),
+        "keep_alive": configFlag("keep_alive"),
+        "ssl_context": ResumingSSLContext() if configFlag("tls_session_reuse") else None,
+        "timed": timed,
+    }
+    mountTransport(configNumber("pool_maxsize", DEFAULT_POOL_MAXSIZE, int))
+    timeout = (configNumber("connect_timeout", DEFAULT_CONNECT_TIMEOUT),
+               configNumber("read_timeout", DEFAULT_READ_TIMEOUT))
+
+    HttpCaller = EdgeGridHttpCaller(session, debug, verbose, baseurl, responseCache,
+                                    max_retries, timeout)
+
+    if timed:
+        import atexit
+        from timings import TimingRecorder
+        HttpCaller.timings = TimingRecorder()
+        atexit.register(reportTimings)
+
+
+def reportTimings():
+    """ Prints and exports the request timings at exit """
+    if config.timings:
+        HttpCaller.timings.summary(sys.stderr)
+    if config.timings_file:
+        HttpCaller.timings.writeSpans(config.timings_file)
+    if config.prometheus_file:
+        HttpCaller.timings.writePrometheus(config.prometheus_file)
+
+
+def tenantHeaders(lunaToken):
+    """ Headers selecting the policy set of a single request. They are
+    passed along with each call, never set on the shared session, so calls
+    for different policy sets can run concurrently """
+    return({'Luna-Token': lunaToken})
 
 
 def listPolicies(lunaToken, network, account_key=''):
     """ List the policies on a given network """
-    session.headers.update({'Luna-Token': lunaToken})
-
     list_endpoint = "/imaging/v2/network/" + network + "/policies"
     if account_key != '':
         list_endpoint = list_endpoint + '?accountSwitchKey=' + account_key
 
-    listResult = HttpCaller.getResult(list_endpoint)
+    listResult = HttpCaller.getResult(list_endpoint, headers=tenantHeaders(lunaToken))
     return(listResult)
 
 
 def getPolicy(lunaToken, policyName, network, account_key=''):
     """ Gets a specific policy on a given network in JSON format """
-    session.headers.update({'Luna-Token': lunaToken})
-
     if network == 'staging':
         get_policy_endpoint = "/imaging/v2/network/staging/policies/" + policyName
     else:
@@ -115,17 +206,23 @@ def getPolicy(lunaToken, policyName, network, account_key=''):
 
     print("Retrieving: " + policyName + " from " + network)
 
-    policyResult = HttpCaller.getResult(get_policy_endpoint)
+    policyResult = HttpCaller.getResult(get_policy_endpoint, headers=tenantHeaders(lunaToken))
 
     return(policyResult)
 
 
+def savePolicy(lunaToken, policyName, network, output, account_key=''):
+    """ Streams a specific policy on a given network, as returned by the
+    API, into a binary file object """
+    print("Retrieving: " + policyName + " from " + network)
+
+    HttpCaller.getRaw(policyEndpoint(network, policyName, account_key), output,
+                      headers=tenantHeaders(lunaToken))
+
+
 def setPolicy(lunaToken, policyName, policyData, network, account_key=''):
     """ Creates or updates a policy in a given network (or both) out of
     a JSON input file """
-    session.headers.update({'Luna-Token': lunaToken, "Content-Type":
-                            "application/json"})
-
     if network == 'staging':
         set_policy_endpoint = "/imaging/v2/network/staging/policies/" + policyName
     else:
@@ -137,15 +234,15 @@ def setPolicy(lunaToken, policyName, policyData, network, account_key=''):
 
     print("Updating " + policyName)
 
-    policyResult = HttpCaller.putResult(set_policy_endpoint, policyData)
+    policyResult = HttpCaller.putResult(set_policy_endpoint, policyData,
+                                        headers=tenantHeaders(lunaToken))
 
     return(policyResult)
 
 
 def deletePolicy(lunaToken, policyName, network, account_key=''):
     """ Deletes a policy in a given network (or both) """
-    session.headers.update({'Luna-Token': lunaToken})
-
+    headers = tenantHeaders(lunaToken)
     del_policy_stg_endpoint = "/imaging/v2/network/staging/policies/" + policyName
     del_policy_prd_endpoint = "/imaging/v2/network/production/policies/" + policyName
 
@@ -155,81 +252,1022 @@ def deletePolicy(lunaToken, policyName, network, account_key=''):
 
     print("deleting " + policyName + " on " + network + " networks")
     if network == "both":
-        policyResultStg = HttpCaller.deleteResult(del_policy_stg_endpoint)
-        policyResultPrd = HttpCaller.deleteResult(del_policy_prd_endpoint)
+        policyResultStg = HttpCaller.deleteResult(del_policy_stg_endpoint, headers)
+        policyResultPrd = HttpCaller.deleteResult(del_policy_prd_endpoint, headers)
         policyResult = {"staging": policyResultStg, "production":
                         policyResultPrd}
     if network == "staging":
-        policyResultStg = HttpCaller.deleteResult(del_policy_stg_endpoint)
+        policyResultStg = HttpCaller.deleteResult(del_policy_stg_endpoint, headers)
         policyResult = {"staging": policyResultStg}
     if network == "production":
-        policyResultPrd = HttpCaller.deleteResult(del_policy_prd_endpoint)
+        policyResultPrd = HttpCaller.deleteResult(del_policy_prd_endpoint, headers)
         policyResult = {"production": policyResultPrd}
 
     return(policyResult)
 
 
-def formatOutput(policyList, output_type):
-    """ Formats the output on a given format (json or text) """
+def policyEndpoint(network, policyName='', account_key=''):
+    """ Builds the endpoint of the policy list (or of a given policy) """
+    endpoint = "/imaging/v2/network/" + network + "/policies"
+    if policyName != '':
+        endpoint = endpoint + "/" + policyName
+    if account_key != '':
+        endpoint = endpoint + '?accountSwitchKey=' + account_key
+    return(endpoint)
+
+
+def historyEndpoint(network, policyName, account_key=''):
+    """ Builds the endpoint of the version history of a policy """
+    endpoint = "/imaging/v2/network/" + network + "/policies/history/" + policyName
+    if account_key != '':
+        endpoint = endpoint + '?accountSwitchKey=' + account_key
+    return(endpoint)
+
+
+def sizeConnectionPool(workers):
+    """ Makes room in the session's connection pool for every worker, so
+    concurrent calls reuse their connections instead of discarding them """
+    if workers > transport["pool_maxsize"]:
+        mountTransport(workers)
+
+
+def callSafely(function, job):
+    """ Runs a single job, returning (result, error) instead of raising.
+    httpErrors exits on fatal API errors, so SystemExit is captured too """
+    try:
+        return(function(job), None)
+    except (SystemExit, Exception) as error:
+        return(None, str(error).strip() or error.__class__.__name__)
+
+
+def runParallel(function, jobs, workers):
+    """ Runs function(job) for every job on a bounded pool of threads and
+    returns a list of (job, result, error) tuples in submission order """
+    jobs = list(jobs)
+    sizeConnectionPool(workers)
+    if profiler is not None:
+        function = profiler.profiled(function)
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="worker") as executor:
+        futures = [executor.submit(callSafely, function, job) for job in jobs]
+        outcomes = [future.result() for future in futures]
+    return([(job, result, error) for job, (result, error) in zip(jobs, outcomes)])
+
+
+def runCalls(calls, workers, use_async=False, cached=True):
+    """ Runs (method, endpoint, body, headers) API calls concurrently,
+    either on a pool of threads or, with use_async, on an asyncio event
+    loop. Each call carries its own headers (see tenantHeaders), so calls
+    for several policy sets can share a run. Returns a list of (call,
+    result, error) tuples in submission order """
+    if use_async:
+        try:
+            from async_http_calls import AsyncEdgeGridHttpCaller
+        except ImportError:
+            sys.exit("ERROR: --async requires the aiohttp package (pip install aiohttp)")
+        asyncCaller = AsyncEdgeGridHttpCaller(session, debug, verbose, baseurl,
+                                              responseCache, workers, max_retries,
+                                              HttpCaller.timeout, transport["keep_alive"])
+        asyncCaller.timings = HttpCaller.timings
+        return(asyncCaller.runAll(calls, cached))
+
+    def runCall(call):
+        method, endpoint, body, headers = call
+        if method == "GET":
+            return(HttpCaller.getResult(endpoint, cached=cached, headers=headers))
+        if method == "DOWNLOAD":
+            # Saves the response body into the file named by body
+            try:
+                with open(body + ".tmp", "wb") as output:
+                    HttpCaller.getRaw(endpoint, output, headers=headers)
+                os.replace(body + ".tmp", body)
+            except BaseException:
+                # No partial file is left behind, e.g. on an error response
+                if os.path.exists(body + ".tmp"):
+                    os.remove(body + ".tmp")
+                raise
+            return(body)
+        if method == "PUT":
+            return(HttpCaller.putResult(endpoint, body, headers=headers))
+        if method == "POST":
+            return(HttpCaller.postResult(endpoint, body, headers=headers))
+        return(HttpCaller.deleteResult(endpoint, headers))
+
+    from http_calls import AdaptiveLimiter
+
+    # The pool is sized for the requested workers, the limiter lowers the
+    # calls actually in flight while the API is throttling
+    HttpCaller.limiter = AdaptiveLimiter(workers)
+    try:
+        return(runParallel(runCall, calls, workers))
+    finally:
+        HttpCaller.limiter = None
+
+
+def exportPolicies(lunaToken, network, output_dir, workers, account_key='',
+                   use_async=False, pretty=False):
+    """ Saves every policy of a given network as its own JSON file. Files
+    hold the API responses as is, unless pretty printing is requested """
+    headers = tenantHeaders(lunaToken)
+    policyList = HttpCaller.getResult(policyEndpoint(network, '', account_key),
+                                      headers=headers)
+    policyNames = [my_item["id"] for my_item in policyList["items"]]
+
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    print("Exporting " + str(len(policyNames)) + " policies from " + network +
+          " using " + str(workers) + " workers")
+
+    fileNames = [os.path.join(output_dir, policyName + ".json") for policyName in policyNames]
+    if pretty:
+        calls = [("GET", policyEndpoint(network, policyName, account_key), None, headers)
+                 for policyName in policyNames]
+    else:
+        calls = [("DOWNLOAD", policyEndpoint(network, policyName, account_key), file_name,
+                  headers) for policyName, file_name in zip(policyNames, fileNames)]
+
+    exportResult = []
+    for policyName, file_name, (_, policyDetail, error) in zip(
+            policyNames, fileNames, runCalls(calls, workers, use_async)):
+        if error is not None:
+            file_name = None
+        elif pretty:
+            with open(file_name, "w") as output_file:
+                output_file.write(json_codec.dumps(policyDetail, indent=2))
+        exportResult.append((policyName, file_name, error))
+    return(exportResult)
+
+
+def planSync(lunaToken, localPolicies, networks, workers, account_key='',
+             use_async=False):
+    """ Compares local policies against the remote ones on each network.
+    Returns a list of (network, policy name, action) where action is one
+    of create, update or unchanged """
+    headers = tenantHeaders(lunaToken)
+    listCalls = [("GET", policyEndpoint(network, '', account_key), None, headers)
+                 for network in networks]
+    remoteNames = {}
+    for network, (_, policyList, error) in zip(networks, runCalls(listCalls, workers,
+                                                                  use_async, False)):
+        if error is not None:
+            sys.exit(error)
+        remoteNames[network] = set(my_item["id"] for my_item in policyList["items"])
+
+    fetchJobs = [(network, policyName) for network in networks
+                 for policyName in localPolicies
+                 if policyName in remoteNames[network]]
+    fetchCalls = [("GET", policyEndpoint(network, policyName, account_key), None, headers)
+                  for network, policyName in fetchJobs]
+    remoteHashes = {}
+    for job, (_, policyDetail, error) in zip(fetchJobs, runCalls(fetchCalls, workers,
+                                                                 use_async, False)):
+        if error is not None:
+            sys.exit(error)
+        remoteHashes[job] = policyHash(policyDetail)
+
+    plan = []
+    for network in networks:
+        for policyName, (_, policy, _) in localPolicies.items():
+            if (network, policyName) not in remoteHashes:
+                plan.append((network, policyName, "create"))
+            elif remoteHashes[(network, policyName)] != policyHash(policy):
+                plan.append((network, policyName, "update"))
+            else:
+                plan.append((network, policyName, "unchanged"))
+    return(plan)
+
+
+def defaultPolicyType():
+    """ Policies without a video flag are validated as video policies by
+    video-manager, as image policies otherwise """
+    return("video" if "video-manager" in os.path.basename(sys.argv[0]) else "image")
+
+
+def invalidPolicies(localPolicies, validate=True):
+    """ (policy name, error) of the policies read by readPolicyDir that
+    are not valid JSON or, with validate, do not match the policy schema """
+    from policy_schema import validatePolicy
+    invalid = []
+    for policyName, (_, policy, error) in localPolicies.items():
+        if error is None and validate:
+            errors = validatePolicy(policy, defaultPolicyType())
+            if errors:
+                error = "Invalid policy: " + "; ".join((path or "(policy)") + ": " + message
+                                                       for path, message in errors)
+        if error is not None:
+            invalid.append((policyName, error))
+    return(invalid)
+
+
+def syncPolicies(lunaToken, directory, network, workers, plan_only=False,
+                 account_key='', use_async=False, validate=True):
+    """ Deploys the policy files of a directory, only PUTting the ones whose
+    content differs from what the network already serves. Files that are
+    not valid policies are skipped before any API call """
+    localPolicies = readPolicyDir(directory)
+    invalid = invalidPolicies(localPolicies, validate)
+    for policyName, error in invalid:
+        print("SKIPPED: " + policyName + " (" + error + ")")
+        del localPolicies[policyName]
+
+    networks = ["staging", "production"] if network == "both" else [network]
+    plan = planSync(lunaToken, localPolicies, networks, workers, account_key,
+                    use_async)
+
+    for network in networks:
+        changes = [(policyName, action) for planNetwork, policyName, action in plan
+                   if planNetwork == network and action != "unchanged"]
+        unchanged = len(localPolicies) - len(changes)
+        print(network.upper() + ": " + str(len(changes)) + " to deploy, " +
+              str(unchanged) + " unchanged")
+        for policyName, action in changes:
+            print("  " + action.ljust(8) + " " + policyName)
+
+    jobs = [(network, policyName) for network, policyName, action in plan
+            if action != "unchanged"]
+    if plan_only:
+        return([], invalid)
+
+    headers = tenantHeaders(lunaToken)
+    calls = [("PUT", policyEndpoint(network, policyName, account_key),
+              localPolicies[policyName][0], headers) for network, policyName in jobs]
+    return([(job, result, error) for job, (_, result, error)
+            in zip(jobs, runCalls(calls, workers, use_async))], invalid)
+
+
+def readTenants(file_name):
+    """ Reads a tenants file: a JSON list of {"name", "policy_sets" (or
+    "policy_set"), "account_key"} objects. Returns one (tenant name, policy
+    set, account key) tuple per policy set """
+    try:
+        with open(file_name) as tenants_file:
+            tenantList = json.load(tenants_file)
+    except (IOError, OSError, ValueError) as error:
+        sys.exit("ERROR: Cannot read the tenants file %s: %s" % (file_name, error))
+    if not isinstance(tenantList, list):
+        sys.exit("ERROR: The tenants file %s must hold a JSON list" % file_name)
+
+    tenants = []
+    for index, tenant in enumerate(tenantList):
+        if not isinstance(tenant, dict):
+            sys.exit("ERROR: Tenant #%d of %s is not a JSON object" % (index + 1, file_name))
+        policySets = tenant.get("policy_sets", tenant.get("policy_set"))
+        if isinstance(policySets, str):
+            policySets = [policySets]
+        if not policySets or not all(isinstance(policySet, str) for policySet in policySets):
+            sys.exit("ERROR: Tenant #%d of %s has no policy_sets" % (index + 1, file_name))
+        # A null account_key is no account switch key
+        account_key = tenant.get("account_key") or ''
+        if not isinstance(account_key, str):
+            sys.exit("ERROR: Tenant #%d of %s has an invalid account_key" % (index + 1, file_name))
+        name = tenant.get("name", "tenant%d" % (index + 1))
+        for policySet in policySets:
+            tenants.append((name, policySet, account_key))
+    return(tenants)
+
+
+def inventoryPolicies(tenants, networks, workers, use_async=False):
+    """ Lists the policies of every (tenant name, policy set, account key)
+    on every network concurrently. Returns the merged policy items, tagged
+    with their tenant, policy set and network, and the failed listings as
+    (tenant name, policy set, network, error) tuples """
+    jobs = [(tenant, network) for tenant in tenants for network in networks]
+    calls = [("GET", policyEndpoint(network, '', account_key), None,
+              tenantHeaders(policySet))
+             for (_, policySet, account_key), network in jobs]
+
+    items = []
+    failures = []
+    for ((name, policySet, account_key), network), (_, policyList, error) in zip(
+            jobs, runCalls(calls, workers, use_async)):
+        if error is not None:
+            failures.append((name, policySet, network, error))
+            continue
+        for my_item in policyList["items"]:
+            items.append(dict(my_item, tenant=name, policy_set=policySet,
+                              account_key=account_key, network=network))
+    return(items, failures)
+
+
+def indexPolicies(lunaToken, networks, workers, index, account_key='', use_async=False):
+    """ Refreshes the local index of a policy set: only the policies whose
+    version or creation date changed since the last run are downloaded.
+    Returns (network, fetched, unchanged, removed, failures) per network,
+    failures being (policy name, error) tuples """
+    headers = tenantHeaders(lunaToken)
+    listCalls = [("GET", policyEndpoint(network, '', account_key), None, headers)
+                 for network in networks]
+    fetchJobs = []
+    stats = {}
+    for network, (_, policyList, error) in zip(networks, runCalls(listCalls, workers,
+                                                                  use_async, False)):
+        if error is not None:
+            sys.exit(error)
+        stale, removed = index.staleNames(account_key, lunaToken, network,
+                                          policyList["items"])
+        stats[network] = (len(policyList["items"]) - len(stale), removed)
+        fetchJobs.extend((network, policyName) for policyName in stale)
+
+    fetchCalls = [("GET", policyEndpoint(network, policyName, account_key), None, headers)
+                  for network, policyName in fetchJobs]
+    fetched = dict((network, {}) for network in networks)
+    failures = dict((network, []) for network in networks)
+    for (network, policyName), (_, policyDetail, error) in zip(
+            fetchJobs, runCalls(fetchCalls, workers, use_async, False)):
+        if error is not None:
+            failures[network].append((policyName, error))
+        else:
+            fetched[network][policyName] = policyDetail
+
+    indexResult = []
+    for network in networks:
+        unchanged, removed = stats[network]
+        index.update(account_key, lunaToken, network, fetched[network], removed)
+        indexResult.append((network, len(fetched[network]), unchanged, len(removed),
+                            failures[network]))
+    return(indexResult)
+
+
+def queryPolicies(index, filters, policy_set=None, networks=None, name_pattern=None):
+    """ Yields the indexed policies matching every filter (see
+    policy_index.parseFilter), tagged with their policy set and network """
+    from policy_index import matchesFilter
+    for network in networks or [None]:
+        for policySet, policyNetwork, policy in index.policies(policy_set, network,
+                                                               name_pattern):
+            if all(matchesFilter(policy, policyFilter) for policyFilter in filters):
+                yield dict(policy, policy_set=policySet, network=policyNetwork)
+
+
+def fetchPolicies(lunaToken, networks, workers, account_key='', use_async=False,
+                  name_pattern=None):
+    """ Downloads the policies of several networks at once: the lists of
+    every network, then every policy, run concurrently. Returns a dict of
+    network -> {policy name: policy JSON}. Exits if any call fails """
+    headers = tenantHeaders(lunaToken)
+    listCalls = [("GET", policyEndpoint(network, '', account_key), None, headers)
+                 for network in networks]
+    fetchJobs = []
+    for network, (_, policyList, error) in zip(networks, runCalls(listCalls, workers,
+                                                                  use_async, False)):
+        if error is not None:
+            sys.exit(error)
+        fetchJobs.extend((network, my_item["id"]) for my_item in policyList["items"]
+                         if name_pattern is None or fnmatch(my_item["id"], name_pattern))
+
+    fetchCalls = [("GET", policyEndpoint(network, policyName, account_key), None, headers)
+                  for network, policyName in fetchJobs]
+    policies = dict((network, {}) for network in networks)
+    for (network, policyName), (_, policyDetail, error) in zip(
+            fetchJobs, runCalls(fetchCalls, workers, use_async, False)):
+        if error is not None:
+            sys.exit("ERROR: Cannot retrieve " + policyName + " from " + network + "\n" + error)
+        policies[network][policyName] = policyDetail
+    return(policies)
+
+
+def saveSnapshot(lunaToken, network, file_name, workers, account_key='', use_async=False):
+    """ Saves every policy of a network into a single snapshot file """
+    policies = fetchPolicies(lunaToken, [network], workers, account_key, use_async)[network]
+    snapshot = {"policy_set": lunaToken, "network": network,
+                "created": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                "policies": policies}
+    with open(file_name + ".tmp", "w") as snapshot_file:
+        snapshot_file.write(json_codec.dumps(snapshot, indent=2))
+    os.replace(file_name + ".tmp", file_name)
+    return(len(policies))
+
+
+def loadPolicySources(lunaToken, sources, workers, account_key='', use_async=False,
+                      name_pattern=None):
+    """ Loads the policies of each source: staging, production, a directory
+    of policy files or a snapshot file (see saveSnapshot). Both networks
+    are downloaded concurrently. Returns one {policy name: policy JSON}
+    dict per source """
+    networks = [source for source in sources if source in ["staging", "production"]]
+    remote = {}
+    if networks and not lunaToken:
+        sys.exit("ERROR: --policy-set is required to compare the policies of a network")
+    if networks:
+        remote = fetchPolicies(lunaToken, sorted(set(networks)), workers, account_key,
+                               use_async, name_pattern)
+
+    loaded = []
+    for source in sources:
+        if source in remote:
+            policies = remote[source]
+        elif os.path.isdir(source):
+            policies = {}
+            for policyName, (_, policy, error) in readPolicyDir(source).items():
+                if error is not None:
+                    print("SKIPPED: " + policyName + " (" + error + ")", file=sys.stderr)
+                else:
+                    policies[policyName] = policy
+        elif os.path.isfile(source):
+            try:
+                with open(source) as snapshot_file:
+                    policies = json_codec.loads(snapshot_file.read())["policies"]
+            except (ValueError, KeyError, TypeError) as error:
+                sys.exit("ERROR: %s is not a policy snapshot: %s" % (source, error))
+        else:
+            sys.exit("ERROR: %s is not a network, a directory or a snapshot file" % source)
+        if name_pattern is not None:
+            policies = dict((policyName, policy) for policyName, policy in policies.items()
+                            if fnmatch(policyName, name_pattern))
+        loaded.append(policies)
+    return(loaded)
+
+
+def diffPolicySets(left, right):
+    """ Compares two {policy name: policy JSON} dicts. Returns a list of
+    (policy name, change, path, old value, new value): change is added or
+    removed for policies only on one side (with an empty path), and
+    added, removed or changed for the paths that differ otherwise """
+    differences = []
+    for policyName in sorted(set(left) | set(right)):
+        if policyName not in right:
+            differences.append((policyName, "removed", "", left[policyName], None))
+        elif policyName not in left:
+            differences.append((policyName, "added", "", None, right[policyName]))
+        else:
+            differences.extend((policyName,) + difference for difference
+                               in diffPolicies(left[policyName], right[policyName]))
+    return(differences)
+
+
+def promotePolicies(lunaToken, patterns, workers, promote_all=False, plan_only=False,
+                    account_key='', use_async=False):
+    """ Copies staging policies to production, without going through local
+    files. Policies are selected by name or glob pattern (or all of them)
+    and the ones whose production content is already identical are
+    skipped. Returns one dict per policy with its id, action (create,
+    update, unchanged or missing), result and details """
+    headers = tenantHeaders(lunaToken)
+    networks = ["staging", "production"]
+    listCalls = [("GET", policyEndpoint(network, '', account_key), None, headers)
+                 for network in networks]
+    names = {}
+    for network, (_, policyList, error) in zip(networks, runCalls(listCalls, workers,
+                                                                  use_async, False)):
+        if error is not None:
+            sys.exit(error)
+        names[network] = [my_item["id"] for my_item in policyList["items"]]
+
+    selected = [policyName for policyName in names["staging"]
+                if promote_all or any(fnmatch(policyName, pattern) for pattern in patterns)]
+    promoteResult = [{"id": pattern, "action": "missing", "result": "failed",
+                      "details": "No staging policy matches " + pattern}
+                     for pattern in patterns
+                     if not any(fnmatch(policyName, pattern) for policyName in names["staging"])]
+
+    fetchJobs = [("staging", policyName) for policyName in selected] + \
+        [("production", policyName) for policyName in selected
+         if policyName in names["production"]]
+    fetchCalls = [("GET", policyEndpoint(network, policyName, account_key), None, headers)
+                  for network, policyName in fetchJobs]
+    fetched = {}
+    for job, (_, policyDetail, error) in zip(fetchJobs, runCalls(fetchCalls, workers,
+                                                                 use_async, False)):
+        fetched[job] = (policyDetail, error)
+
+    jobs = []
+    for policyName in selected:
+        staged, error = fetched[("staging", policyName)]
+        action = "create"
+        # Listed in production: an update, even if a fetch failed
+        if ("production", policyName) in fetched:
+            production, production_error = fetched[("production", policyName)]
+            error = error or production_error
+            action = "unchanged" if error is None and \
+                policyHash(production) == policyHash(staged) else "update"
+        if error is not None:
+            promoteResult.append({"id": policyName, "action": action, "result": "failed",
+                                  "details": error})
+        elif action == "unchanged" or plan_only:
+            promoteResult.append({"id": policyName, "action": action,
+                                  "result": "skipped" if action == "unchanged" else "planned",
+                                  "details": ""})
+        else:
+            jobs.append((policyName, action, json_codec.dumps(normalizePolicy(staged))))
+
+    calls = [("PUT", policyEndpoint("production", policyName, account_key), policyJSON,
+              headers) for policyName, _, policyJSON in jobs]
+    for (policyName, action, _), (_, result, error) in zip(jobs, runCalls(calls, workers,
+                                                                        use_async)):
+        if error is not None:
+            promoteResult.append({"id": policyName, "action": action, "result": "failed",
+                                  "details": error})
+        else:
+            promoteResult.append({"id": policyName, "action": action, "result": "promoted",
+                                  "details": result.get("description", "")})
+    # Unmatched patterns first, then the policies in staging order
+    order = dict((policyName, index) for index, policyName in enumerate(selected))
+    promoteResult.sort(key=lambda my_item: order.get(my_item["id"], -1))
+    return(promoteResult)
+
+
+def syncHistory(lunaToken, networks, workers, store, account_key='', use_async=False,
+                name_pattern=None):
+    """ Brings the local version store (see history_store) up to date: the
+    history and current content of a policy are only downloaded when its
+    listed version is newer than the newest stored one. Returns
+    (network, policies listed, policies updated, failures) per network,
+    failures being (policy name, error) tuples """
+    headers = tenantHeaders(lunaToken)
+    listCalls = [("GET", policyEndpoint(network, '', account_key), None, headers)
+                 for network in networks]
+    jobs = []
+    listed = {}
+    for network, (_, policyList, error) in zip(networks, runCalls(listCalls, workers,
+                                                                  use_async, False)):
+        if error is not None:
+            sys.exit(error)
+        items = [my_item for my_item in policyList["items"]
+                 if name_pattern is None or fnmatch(my_item["id"], name_pattern)]
+        listed[network] = len(items)
+        jobs.extend((network, my_item["id"]) for my_item in items
+                    if (my_item.get("version") or 0) >
+                    store.latestVersion(account_key, lunaToken, network, my_item["id"]))
+
+    calls = []
+    for network, policyName in jobs:
+        calls.append(("GET", historyEndpoint(network, policyName, account_key), None, headers))
+        calls.append(("GET", policyEndpoint(network, policyName, account_key), None, headers))
+    outcomes = runCalls(calls, workers, use_async, False)
+
+    updated = dict((network, 0) for network in networks)
+    failures = dict((network, []) for network in networks)
+    for index, (network, policyName) in enumerate(jobs):
+        (_, history, history_error), (_, policy, error) = outcomes[2 * index:2 * index + 2]
+        if history_error is not None or error is not None:
+            failures[network].append((policyName, history_error or error))
+            continue
+        versions = store.readLog(account_key, lunaToken, network, policyName)
+        for entry in history.get("items", []):
+            if entry.get("version") is not None:
+                versions.setdefault(str(entry["version"]), {}).update(
+                    (key, value) for key, value in entry.items()
+                    if key in ["dateCreated", "user", "action"])
+        versions.setdefault(str(policy["version"]), {}).update(
+            hash=store.putObject(policy), dateCreated=policy.get("dateCreated"),
+            user=policy.get("user"))
+        store.writeLog(account_key, lunaToken, network, policyName, versions)
+        updated[network] += 1
+
+    return([(network, listed[network], updated[network], failures[network])
+            for network in networks])
+
+
+def rollbackPolicy(lunaToken, policyName, network, version, store, account_key=''):
+    """ Deploys a stored version of a policy again (as a new version),
+    reading its content from the local version store only """
+    versions = store.readLog(account_key, lunaToken, network, policyName)
+    entry = versions.get(str(version), {})
+    if not entry.get("hash"):
+        stored = sorted(int(stored_version) for stored_version, stored_entry
+                        in versions.items() if stored_entry.get("hash"))
+        sys.exit("ERROR: Version " + str(version) + " of " + policyName + " on " + network +
+                 " is not in the local store (stored versions: " +
+                 (", ".join(str(stored_version) for stored_version in stored) or "none") +
+                 "). Run history-sync to update it")
+
+    print("Rolling back " + policyName + " on " + network + " to version " + str(version))
+    return(HttpCaller.putResult(policyEndpoint(network, policyName, account_key),
+                                json_codec.dumps(store.getObject(entry["hash"])),
+                                headers=tenantHeaders(lunaToken)))
+
+
+def watchPolicies(lunaToken, directory, network, workers, account_key='', debounce=None,
+                  polling=False, validate=True):
+    """ Keeps the session warm and deploys the policy files of a directory
+    as they are saved. Files are pushed only if their content changed since
+    they were last deployed (or since the watch started). Changes made
+    while a file is being deployed are merged into a single follow-up push,
+    so a slow API never builds a queue of stale versions """
+    import threading
+    from watcher import DirectoryWatcher, DEFAULT_DEBOUNCE
+    from http_calls import AdaptiveLimiter
+
+    networks = ["staging", "production"] if network == "both" else [network]
+    headers = tenantHeaders(lunaToken)
+    pushedHashes = dict((policyName, policyHash(policy)) for policyName, (_, policy, error)
+                        in readPolicyDir(directory).items() if error is None)
+    lock = threading.Lock()
+    inFlight = set()
+    dirty = set()
+
+    def push(policyName):
+        started = time.time()
+        file_name = os.path.join(directory, policyName + ".json")
+        try:
+            with open(file_name) as policy_file:
+                policyJSON = policy_file.read()
+        except (IOError, OSError):
+            return
+        localPolicy = {policyName: (policyJSON,) + parsePolicyJSON(policyJSON)}
+        for _, error in invalidPolicies(localPolicy, validate):
+            print("INVALID: " + policyName + " (" + error + ")")
+            return
+        contentHash = policyHash(localPolicy[policyName][1])
+        if pushedHashes.get(policyName) == contentHash:
+            return
+        for network in networks:
+            HttpCaller.putResult(policyEndpoint(network, policyName, account_key), policyJSON,
+                                 headers=headers)
+        pushedHashes[policyName] = contentHash
+        print("PUSHED: " + policyName + " to " + " and ".join(networks) + " in " +
+              str(int((time.time() - started) * 1000)) + " ms")
+
+    def finished(policyName, future):
+        result, error = future.result()
+        if error is not None:
+            print("FAILED: " + policyName + "\n" + error)
+        with lock:
+            inFlight.discard(policyName)
+            again = policyName in dirty
+            dirty.discard(policyName)
+        if again:
+            schedule(policyName)
+
+    def schedule(policyName):
+        with lock:
+            if policyName in inFlight:
+                # Picked up with the latest content once the current push ends
+                dirty.add(policyName)
+                return
+            inFlight.add(policyName)
+        future = executor.submit(callSafely, push, policyName)
+        future.add_done_callback(lambda future: finished(policyName, future))
+
+    watcher = DirectoryWatcher(directory, DEFAULT_DEBOUNCE if debounce is None else debounce,
+                               polling=polling)
+    sizeConnectionPool(workers)
+    HttpCaller.limiter = AdaptiveLimiter(workers)
+    if profiler is not None:
+        push = profiler.profiled(push)
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="worker")
+    print("Watching " + directory + " (" + watcher.mode + "), deploying changed policies to " +
+          " and ".join(networks) + ". Press Ctrl-C to stop", file=sys.stderr)
+    try:
+        while True:
+            for file_name in sorted(watcher.wait()):
+                schedule(file_name[:-5])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        executor.shutdown(wait=True)
+        HttpCaller.limiter = None
+
+
+def listingPages(lunaToken, resource, network, account_key='', limit=100, cursor=None,
+                 policy_name=None):
+    """ Lazily yields the pages of the images (resource "images") or image
+    collections ("imagecollections") of a network, following the
+    continuation tokens of the API (see pagination.pages) """
+    from pagination import pages
+    endpoint = "/imaging/v2/network/" + network + "/" + resource
+    headers = tenantHeaders(lunaToken)
+
+    def fetch(cursor):
+        parameters = {"limit": limit}
+        if cursor is not None:
+            parameters["continuationToken"] = cursor
+        if policy_name is not None:
+            parameters["policyId"] = policy_name
+        if account_key != '':
+            parameters["accountSwitchKey"] = account_key
+        # Pages are neither served from nor stored into the cache, their
+        # cursors expire
+        page = HttpCaller.getResult(endpoint, parameters, headers=headers, store=False)
+        if not isinstance(page, dict) or not isinstance(page.get("items"), list):
+            sys.exit("ERROR: Unexpected response listing " + endpoint + ": " +
+                     json.dumps(page)[:200])
+        return page["items"], page.get("continuationToken")
+
+    return pages(profiler.profiled(fetch) if profiler is not None else fetch, cursor)
+
+
+def streamListing(lunaToken, resource, network, output_file=None, resume=False, cursor=None,
+                  fields=None, limit=100, policy_name=None, account_key=''):
+    """ Writes the images or image collections of a network as newline
+    delimited JSON, one page at a time, to stdout or to a file. Listing to
+    a file saves its progress into <file>.cursor after every page, which
+    resume continues from. Returns the number of items written """
+    from pagination import CursorFile
+    cursorFile = None
+    written = 0
+    if output_file is None:
+        stream = sys.stdout
+    else:
+        cursorFile = CursorFile(output_file + ".cursor")
+        saved = cursorFile.read() if resume else None
+        if resume and saved is None:
+            sys.exit("ERROR: No interrupted listing to resume into " + output_file)
+        if saved is not None:
+            # Drops the items of a page that was being written
+            os.truncate(output_file, saved["offset"])
+            cursor, written = saved["cursor"], saved["items"]
+            stream = open(output_file, "a")
+        else:
+            stream = open(output_file, "w")
+            cursorFile.save(cursor, 0, 0)
+
+    writer = outputWriter("ndjson", stream, fields)
+    current = cursor
+    try:
+        for current, items, next_cursor in listingPages(lunaToken, resource, network,
+                                                        account_key, limit, cursor,
+                                                        policy_name):
+            for my_item in items:
+                writer.writeItem(my_item)
+            written += len(items)
+            stream.flush()
+            if cursorFile is not None:
+                cursorFile.save(next_cursor, os.fstat(stream.fileno()).st_size, written)
+            current = next_cursor
+    except KeyboardInterrupt:
+        if cursorFile is not None:
+            sys.exit("Interrupted after " + str(written) + " items, continue with --resume")
+        if current is not None:
+            sys.exit("Interrupted, continue with --cursor " + current)
+        sys.exit(1)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    if cursorFile is not None:
+        cursorFile.remove()
+    return written
+
+
+def runBatchCommand(request):
+    """ Runs one batch command (a dict with the command name, its network,
+    policy set and account key) and returns its JSON result """
+    if not isinstance(request, dict):
+        raise ValueError("Batch commands must be JSON objects")
+    command = request.get("command")
+    network = request.get("network", "production")
+    account_key = request.get("account_key", config.account_key)
+    policySet = request.get("policy_set", config.policy_set)
+    if not policySet:
+        raise ValueError("Missing policy_set")
+    headers = tenantHeaders(policySet)
+
+    if network == "both":
+        networks = ["staging", "production"]
+    elif network in ["staging", "production"]:
+        networks = [network]
+    else:
+        raise ValueError("Unknown network: %s" % network)
+
+    if command in ["get-policy", "set-policy", "delete-policy"] and not request.get("name"):
+        raise ValueError("Missing policy name")
+
+    results = {}
+    for network in networks:
+        if command == "list-policies":
+            results[network] = HttpCaller.getResult(policyEndpoint(network, '', account_key),
+                                                    headers=headers)
+        elif command == "get-policy":
+            results[network] = HttpCaller.getResult(
+                policyEndpoint(network, request["name"], account_key), headers=headers)
+        elif command == "set-policy":
+            policyJSON = request.get("policy")
+            if not isinstance(policyJSON, str):
+                policyJSON = json.dumps(policyJSON)
+            if not config.no_validate:
+                from policy_schema import validatePolicyJSON
+                errors = validatePolicyJSON(policyJSON, defaultPolicyType())
+                if errors:
+                    raise ValueError("Invalid policy: " + "; ".join(errors))
+            results[network] = HttpCaller.putResult(
+                policyEndpoint(network, request["name"], account_key), policyJSON,
+                headers=headers)
+        elif command == "delete-policy":
+            results[network] = HttpCaller.deleteResult(
+                policyEndpoint(network, request["name"], account_key), headers)
+        else:
+            raise ValueError("Unknown command: %s" % command)
+
+    if len(networks) == 1:
+        return(results[networks[0]])
+    return(results)
+
+
+def runBatch(input_lines, output):
+    """ Runs newline delimited JSON commands over the warm session, writing
+    one JSON result line per command. Returns the number of failures """
+    failures = 0
+    for line in input_lines:
+        if not line.strip():
+            continue
+        response = {}
+        try:
+            request = json.loads(line)
+            if isinstance(request, dict):
+                for field in ["id", "command", "name", "network"]:
+                    if field in request:
+                        response[field] = request[field]
+            response["result"] = runBatchCommand(request)
+            response["status"] = "ok"
+        except (SystemExit, Exception) as error:
+            failures += 1
+            response["status"] = "error"
+            response["error"] = str(error).strip() or error.__class__.__name__
+        output.write(json.dumps(response) + "\n")
+        output.flush()
+    return(failures)
+
+
+def serveBatch(socket_path):
+    """ Keeps the process resident, running the batch commands sent to a
+    local UNIX socket. Each connection streams NDJSON commands and reads
+    back one NDJSON result line per command """
+    import stat
+    import socketserver
+
+    class BatchHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            lines = (line.decode('utf-8') for line in self.rfile)
+            runBatch(lines, BatchWriter(self.wfile))
+
+    class BatchWriter(object):
+        def __init__(self, wfile):
+            self.wfile = wfile
+
+        def write(self, text):
+            self.wfile.write(text.encode('utf-8'))
+
+        def flush(self):
+            self.wfile.flush()
+
+    if os.path.exists(socket_path):
+        # Only a socket left over by a previous run is replaced
+        if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            sys.exit("ERROR: " + socket_path + " exists and is not a socket")
+        os.remove(socket_path)
+    server = socketserver.UnixStreamServer(socket_path, BatchHandler)
+    print("Listening for batch commands on " + socket_path, file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+
+
+def printDiff(differences, source, target):
+    """ Prints the differences of diffPolicySets, grouped by policy """
+    currentPolicy = None
+    for policyName, change, path, old, new in differences:
+        if not path:
+            print(("+ " if change == "added" else "- ") + policyName + " (only in " +
+                  (target if change == "added" else source) + ")")
+            continue
+        if policyName != currentPolicy:
+            print("~ " + policyName)
+            currentPolicy = policyName
+        if change == "changed":
+            print("    changed  " + path + ": " + json.dumps(old) + " -> " + json.dumps(new))
+        elif change == "added":
+            print("    added    " + path + ": " + json.dumps(new))
+        else:
+            print("    removed  " + path + ": " + json.dumps(old))
+
+
+def formatOutput(policyList, output_type, fields=None, network=None, writer=None):
+    """ Formats the output on a given format (json, text, csv or ndjson).
+    Text, csv and ndjson rows are written as each item is formatted; pass
+    the same writer to stream several lists as a single output """
     if output_type == "json":
         # Let's print the JSON
+        if fields:
+            policyList = dict(policyList, items=[
+                dict((field, fieldValue(my_item, field)) for field in fields)
+                for my_item in policyList["items"]])
         print(json.dumps(policyList, indent=2))
+        return
 
-    if output_type == "text":
-        # Iterate over the dictionary and print the selected information
-        ParentTable = tt.Texttable()
-        ParentTable.set_cols_width([30,25,25])
-        ParentTable.set_cols_align(['c','c','c'])
-        ParentTable.set_cols_valign(['m','m','m'])
-        Parentheader = ['Policy name','Date Created','User']
-        ParentTable.header(Parentheader)
-        for my_item in policyList["items"]:
-            Parentrow = [ my_item["id"], my_item["dateCreated"], my_item["user"]]
-            ParentTable.add_row(Parentrow)
-        MainParentTable = ParentTable.draw()
-        print(MainParentTable)
-        """print('%30s | %25s | %20s' % ("Policy name", "Date Created", "User"))
-        print('='*81)
-        for my_item in policyList["items"]:
-            print('%30s | %25s | %20s' % (my_item["id"],
-                                          my_item["dateCreated"],
-                                          my_item["user"]))
-        """
+    own_writer = writer is None
+    if own_writer:
+        writer = outputWriter(output_type, sys.stdout, fields)
+    for my_item in policyList["items"]:
+        if network is not None:
+            my_item = dict(my_item, network=network)
+        writer.writeItem(my_item)
+    if own_writer:
+        writer.close()
 
 
 def main():
     """ Processes the right command (list, get, set or delete) """
+    global profiler
+    # Started before parsing the command line, so that its cost is profiled too
+    if "--profile" in sys.argv[1:]:
+        from profiling import Profiler
+        profiler = Profiler()
+        profiler.start()
+    loadConfig()
+    if profiler is not None and not config.profile:
+        profiler.stop()
+        profiler = None
+    try:
+        # Local commands (queries, diffs between files) need no policy set
+        if config.policy_set is None and config.command not in ["inventory", "batch"] and \
+                (apiCommand() or config.command not in ["query-policies", "diff-policies"]):
+            config.parser.error("the following arguments are required: --policy-set/-p")
+        if apiCommand():
+            connect()
+        runCommand()
+    finally:
+        if profiler is not None:
+            reportProfile()
+
+
+def apiCommand():
+    """ Whether the loaded command calls the API. Local only commands skip
+    connect(), and so the import of requests and the session setup """
+    if config.command == "query-policies":
+        return False
+    if config.command in ["set-policy", "sync-policies"]:
+        return not config.validate_only
+    if config.command == "diff-policies":
+        return config.source in ["staging", "production"] or \
+            config.target in ["staging", "production"]
+    return True
+
+
+def reportProfile():
+    """ Stops the profiler and reports on stderr """
+    from profiling import DEFAULT_TOP
+    profiler.stop()
+    file_name = config.profile_file or os.path.basename(sys.argv[0]) + ".pstats"
+    profiler.report(file_name, sys.stderr, config.profile_top or DEFAULT_TOP,
+                    config.profile_sort)
+
+
+def runCommand():
+    """ Runs the command of the loaded config """
     if config.command == "list-policies":
         # Get the list of policies in JSON format for the given network
         if config.output_type == "text":
             print("Policy:", config.policy_set, "\tNetwork:", config.network,
               "\tOutput:", config.output_type)
 
-        if config.network == "both":
-            print("\nSTAGING:")
-            policyList = listPolicies(config.policy_set, "staging", config.account_key)
-            formatOutput(policyList, config.output_type)
-            print("\nPRODUCTION:")
-            policyList = listPolicies(config.policy_set, "production", config.account_key)
-            formatOutput(policyList, config.output_type)
-        else:
-            policyList = listPolicies(config.policy_set, config.network, config.account_key)
-            formatOutput(policyList, config.output_type)
+        try:
+            fields = config.fields.split(",") if config.fields else None
+            if config.output_type in ["csv", "ndjson"]:
+                # A single stream of records, tagged with their network
+                writer = outputWriter(config.output_type, sys.stdout, fields)
+                networks = ["staging", "production"] if config.network == "both" else [config.network]
+                for network in networks:
+                    policyList = listPolicies(config.policy_set, network, config.account_key)
+                    formatOutput(policyList, config.output_type, fields, network, writer)
+                writer.close()
+            elif config.network == "both":
+                print("\nSTAGING:")
+                policyList = listPolicies(config.policy_set, "staging", config.account_key)
+                formatOutput(policyList, config.output_type, fields)
+                print("\nPRODUCTION:")
+                policyList = listPolicies(config.policy_set, "production", config.account_key)
+                formatOutput(policyList, config.output_type, fields)
+            else:
+                policyList = listPolicies(config.policy_set, config.network, config.account_key)
+                formatOutput(policyList, config.output_type, fields)
+        except BrokenPipeError:
+            # The reader (e.g. head) is gone, stop streaming quietly
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            sys.exit(1)
 
     elif config.command == "get-policy":
 
-        policyDetail = getPolicy(config.policy_set, config.name,
-                                 config.network, config.account_key)
-
         if hasattr(config, 'output_file') and config.output_file is not None:
-            config.output_file.write(json.dumps(policyDetail, indent=2))
+            if config.pretty:
+                policyDetail = getPolicy(config.policy_set, config.name,
+                                         config.network, config.account_key)
+                config.output_file.write(json_codec.dumps(policyDetail, indent=2).encode('utf-8'))
+            else:
+                savePolicy(config.policy_set, config.name, config.network,
+                           config.output_file, config.account_key)
             config.output_file.close()
         else:
+            policyDetail = getPolicy(config.policy_set, config.name,
+                                     config.network, config.account_key)
             print(json.dumps(policyDetail, indent=2))
 
     elif config.command == "set-policy":
         policyJSON = config.input_file.read()
         config.input_file.close()
+        if not config.no_validate or config.validate_only:
+            from policy_schema import validatePolicyJSON
+            errors = validatePolicyJSON(policyJSON, defaultPolicyType())
+            if errors:
+                sys.exit("ERROR: " + config.input_file.name + " is not a valid policy:\n  " +
+                         "\n  ".join(errors))
+            if config.validate_only:
+                print("VALID: " + config.input_file.name)
+                return
         if config.network == "both":
             print("STAGING:")
             policyDetail = setPolicy(config.policy_set, config.name,
@@ -244,6 +1282,222 @@ def main():
                                      policyJSON, config.network, config.account_key)
             print(json.dumps(policyDetail, indent=2))
 
+    elif config.command == "export-policies":
+        exportResult = exportPolicies(config.policy_set, config.network,
+                                      config.directory, config.workers,
+                                      config.account_key, config.use_async,
+                                      config.pretty)
+        failures = [(policyName, error) for policyName, _, error in exportResult
+                    if error is not None]
+        for policyName, error in failures:
+            print("FAILED: " + policyName + "\n" + error)
+        print("Exported " + str(len(exportResult) - len(failures)) + " of " +
+              str(len(exportResult)) + " policies to " + config.directory +
+              " (" + str(len(failures)) + " failed)")
+        if failures:
+            sys.exit(1)
+
+    elif config.command == "sync-policies":
+        if config.validate_only:
+            localPolicies = readPolicyDir(config.directory)
+            invalid = invalidPolicies(localPolicies)
+            for policyName, error in invalid:
+                print("INVALID: " + policyName + " (" + error + ")")
+            print(str(len(localPolicies) - len(invalid)) + " of " + str(len(localPolicies)) +
+                  " policies are valid")
+            if invalid:
+                sys.exit(1)
+            return
+        syncResult, skipped = syncPolicies(config.policy_set, config.directory,
+                                  config.network, config.workers, config.plan,
+                                  config.account_key, config.use_async,
+                                  not config.no_validate)
+        failures = [(job, error) for job, _, error in syncResult
+                    if error is not None]
+        for (network, policyName), error in failures:
+            print("FAILED: " + policyName + " on " + str(network) + "\n" + error)
+        if not config.plan:
+            print("Deployed " + str(len(syncResult) - len(failures)) + " of " +
+                  str(len(syncResult)) + " changed policies (" +
+                  str(len(failures)) + " failed)")
+        if failures or skipped:
+            sys.exit(1)
+
+    elif config.command == "inventory":
+        tenants = readTenants(config.tenants_file)
+        networks = ["staging", "production"] if config.network == "both" else [config.network]
+        items, failures = inventoryPolicies(tenants, networks, config.workers,
+                                            config.use_async)
+        fields = config.fields.split(",") if config.fields else None
+        if config.output_type == "json":
+            print(json.dumps({"items": items, "errors": [
+                {"tenant": name, "policy_set": policySet, "network": network, "error": error}
+                for name, policySet, network, error in failures]}, indent=2))
+        else:
+            writer = outputWriter(config.output_type, sys.stdout,
+                                  fields or (INVENTORY_FIELDS if config.output_type != "ndjson"
+                                             else None))
+            for my_item in items:
+                writer.writeItem(my_item)
+            writer.close()
+        for name, policySet, network, error in failures:
+            print("FAILED: " + name + " (" + policySet + ") on " + network + "\n" + error,
+                  file=sys.stderr)
+        print("Listed " + str(len(items)) + " policies of " + str(len(tenants)) +
+              " policy sets (" + str(len(failures)) + " failed listings)", file=sys.stderr)
+        if failures:
+            sys.exit(1)
+
+    elif config.command == "index-policies":
+        from policy_index import PolicyIndex, DEFAULT_INDEX_FILE
+        index = PolicyIndex(config.index_file or DEFAULT_INDEX_FILE)
+        networks = ["staging", "production"] if config.network == "both" else [config.network]
+        indexResult = indexPolicies(config.policy_set, networks, config.workers, index,
+                                    config.account_key, config.use_async)
+        index.close()
+        failed = False
+        for network, fetched, unchanged, removed, failures in indexResult:
+            print(network.upper() + ": " + str(fetched) + " fetched, " + str(unchanged) +
+                  " unchanged, " + str(removed) + " removed (" + str(len(failures)) +
+                  " failed)")
+            for policyName, error in failures:
+                print("FAILED: " + policyName + "\n" + error)
+            failed = failed or bool(failures)
+        if failed:
+            sys.exit(1)
+
+    elif config.command == "query-policies":
+        from policy_index import PolicyIndex, DEFAULT_INDEX_FILE, parseFilter
+        try:
+            filters = [parseFilter(text) for text in config.filters]
+        except ValueError as error:
+            sys.exit("ERROR: %s" % error)
+        index = PolicyIndex(config.index_file or DEFAULT_INDEX_FILE)
+        networks = ["staging", "production"] if config.network == "both" else [config.network]
+        items = queryPolicies(index, filters, config.policy_set, networks, config.name)
+        fields = config.fields.split(",") if config.fields else None
+        try:
+            if config.output_type == "json":
+                formatOutput({"items": list(items)}, "json", fields)
+            else:
+                writer = outputWriter(config.output_type, sys.stdout,
+                                      fields or (INDEX_FIELDS if config.output_type != "ndjson"
+                                                 else None))
+                for my_item in items:
+                    writer.writeItem(my_item)
+                writer.close()
+        except BrokenPipeError:
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            sys.exit(1)
+        finally:
+            index.close()
+
+    elif config.command == "snapshot-policies":
+        count = saveSnapshot(config.policy_set, config.network, config.file_name,
+                             config.workers, config.account_key, config.use_async)
+        print("Saved " + str(count) + " policies from " + config.network + " to " +
+              config.file_name)
+
+    elif config.command == "diff-policies":
+        left, right = loadPolicySources(config.policy_set, [config.source, config.target],
+                                        config.workers, config.account_key,
+                                        config.use_async, config.name)
+        differences = diffPolicySets(left, right)
+        if config.output_type in ["json", "ndjson"]:
+            records = [{"policy": policyName, "change": change, "path": path,
+                        "old": old, "new": new}
+                       for policyName, change, path, old, new in differences]
+            if config.output_type == "json":
+                print(json.dumps(records, indent=2))
+            else:
+                for record in records:
+                    print(json.dumps(record, separators=(',', ':')))
+        else:
+            printDiff(differences, config.source, config.target)
+        changed = set(policyName for policyName, _, path, _, _ in differences if path)
+        print(str(len(set(left) | set(right))) + " policies compared: " +
+              str(len(set(left) & set(right)) - len(changed)) + " identical, " +
+              str(len(changed)) + " changed, " + str(len(set(left) - set(right))) +
+              " only in " + config.source + ", " + str(len(set(right) - set(left))) +
+              " only in " + config.target, file=sys.stderr)
+        if differences:
+            sys.exit(1)
+
+    elif config.command == "promote-policies":
+        if not config.names and not config.all:
+            config.parser.error("promote-policies requires policy names, patterns or --all")
+        promoteResult = promotePolicies(config.policy_set, config.names, config.workers,
+                                        config.all, config.plan, config.account_key,
+                                        config.use_async)
+        if config.output_type == "json":
+            print(json.dumps(promoteResult, indent=2))
+        else:
+            writer = outputWriter(config.output_type, sys.stdout,
+                                  PROMOTE_FIELDS if config.output_type != "ndjson" else None)
+            for my_item in promoteResult:
+                writer.writeItem(my_item)
+            writer.close()
+        failures = len([my_item for my_item in promoteResult if my_item["result"] == "failed"])
+        promoted = len([my_item for my_item in promoteResult if my_item["result"] == "promoted"])
+        skipped = len([my_item for my_item in promoteResult if my_item["result"] == "skipped"])
+        print("Promoted " + str(promoted) + " policies to production, " + str(skipped) +
+              " already identical (" + str(failures) + " failed)", file=sys.stderr)
+        if failures:
+            sys.exit(1)
+
+    elif config.command == "history-sync":
+        from history_store import HistoryStore, DEFAULT_HISTORY_DIR
+        store = HistoryStore(config.history_dir or DEFAULT_HISTORY_DIR)
+        networks = ["staging", "production"] if config.network == "both" else [config.network]
+        historyResult = syncHistory(config.policy_set, networks, config.workers, store,
+                                    config.account_key, config.use_async, config.name)
+        failed = False
+        for network, listed, updated, failures in historyResult:
+            print(network.upper() + ": " + str(updated) + " of " + str(listed) +
+                  " policies had new versions (" + str(len(failures)) + " failed)")
+            for policyName, error in failures:
+                print("FAILED: " + policyName + "\n" + error)
+            failed = failed or bool(failures)
+        if failed:
+            sys.exit(1)
+
+    elif config.command == "rollback-policy":
+        from history_store import HistoryStore, DEFAULT_HISTORY_DIR
+        store = HistoryStore(config.history_dir or DEFAULT_HISTORY_DIR)
+        policyDetail = rollbackPolicy(config.policy_set, config.name, config.network,
+                                      config.to_version, store, config.account_key)
+        print(json.dumps(policyDetail, indent=2))
+
+    elif config.command == "watch-policies":
+        if not os.path.isdir(config.directory):
+            sys.exit("ERROR: " + config.directory + " is not a directory")
+        watchPolicies(config.policy_set, config.directory, config.network, config.workers,
+                      config.account_key, config.debounce / 1000.0, config.poll,
+                      not config.no_validate)
+
+    elif config.command in ["list-images", "list-collections"]:
+        if config.resume and config.output_file is None:
+            config.parser.error("--resume requires --output-file")
+        resource = "images" if config.command == "list-images" else "imagecollections"
+        fields = config.fields.split(",") if config.fields else None
+        try:
+            written = streamListing(config.policy_set, resource, config.network,
+                                    config.output_file, config.resume, config.cursor, fields,
+                                    config.limit, getattr(config, "policy", None),
+                                    config.account_key)
+        except BrokenPipeError:
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            sys.exit(1)
+        if config.output_file is not None:
+            print("Listed " + str(written) + " " + config.command[5:] + " of " +
+                  config.network + " to " + config.output_file)
+
+    elif config.command == "batch":
+        if config.listen:
+            serveBatch(config.listen)
+        elif runBatch(config.input_file, sys.stdout):
+            sys.exit(1)
+
     elif config.command == "delete-policy":
         cmdResult = deletePolicy(config.policy_set, config.name,
                                  config.network, config.account_key)
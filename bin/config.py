@@ -23,11 +23,9 @@ import logging
 if sys.version_info[0] >= 3:
     # python3
     from configparser import ConfigParser
-    import http.client as http_client
 else:
     # python2.7
     from ConfigParser import ConfigParser
-    import httplib as http_client
 
 PACKAGE_VERSION = "0.1.8"
 
@@ -43,28 +41,143 @@ class EdgeGridConfig():
 
         list_parser = subparsers.add_parser("list-policies", help="List all Policies")
         list_parser.add_argument('--network', '-n', help="Network to list from (staging, production or both). Default is both", metavar='network', action='store', choices=['staging', 'production','both'],default='both')
-        list_parser.add_argument('--output-type', '-t', default='text', choices=['json', 'text'],metavar='json/text', help=' Output type {json, text}. Default is text')
+        list_parser.add_argument('--output-type', '-t', default='text', choices=['json', 'text', 'csv', 'ndjson'],metavar='json/text/csv/ndjson', help=' Output type {json, text, csv, ndjson}. Default is text')
+        list_parser.add_argument('--fields', default=None, metavar='field1,field2', help=' Comma separated (dotted) fields to output, e.g. id,version,dateCreated')
 
         get_parser = subparsers.add_parser("get-policy", help="Gets a specific policy")
         get_parser.add_argument('name', help="Policy name to retrieve", action='store')
         get_parser.add_argument('--network', '-n', help="Network to list from (staging or production). Default is production", metavar='network', action='store', choices=['staging', 'production'],default='production')
-        get_parser.add_argument('--output-file', '-f', type=argparse.FileType('wt'), metavar='file_name', help=' Save output to a file')
+        get_parser.add_argument('--output-file', '-f', type=argparse.FileType('wb'), metavar='file_name', help=' Save output to a file (as returned by the API)')
+        get_parser.add_argument('--pretty', default=False, action='store_true', help=' Pretty print the policy saved with --output-file')
 
         update_parser = subparsers.add_parser("set-policy", help="Add or updates a given policy out of a JSON file")
         update_parser.add_argument('name', help="Policy name to update", action='store')
         update_parser.add_argument('--input-file', '-f', type=argparse.FileType('rt'), required=True, metavar='filename', help="JSON Config file")
         update_parser.add_argument('--network', '-n', help="Network where the policy resides (staging, production or both). Default is production", metavar='network', action='store', choices=['staging', 'production','both'],default='production')
+        update_parser.add_argument('--validate-only', default=False, action='store_true', help=" Only validate the policy file, without calling the API")
 
         delete_parser = subparsers.add_parser("delete-policy", help="Deletes a policy")
         delete_parser.add_argument('name', help="Policy name to delete", action='store')
         delete_parser.add_argument('--network', '-n', help="Network to delete from (staging, production or both). Default is production", metavar='network', action='store', choices=['staging', 'production','both'],default='production')
 
+        export_parser = subparsers.add_parser("export-policies", help="Saves every policy of a network into a directory (one JSON file per policy)")
+        export_parser.add_argument('directory', help="Directory where the policy files are saved", action='store')
+        export_parser.add_argument('--network', '-n', help="Network to export from (staging or production). Default is production", metavar='network', action='store', choices=['staging', 'production'],default='production')
+        export_parser.add_argument('--workers', '-w', type=int, default=8, metavar='N', help=" Number of policies fetched concurrently. Default is 8")
+        export_parser.add_argument('--pretty', default=False, action='store_true', help=" Pretty print the saved policies (they are saved as returned by the API otherwise)")
+        export_parser.add_argument('--async', dest='use_async', default=False, action='store_true', help=" Run the API calls on a single asyncio event loop (requires aiohttp)")
+
+        sync_parser = subparsers.add_parser("sync-policies", help="Deploys a directory of policy files, only updating the policies that changed")
+        sync_parser.add_argument('directory', help="Directory with one <policy name>.json file per policy", action='store')
+        sync_parser.add_argument('--network', '-n', help="Network to deploy to (staging, production or both). Default is production", metavar='network', action='store', choices=['staging', 'production','both'],default='production')
+        sync_parser.add_argument('--workers', '-w', type=int, default=8, metavar='N', help=" Number of concurrent API calls. Default is 8")
+        sync_parser.add_argument('--async', dest='use_async', default=False, action='store_true', help=" Run the API calls on a single asyncio event loop (requires aiohttp)")
+        sync_parser.add_argument('--plan', default=False, action='store_true', help=" Only print the policies that would be deployed")
+        sync_parser.add_argument('--validate-only', default=False, action='store_true', help=" Only validate the policy files, without calling the API")
+
+        inventory_parser = subparsers.add_parser("inventory", help="Lists the policies of several tenants (policy sets and account switch keys) into a single report")
+        inventory_parser.add_argument('tenants_file', help="JSON file listing the tenants: [{\"name\": ..., \"policy_sets\": [...], \"account_key\": ...}]", action='store')
+        inventory_parser.add_argument('--network', '-n', help="Network to list from (staging, production or both). Default is both", metavar='network', action='store', choices=['staging', 'production','both'],default='both')
+        inventory_parser.add_argument('--workers', '-w', type=int, default=16, metavar='N', help=" Number of concurrent API calls. Default is 16")
+        inventory_parser.add_argument('--async', dest='use_async', default=False, action='store_true', help=" Run the API calls on a single asyncio event loop (requires aiohttp)")
+        inventory_parser.add_argument('--output-type', '-t', default='text', choices=['json', 'text', 'csv', 'ndjson'],metavar='json/text/csv/ndjson', help=' Output type {json, text, csv, ndjson}. Default is text')
+        inventory_parser.add_argument('--fields', default=None, metavar='field1,field2', help=' Comma separated (dotted) fields to output. Default is tenant,policy_set,network,id,version,dateCreated,user')
+
+        index_parser = subparsers.add_parser("index-policies", help="Stores every policy of the policy set into a local SQLite index, downloading only the ones that changed")
+        index_parser.add_argument('--network', '-n', help="Network to index (staging, production or both). Default is both", metavar='network', action='store', choices=['staging', 'production','both'],default='both')
+        index_parser.add_argument('--workers', '-w', type=int, default=8, metavar='N', help=" Number of policies fetched concurrently. Default is 8")
+        index_parser.add_argument('--async', dest='use_async', default=False, action='store_true', help=" Run the API calls on a single asyncio event loop (requires aiohttp)")
+        index_parser.add_argument('--index-file', default=None, metavar='file_name', help=" Location of the index. Default is ~/.akamai-cli/data/image-manager/policies.db")
+
+        query_parser = subparsers.add_parser("query-policies", help="Lists the indexed policies matching path filters (see index-policies)")
+        query_parser.add_argument('filters', nargs='*', metavar='filter', help="path[op value] filters, all of them must match. op is =, !=, >, >=, <, <= or ~ (contains); * matches any list item, ** any depth, e.g. 'breakpoints.widths.*>3000'")
+        query_parser.add_argument('--network', '-n', help="Network to query (staging, production or both). Default is both", metavar='network', action='store', choices=['staging', 'production','both'],default='both')
+        query_parser.add_argument('--name', default=None, metavar='pattern', help=" Only policies whose name matches a glob pattern")
+        query_parser.add_argument('--output-type', '-t', default='text', choices=['json', 'text', 'csv', 'ndjson'],metavar='json/text/csv/ndjson', help=' Output type {json, text, csv, ndjson}. Default is text')
+        query_parser.add_argument('--fields', default=None, metavar='field1,field2', help=' Comma separated (dotted) fields to output. Default is policy_set,network,id,version,dateCreated')
+        query_parser.add_argument('--index-file', default=None, metavar='file_name', help=" Location of the index. Default is ~/.akamai-cli/data/image-manager/policies.db")
+
+        snapshot_parser = subparsers.add_parser("snapshot-policies", help="Saves every policy of a network into a single snapshot file")
+        snapshot_parser.add_argument('file_name', help="Snapshot file to write", action='store')
+        snapshot_parser.add_argument('--network', '-n', help="Network to save (staging or production). Default is production", metavar='network', action='store', choices=['staging', 'production'],default='production')
+        snapshot_parser.add_argument('--workers', '-w', type=int, default=8, metavar='N', help=" Number of policies fetched concurrently. Default is 8")
+        snapshot_parser.add_argument('--async', dest='use_async', default=False, action='store_true', help=" Run the API calls on a single asyncio event loop (requires aiohttp)")
+
+        diff_parser = subparsers.add_parser("diff-policies", help="Shows the path level differences between the policies of two networks, directories or snapshots")
+        diff_parser.add_argument('source', help="staging, production, a directory of policy files or a snapshot file", action='store')
+        diff_parser.add_argument('target', help="staging, production, a directory of policy files or a snapshot file", action='store')
+        diff_parser.add_argument('--name', default=None, metavar='pattern', help=" Only compare the policies whose name matches a glob pattern")
+        diff_parser.add_argument('--workers', '-w', type=int, default=8, metavar='N', help=" Number of policies fetched concurrently. Default is 8")
+        diff_parser.add_argument('--async', dest='use_async', default=False, action='store_true', help=" Run the API calls on a single asyncio event loop (requires aiohttp)")
+        diff_parser.add_argument('--output-type', '-t', default='text', choices=['json', 'text', 'ndjson'],metavar='json/text/ndjson', help=' Output type {json, text, ndjson}. Default is text')
+
+        promote_parser = subparsers.add_parser("promote-policies", help="Copies staging policies to production, skipping the ones already identical")
+        promote_parser.add_argument('names', nargs='*', metavar='name', help="Policy names or glob patterns to promote")
+        promote_parser.add_argument('--all', default=False, action='store_true', help=" Promote every staging policy")
+        promote_parser.add_argument('--workers', '-w', type=int, default=8, metavar='N', help=" Number of concurrent API calls. Default is 8")
+        promote_parser.add_argument('--async', dest='use_async', default=False, action='store_true', help=" Run the API calls on a single asyncio event loop (requires aiohttp)")
+        promote_parser.add_argument('--plan', default=False, action='store_true', help=" Only show the policies that would be promoted")
+        promote_parser.add_argument('--output-type', '-t', default='text', choices=['json', 'text', 'csv', 'ndjson'],metavar='json/text/csv/ndjson', help=' Output type {json, text, csv, ndjson}. Default is text')
+
+        history_parser = subparsers.add_parser("history-sync", help="Saves the version history of the policies into a local store, downloading only the new versions")
+        history_parser.add_argument('--network', '-n', help="Network to sync (staging, production or both). Default is both", metavar='network', action='store', choices=['staging', 'production','both'],default='both')
+        history_parser.add_argument('--name', default=None, metavar='pattern', help=" Only the policies whose name matches a glob pattern")
+        history_parser.add_argument('--workers', '-w', type=int, default=8, metavar='N', help=" Number of concurrent API calls. Default is 8")
+        history_parser.add_argument('--async', dest='use_async', default=False, action='store_true', help=" Run the API calls on a single asyncio event loop (requires aiohttp)")
+        history_parser.add_argument('--history-dir', default=None, metavar='directory', help=" Location of the version store. Default is ~/.akamai-cli/data/image-manager/history")
+
+        rollback_parser = subparsers.add_parser("rollback-policy", help="Deploys a previous version of a policy, from the local version store (see history-sync)")
+        rollback_parser.add_argument('name', help="Policy name to roll back", action='store')
+        rollback_parser.add_argument('--to-version', type=int, required=True, metavar='N', help=" Version to deploy again")
+        rollback_parser.add_argument('--network', '-n', help="Network of the policy (staging or production). Default is production", metavar='network', action='store', choices=['staging', 'production'],default='production')
+        rollback_parser.add_argument('--history-dir', default=None, metavar='directory', help=" Location of the version store. Default is ~/.akamai-cli/data/image-manager/history")
+
+        for resource, title in [("images", "images"), ("collections", "image collections")]:
+            listing_parser = subparsers.add_parser("list-" + resource, help="Streams the %s of the policy set as newline delimited JSON, page by page" % title)
+            listing_parser.add_argument('--network', '-n', help="Network to list from (staging or production). Default is production", metavar='network', action='store', choices=['staging', 'production'],default='production')
+            listing_parser.add_argument('--output-file', '-f', default=None, metavar='file_name', help=" Write to a file, saving the progress after every page (see --resume)")
+            listing_parser.add_argument('--resume', default=False, action='store_true', help=" Continue an interrupted listing into --output-file")
+            listing_parser.add_argument('--cursor', default=None, metavar='token', help=" Start from a page cursor (printed when a listing to stdout is interrupted)")
+            listing_parser.add_argument('--limit', type=int, default=100, metavar='N', help=" Items requested per page. Default is 100")
+            listing_parser.add_argument('--fields', default=None, metavar='field1,field2', help=' Comma separated (dotted) fields to output. Default is the whole item')
+            if resource == "images":
+                listing_parser.add_argument('--policy', default=None, metavar='policy_name', help=" Only the images of a policy")
+
+        watch_parser = subparsers.add_parser("watch-policies", help="Watches a directory of policy files and deploys each file when it changes")
+        watch_parser.add_argument('directory', help="Directory with one <policy name>.json file per policy", action='store')
+        watch_parser.add_argument('--network', '-n', help="Network to deploy to (staging, production or both). Default is staging", metavar='network', action='store', choices=['staging', 'production','both'],default='staging')
+        watch_parser.add_argument('--workers', '-w', type=int, default=4, metavar='N', help=" Number of policies deployed concurrently. Default is 4")
+        watch_parser.add_argument('--debounce', type=float, default=200, metavar='ms', help=" Wait for this long without changes before deploying. Default is 200 ms")
+        watch_parser.add_argument('--poll', default=False, action='store_true', help=" Poll the directory instead of using inotify")
+
+        batch_parser = subparsers.add_parser("batch", help="Runs newline delimited JSON commands (list, get, set or delete) over a single session")
+        batch_parser.add_argument('--input-file', '-f', type=argparse.FileType('rt'), default='-', metavar='filename', help="File with one JSON command per line. Default is stdin")
+        batch_parser.add_argument('--listen', '-l', default=None, metavar='socket_path', help=" Stay resident, serving batch commands on a local UNIX socket")
+
         parser.add_argument('--verbose', default=False, action='count', help=' Verbose mode')
         parser.add_argument('--version', '-v', default=False, action='version', version='version ' + PACKAGE_VERSION, help=' Version number')
         parser.add_argument('--debug', '-d', default=False, action='count', help=' Debug mode (prints HTTP headers)')
         parser.add_argument('--edgerc', '-e', default='~/.edgerc', metavar='credentials_file', help=' Location of the credentials file (default is ~/.edgerc)')
         parser.add_argument('--section', '-c', default='image-manager', metavar='credentials_file_section', action='store', help=' Credentials file Section\'s name to use')
-        parser.add_argument('--policy-set', '-p', action='store', metavar='im_policy_name', required=True, help=' Image Manager Policy Name (as indicated in Property Manager and IM Policy Manager)')
+        parser.add_argument('--policy-set', '-p', action='store', metavar='im_policy_name', default=None, help=' Image Manager Policy Name (as indicated in Property Manager and IM Policy Manager). Required by every command but inventory, batch, query-policies and diff-policies without a network')
+        parser.add_argument('--cache', default=None, action='store_true', help=' Cache GET responses on disk (can also be enabled with "cache = True" in the credentials file section)')
+        parser.add_argument('--no-cache', default=False, action='store_true', help=' Do not use the response cache')
+        parser.add_argument('--refresh', default=False, action='store_true', help=' Ignore cached responses, but store the fresh ones')
+        parser.add_argument('--no-validate', default=False, action='store_true', help=' Do not validate policies against the bundled policy schemas before deploying them')
+        parser.add_argument('--pool-connections', default=None, type=int, metavar='N', help=' Number of hosts whose connections are pooled. Default is 10')
+        parser.add_argument('--pool-maxsize', default=None, type=int, metavar='N', help=' Connections kept open per host (bulk commands raise it to their workers). Default is 10')
+        parser.add_argument('--connect-timeout', default=None, type=float, metavar='seconds', help=' Timeout to open a connection. Default is 10')
+        parser.add_argument('--read-timeout', default=None, type=float, metavar='seconds', help=' Timeout waiting for response data. Default is 120')
+        parser.add_argument('--no-keep-alive', dest='keep_alive', default=None, action='store_const', const='false', help=' Open a new connection for every request')
+        parser.add_argument('--no-tls-session-reuse', dest='tls_session_reuse', default=None, action='store_const', const='false', help=' Do not resume TLS sessions on new connections')
+        parser.add_argument('--max-retries', default=None, type=int, metavar='N', help=' Retries of idempotent calls on throttling or transient errors. Default is 3')
+        parser.add_argument('--timings', default=False, action='store_true', help=' Print a latency summary (p50/p95/p99) per API endpoint at exit')
+        parser.add_argument('--timings-file', default=None, metavar='file_name', help=' Append every API request span to a JSON lines file')
+        parser.add_argument('--prometheus-file', default=None, metavar='file_name', help=' Write API request metrics to a Prometheus textfile collector file')
+        parser.add_argument('--profile', default=False, action='store_true', help=' Profile the run: saves a pstats file and prints the top functions (and the time of each worker thread) on stderr')
+        parser.add_argument('--profile-file', default=None, metavar='file_name', help=' pstats file written by --profile. Default is <program name>.pstats, e.g. akamai-image-manager.pstats')
+        parser.add_argument('--profile-top', default=None, type=int, metavar='N', help=' Number of functions printed by --profile. Default is 25')
+        parser.add_argument('--profile-sort', default='cumulative', choices=['cumulative', 'tottime', 'calls'], help=' Order of the functions printed by --profile. Default is cumulative')
         parser.add_argument('--account-key', '-a', default='', action='store', metavar='account_switch_key', help=' Account Switch Key for Internal Users')
         # parser.add_argument('--lookup-policy-set', '-l', action='store', metavar='property_name', help=' Lookup Image Manager Policy Name (by Property name)')
         # parser.add_argument('--session', '-s', default=False, action='store', help=' Session name (see: https://github.com/akamai/cli-image-manager#sessions)')
@@ -89,6 +202,10 @@ class EdgeGridConfig():
         arguments = vars(args)
 
         if arguments['debug']:
+            if sys.version_info[0] >= 3:
+                import http.client as http_client
+            else:
+                import httplib as http_client
             http_client.HTTPConnection.debuglevel = 1
             logging.basicConfig()
             logging.getLogger().setLevel(logging.DEBUG)
@@ -117,9 +234,7 @@ class EdgeGridConfig():
                 # ConfigParser lowercases magically
                 if key not in arguments or arguments[key] is None:
                     arguments[key] = value
-                else:
-                    print("Missing configuration file.  Run python gen_edgerc.py to get your credentials file set up once you've provisioned credentials in LUNA.")
-                    return None
+                # Otherwise the command line overrides the credentials file
 
         for option in arguments:
             setattr(self, option, arguments[option])
@@ -0,0 +1,86 @@
+# Python edgegrid module
+""" Copyright 2021 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+import os
+import re
+import json
+import hashlib
+import tempfile
+import json_codec
+from cache import DEFAULT_DATA_DIR
+from policy_utils import canonicalJson, normalizePolicy
+
+DEFAULT_HISTORY_DIR = os.path.join(DEFAULT_DATA_DIR, 'history')
+
+
+class HistoryStore():
+    """ Local store of policy versions. Policy contents (without the server
+    managed fields) are saved once under objects/, named after their hash,
+    so versions with the same content share a file. Every policy has a
+    version log under <account>/<policy set>/<network>/<policy>.json
+    mapping its versions to their metadata and, when it was captured,
+    content hash. <account> is the account switch key, or "default" """
+
+    def __init__(self, directory=DEFAULT_HISTORY_DIR):
+        self.directory = os.path.expanduser(directory)
+
+    def writeFile(self, file_name, text):
+        """ Writes a file atomically, creating its directory if needed """
+        directory = os.path.dirname(file_name)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        handle, temp_name = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(handle, "w") as temp_file:
+            temp_file.write(text)
+        os.replace(temp_name, file_name)
+
+    def objectPath(self, content_hash):
+        return os.path.join(self.directory, "objects", content_hash[:2], content_hash + ".json")
+
+    def putObject(self, policy):
+        """ Stores the content of a policy, returns its hash """
+        content = canonicalJson(normalizePolicy(policy))
+        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        if not os.path.exists(self.objectPath(content_hash)):
+            self.writeFile(self.objectPath(content_hash), content)
+        return content_hash
+
+    def getObject(self, content_hash):
+        with open(self.objectPath(content_hash)) as object_file:
+            return json_codec.loads(object_file.read())
+
+    def logPath(self, account_key, policy_set, network, policyName):
+        # Account switch keys hold colons, which some file systems refuse
+        account = re.sub(r'[^\w.-]', '_', account_key) if account_key else "default"
+        return os.path.join(self.directory, account, policy_set, network, policyName + ".json")
+
+    def readLog(self, account_key, policy_set, network, policyName):
+        """ Version log of a policy: {version (as text): metadata} """
+        try:
+            with open(self.logPath(account_key, policy_set, network, policyName)) as log_file:
+                return json.load(log_file)
+        except (IOError, OSError):
+            return {}
+
+    def writeLog(self, account_key, policy_set, network, policyName, versions):
+        self.writeFile(self.logPath(account_key, policy_set, network, policyName),
+                       json.dumps(versions, indent=2, sort_keys=True))
+
+    def latestVersion(self, account_key, policy_set, network, policyName):
+        """ Newest version with a stored content, or 0 """
+        versions = self.readLog(account_key, policy_set, network, policyName)
+        stored = [int(version) for version, entry in versions.items() if entry.get("hash")]
+        return max(stored) if stored else 0
@@ -14,13 +14,19 @@
  See the License for the specific language governing permissions and
  limitations under the License.
 """
+from __future__ import print_function
 import sys
-import os
 import requests
 import logging
+import re
 import json
-from akamai.edgegrid import EdgeGridAuth
-from config import EdgeGridConfig
+import time
+import random
+import threading
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+import json_codec
+from timings import resetConnectionTimings, connectionTimings
 if sys.version_info[0] >= 3:
     # python3
     from urllib import parse
@@ -30,28 +36,260 @@ else:
 
 logger = logging.getLogger(__name__)
 
+IDEMPOTENT_METHODS = ["GET", "HEAD", "PUT", "DELETE"]
+CHUNK_SIZE = 64 * 1024
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+
+
+def parseRetryTime(value):
+    """ Seconds to wait as given by a Retry-After (seconds or HTTP date) or
+    X-RateLimit-Next (ISO 8601 date) header, or None if unparseable """
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        if re.match(r"\d{4}-\d{2}-\d{2}T", value):
+            moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        else:
+            moment = parsedate_to_datetime(value)
+        return max(0.0, moment.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retryDelay(headers, attempt, backoff=DEFAULT_BACKOFF):
+    """ Jittered exponential backoff, stretched to what the server asks
+    for through the Retry-After and X-RateLimit-Next headers """
+    delay = random.uniform(0, min(MAX_BACKOFF, backoff * 2 ** attempt))
+    for header in ["Retry-After", "X-RateLimit-Next"]:
+        if headers.get(header):
+            server_delay = parseRetryTime(headers[header])
+            if server_delay is not None:
+                delay = max(delay, server_delay)
+    return delay
+
+
+def isThrottled(status, headers):
+    """ Whether a response signals that the API rate limit was reached """
+    if status in [429, 503]:
+        return True
+    return str(headers.get("X-RateLimit-Remaining", "")).strip() == "0"
+
+
+class AdaptiveLimiter():
+    """ AIMD concurrency limit shared by the workers of a bulk run. The
+    limit is halved on throttling (at most once per cooldown, as the calls
+    in flight report the same event) and grows back by one slot for every
+    limit's worth of successful calls """
+
+    def __init__(self, max_limit, min_limit=1, cooldown=1.0):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.cooldown = cooldown
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+    def adjust(self, throttled):
+        if throttled:
+            now = time.time()
+            if now - self.last_decrease >= self.cooldown:
+                self.limit = max(self.min_limit, self.limit / 2)
+                self.last_decrease = now
+                logger.debug("Throttled, concurrency limit is now %d", int(self.limit))
+        else:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self.condition:
+            self.in_flight -= 1
+            self.adjust(throttled)
+            self.condition.notify_all()
+
+
+class ApiResponse():
+    """ Wraps a requests response so that its JSON body is decoded at most
+    once, however many times json() is called """
+
+    def __init__(self, response):
+        self.response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.decoded = False
+        self.body = None
+
+    def json(self):
+        if not self.decoded:
+            content = self.response.content
+            self.body = json_codec.loads(content) if content else {}
+            self.decoded = True
+        return self.body
+
+    def iter_content(self, chunk_size=CHUNK_SIZE):
+        return self.response.iter_content(chunk_size)
+
+    def close(self):
+        self.response.close()
+
 
 class EdgeGridHttpCaller():
-    def __init__(self, session, debug, verbose, baseurl):
+    def __init__(self, session, debug, verbose, baseurl, cache=None,
+                 max_retries=DEFAULT_MAX_RETRIES, timeout=None):
         self.debug = debug
         self.verbose = verbose
         self.session = session
         self.baseurl = baseurl
+        self.cache = cache
+        self.max_retries = max_retries
+        # (connect, read) seconds, so a hung connection fails (and is
+        # retried) instead of blocking its worker forever
+        self.timeout = timeout
+        self.limiter = None
+        self.timings = None
         return None
 
+    def recordTiming(self, method, endpoint, endpoint_result, retries, started, stream=False):
+        """ Records the span of a request (after its retries) when timings
+        are enabled. Connection setup is only measured on new connections """
+        if self.timings is None:
+            return
+        setup = connectionTimings()
+        if endpoint_result is None:
+            status, size, ttfb = "error", 0, 0.0
+        else:
+            status = endpoint_result.status_code
+            if stream:
+                size = int(endpoint_result.headers.get("Content-Length") or 0)
+            else:
+                size = len(endpoint_result.content)
+            ttfb = max(0.0, endpoint_result.elapsed.total_seconds() * 1000 -
+                       setup["dns"] - setup["connect"] - setup["tls"])
+        self.timings.record(method, endpoint, status, size, retries, ttfb,
+                            (time.time() - started) * 1000, setup)
+
+    def send(self, method, endpoint, **kwargs):
+        """ Sends a request, retrying idempotent ones on connection errors,
+        throttling and transient server errors. When a limiter is set, the
+        request waits for a concurrency slot and reports throttling to it """
+        url = parse.urljoin(self.baseurl, endpoint)
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        started = None
+        while True:
+            if self.limiter is not None:
+                self.limiter.acquire()
+            # Spans start once the request got its concurrency slot
+            started = started or time.time()
+            resetConnectionTimings()
+            endpoint_result, error = None, None
+            try:
+                endpoint_result = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as caught:
+                error = caught
+            finally:
+                # Released whatever is raised, a lost slot would stall the workers
+                if self.limiter is not None:
+                    self.limiter.release(error is not None or (
+                        endpoint_result is not None and
+                        isThrottled(endpoint_result.status_code, endpoint_result.headers)))
+            if error is not None:
+                if method not in IDEMPOTENT_METHODS or attempt >= self.max_retries:
+                    self.recordTiming(method, endpoint, None, attempt, started)
+                    raise error
+                delay = retryDelay({}, attempt)
+                reason = error.__class__.__name__
+            else:
+                status = endpoint_result.status_code
+                if (status not in RETRY_STATUSES or method not in IDEMPOTENT_METHODS
+                        or attempt >= self.max_retries):
+                    self.recordTiming(method, endpoint, endpoint_result, attempt, started,
+                                      kwargs.get("stream", False))
+                    return ApiResponse(endpoint_result)
+                delay = retryDelay(endpoint_result.headers, attempt)
+                reason = status
+                endpoint_result.close()
+            if self.verbose:
+                print("LOG: %s %s %s, retrying in %.1fs" % (method, endpoint, reason, delay),
+                      file=sys.stderr)
+            time.sleep(delay)
+            attempt += 1
+
     def urlJoin(self, url, path):
         return parse.urljoin(url, path)
 
-    def getResult(self, endpoint, parameters=None):
-        """ Executes a GET API call and returns the JSON output """
+    def cacheKey(self, endpoint, parameters=None, headers=None):
+        """ Cache key of a GET, scoped to the policy set (Luna-Token) of
+        the request """
+        lunaToken = (headers or {}).get('Luna-Token', self.session.headers.get('Luna-Token'))
+        return self.cache.key(self.baseurl, lunaToken, endpoint, parameters)
+
+    def invalidateCache(self, endpoint, headers=None):
+        """ Drops the cached GETs of an endpoint and of its parent list """
+        if self.cache is None:
+            return
+        path, _, query = endpoint.partition('?')
+        parent = path.rstrip('/').rsplit('/', 1)[0] + ('?' + query if query else '')
+        for cached_endpoint in [endpoint, parent]:
+            self.cache.invalidate(self.cacheKey(cached_endpoint, headers=headers))
+
+    def getResult(self, endpoint, parameters=None, cached=True, headers=None, store=True):
+        """ Executes a GET API call and returns the JSON output. Successful
+        responses are served from (and stored into) the cache when enabled;
+        cached=False always calls the API but still refreshes the cache, and
+        store=False bypasses the cache entirely.
+        headers are sent with this request only (e.g. its Luna-Token) """
         path = endpoint
-        endpoint_result = self.session.get(parse.urljoin(self.baseurl,path), params=parameters)
-        if self.verbose: print (">>>\n" + json.dumps(endpoint_result.json(), indent=2) + "\n<<<\n")
+        cache_key = None
+        if self.cache is not None and store:
+            cache_key = self.cacheKey(endpoint, parameters, headers)
+            if cached:
+                cached_result = self.cache.get(cache_key)
+                if cached_result is not None:
+                    if self.verbose: print("LOG: GET %s (cached)" % endpoint, file=sys.stderr)
+                    return cached_result
+        endpoint_result = self.send("GET", path, params=parameters, headers=headers)
+        if self.verbose: print(">>>\n" + json.dumps(endpoint_result.json(), indent=2) + "\n<<<\n", file=sys.stderr)
         status = endpoint_result.status_code
-        if self.verbose: print( "LOG: GET %s %s %s" % (endpoint,status,endpoint_result.headers["content-type"]))
+        if self.verbose: print("LOG: GET %s %s %s" % (endpoint,status,endpoint_result.headers["content-type"]), file=sys.stderr)
         self.httpErrors(endpoint_result.status_code, path, endpoint_result.json())
+        if cache_key is not None and status == 200:
+            # Kept as sent, so that getRaw replays the same bytes
+            self.cache.set(cache_key, endpoint_result.json(), endpoint_result.response.content)
         return endpoint_result.json()
 
+    def getRaw(self, endpoint, output, parameters=None, headers=None):
+        """ Executes a GET API call and writes the response body as is to a
+        binary file object, in chunks, without decoding it. Cached responses
+        are written as the API sent them. Error responses go through
+        httpErrors """
+        if self.cache is not None:
+            cached_raw = self.cache.getRaw(self.cacheKey(endpoint, parameters, headers))
+            if cached_raw is not None:
+                if self.verbose: print("LOG: GET %s (cached)" % endpoint, file=sys.stderr)
+                output.write(cached_raw)
+                return
+        endpoint_result = self.send("GET", endpoint, params=parameters, headers=headers,
+                                    stream=True)
+        status = endpoint_result.status_code
+        if self.verbose: print("LOG: GET %s %s %s (raw)" % (endpoint, status, endpoint_result.headers.get("content-type")), file=sys.stderr)
+        if status >= 300:
+            self.httpErrors(status, endpoint, endpoint_result.json())
+            sys.exit("ERROR: Call to %s failed with a %s result\n" % (endpoint, status))
+        for chunk in endpoint_result.iter_content(CHUNK_SIZE):
+            output.write(chunk)
+        endpoint_result.close()
+
     def httpErrors(self, status_code, endpoint, result):
         """ Basic error handling """
         if not isinstance(result, list):
@@ -64,7 +302,7 @@ class EdgeGridHttpCaller():
             error_msg += "ERROR: Please ensure that the credentials you created for this script\n"
             error_msg += "ERROR: have the necessary permissions in the Luna portal.\n"
             error_msg += "ERROR: Problem details: %s\n" % details
-            exit(error_msg)
+            sys.exit(error_msg)
 
         if status_code in [400, 401]:
             error_msg = "ERROR: Call to %s failed with a %s result\n" % (endpoint, status_code)
@@ -72,8 +310,7 @@ class EdgeGridHttpCaller():
             error_msg += "ERROR: Please ensure that the .edgerc file is formatted correctly.\n"
             error_msg += "ERROR: If you still have issues, please use gen_edgerc.py to generate the credentials\n"
             error_msg += "ERROR: Problem details: %s\n" % result
-            # exit(error_msg)
-            print(error_msg)
+            sys.exit(error_msg)
 
         if status_code in [404]:
             error_msg = "ERROR: Call to %s failed with a %s result\n" % (endpoint, status_code)
@@ -81,7 +318,19 @@ class EdgeGridHttpCaller():
             error_msg += "ERROR: Please ensure that the URL you're calling is valid and correctly formatted\n"
             error_msg += "ERROR: or look at other examples to make sure yours matches.\n"
             error_msg += "ERROR: Problem details: %s\n" % details
-            exit(error_msg)
+            sys.exit(error_msg)
+
+        if status_code == 429 or status_code >= 500:
+            error_msg = "ERROR: Call to %s failed with a %s result\n" % (endpoint, status_code)
+            error_msg += "ERROR: The API is throttling requests or failing, and kept doing so after retrying.\n"
+            error_msg += "ERROR: Please try again later, or lower the number of concurrent workers.\n"
+            error_msg += "ERROR: Problem details: %s\n" % details
+            sys.exit(error_msg)
+
+        if status_code >= 400:
+            error_msg = "ERROR: Call to %s failed with a %s result\n" % (endpoint, status_code)
+            error_msg += "ERROR: Problem details: %s\n" % (details or result)
+            sys.exit(error_msg)
 
         error_string = None
         if "errorString" in result:
@@ -97,62 +346,66 @@ class EdgeGridHttpCaller():
             error_msg = "ERROR: Call caused a server fault.\n"
             error_msg += "ERROR: Please check the problem details for more information:\n"
             error_msg += "ERROR: Problem details: %s\n" % error_string
-            exit(error_msg)
+            sys.exit(error_msg)
 
-    def postResult(self, endpoint, body, parameters=None):
+    def postResult(self, endpoint, body, parameters=None, headers=None):
         """ Executes a GET API call and returns the JSON output """
-        headers = {'content-type': 'application/json'}
+        headers = dict({'content-type': 'application/json'}, **(headers or {}))
         path = endpoint
-        endpoint_result = self.session.post(parse.urljoin(self.baseurl, path), data=body, headers=headers, params=parameters)
+        endpoint_result = self.send("POST", path, data=body, headers=headers, params=parameters)
         status = endpoint_result.status_code
         if self.verbose:
-            print("LOG: POST %s %s %s" % (path, status, endpoint_result.headers["content-type"]))
+            print("LOG: POST %s %s %s" % (path, status, endpoint_result.headers["content-type"]), file=sys.stderr)
         if status == 204:
             return {}
         self.httpErrors(endpoint_result.status_code, path, endpoint_result.json())
 
         if self.verbose:
-            print(">>>\n" + json.dumps(endpoint_result.json(), indent=2) + "\n<<<\n")
+            print(">>>\n" + json.dumps(endpoint_result.json(), indent=2) + "\n<<<\n", file=sys.stderr)
         return endpoint_result.json()
 
     def postFiles(self, endpoint, file):
         """ Executes a POST API call and returns the JSON output """
         path = endpoint
-        endpoint_result = self.session.post(parse.urljoin(self.baseurl, path), files=file)
+        endpoint_result = self.send("POST", path, files=file)
         status = endpoint_result.status_code
         if self.verbose:
-            print("LOG: POST FILES %s %s %s" % (path, status, endpoint_result.headers["content-type"]))
+            print("LOG: POST FILES %s %s %s" % (path, status, endpoint_result.headers["content-type"]), file=sys.stderr)
         if status == 204:
             return {}
         self.httpErrors(endpoint_result.status_code, path, endpoint_result.json())
 
         if self.verbose:
-            print(">>>\n" + json.dumps(endpoint_result.json(), indent=2) + "\n<<<\n")
+            print(">>>\n" + json.dumps(endpoint_result.json(), indent=2) + "\n<<<\n", file=sys.stderr)
         return endpoint_result.json()
 
-    def putResult(self, endpoint, body, parameters=None):
+    def putResult(self, endpoint, body, parameters=None, headers=None):
         """ Executes a PUT API call and returns the JSON output """
-        headers = {'content-type': 'application/json'}
+        headers = dict({'content-type': 'application/json'}, **(headers or {}))
         path = endpoint
 
-        endpoint_result = self.session.put(parse.urljoin(self.baseurl,path), data=body, headers=headers, params=parameters)
+        endpoint_result = self.send("PUT", path, data=body, headers=headers, params=parameters)
+        self.invalidateCache(endpoint, headers)
         status = endpoint_result.status_code
         if self.verbose:
-            print("LOG: PUT %s %s %s" % (endpoint, status, endpoint_result.headers["content-type"]))
+            print("LOG: PUT %s %s %s" % (endpoint, status, endpoint_result.headers["content-type"]), file=sys.stderr)
         if status == 204:
             return {}
+        self.httpErrors(status, path, endpoint_result.json())
         if self.verbose:
-            print(">>>\n" + json.dumps(endpoint_result.json(), indent=2) + "\n<<<\n")
+            print(">>>\n" + json.dumps(endpoint_result.json(), indent=2) + "\n<<<\n", file=sys.stderr)
         return endpoint_result.json()
 
-    def deleteResult(self, endpoint):
+    def deleteResult(self, endpoint, headers=None):
         """ Executes a DELETE API call and returns the JSON output """
-        endpoint_result = self.session.delete(parse.urljoin(self.baseurl,endpoint))
+        endpoint_result = self.send("DELETE", endpoint, headers=headers)
+        self.invalidateCache(endpoint, headers)
         status = endpoint_result.status_code
         if self.verbose:
-            print("LOG: DELETE %s %s %s" % (endpoint, status, endpoint_result.headers["content-type"]))
+            print("LOG: DELETE %s %s %s" % (endpoint, status, endpoint_result.headers["content-type"]), file=sys.stderr)
         if status == 204:
             return {}
+        self.httpErrors(status, endpoint, endpoint_result.json())
         if self.verbose:
-            print(">>>\n" + json.dumps(endpoint_result.json(), indent=2) + "\n<<<\n")
+            print(">>>\n" + json.dumps(endpoint_result.json(), indent=2) + "\n<<<\n", file=sys.stderr)
         return endpoint_result.json()
@@ -0,0 +1,48 @@
+# Python edgegrid module - JSON codec for ImgMan CLI module
+""" Copyright 2021 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ Uses orjson when it is installed (pip install orjson), and the standard
+ json module otherwise. Set AKAMAI_IM_JSON_CODEC=json to force the latter.
+"""
+import os
+import json
+
+try:
+    if os.environ.get("AKAMAI_IM_JSON_CODEC", "") == "json":
+        raise ImportError("orjson disabled")
+    import orjson
+except ImportError:
+    orjson = None
+
+CODEC = "orjson" if orjson is not None else "json"
+
+
+def loads(content):
+    """ Decodes a JSON document from bytes or text """
+    if orjson is not None:
+        return orjson.loads(content)
+    if isinstance(content, bytes):
+        content = content.decode('utf-8')
+    return json.loads(content)
+
+
+def dumps(value, indent=None):
+    """ Encodes a value as JSON text (indent can only be None or 2) """
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_INDENT_2 if indent else 0).decode('utf-8')
+    if indent:
+        return json.dumps(value, indent=indent)
+    return json.dumps(value, separators=(',', ':'))
@@ -0,0 +1,144 @@
+# Python edgegrid module - output writers for ImgMan CLI module
+""" Copyright 2021 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+import csv
+import json
+import textwrap
+
+DEFAULT_FIELDS = {
+    "text": ["id", "dateCreated", "user"],
+    "csv": ["network", "id", "version", "dateCreated", "user"],
+}
+INDEX_FIELDS = ["policy_set", "network", "id", "version", "dateCreated"]
+PROMOTE_FIELDS = ["id", "action", "result", "details"]
+INVENTORY_FIELDS = ["tenant", "policy_set", "network", "id", "version", "dateCreated", "user"]
+FIELD_TITLES = {"id": "Policy name", "dateCreated": "Date Created", "user": "User",
+                "version": "Version", "network": "Network", "tenant": "Tenant",
+                "policy_set": "Policy set", "action": "Action", "result": "Result",
+                "details": "Details"}
+FIELD_WIDTHS = {"id": 30, "details": 40}
+DEFAULT_WIDTH = 25
+
+
+def fieldValue(item, field):
+    """ Value of a (dotted) field of an item, or None if missing """
+    value = item
+    for key in field.split("."):
+        if isinstance(value, dict):
+            value = value.get(key)
+        elif isinstance(value, list) and key.isdigit() and int(key) < len(value):
+            value = value[int(key)]
+        else:
+            return None
+    return value
+
+
+def fieldText(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(',', ':'))
+    return str(value)
+
+
+class TableWriter():
+    """ Writes a fixed-width text table one row at a time, with the same
+    layout the texttable module draws (centered cells, long values wrapped) """
+
+    def __init__(self, stream, fields):
+        self.stream = stream
+        self.fields = fields
+        self.widths = [FIELD_WIDTHS.get(field, DEFAULT_WIDTH) for field in fields]
+        self.started = False
+
+    def border(self, char):
+        return "+" + "+".join(char * (width + 2) for width in self.widths) + "+\n"
+
+    def line(self, values):
+        cells = [textwrap.wrap(value, width) or [""]
+                 for value, width in zip(values, self.widths)]
+        height = max(len(cell) for cell in cells)
+        lines = []
+        for index in range(height):
+            parts = []
+            for cell, width in zip(cells, self.widths):
+                top = (height - len(cell)) // 2
+                text = cell[index - top] if 0 <= index - top < len(cell) else ""
+                fill = width - len(text)
+                parts.append(" " * (fill // 2) + text + " " * (fill // 2 + fill % 2))
+            lines.append("| " + " | ".join(parts) + " |\n")
+        return "".join(lines)
+
+    def header(self):
+        self.stream.write(self.border("-") +
+                          self.line([FIELD_TITLES.get(field, field) for field in self.fields]) +
+                          self.border("="))
+        self.started = True
+
+    def writeItem(self, item):
+        if not self.started:
+            self.header()
+        self.stream.write(self.line([fieldText(fieldValue(item, field))
+                                     for field in self.fields]) + self.border("-"))
+
+    def close(self):
+        if not self.started:
+            self.header()
+        self.started = False
+
+
+class CsvWriter():
+    """ Writes one CSV record per item, after a single header line """
+
+    def __init__(self, stream, fields):
+        self.writer = csv.writer(stream)
+        self.fields = fields
+        self.started = False
+
+    def writeItem(self, item):
+        if not self.started:
+            self.writer.writerow(self.fields)
+            self.started = True
+        self.writer.writerow([fieldText(fieldValue(item, field)) for field in self.fields])
+
+    def close(self):
+        pass
+
+
+class NdjsonWriter():
+    """ Writes one JSON document per line: the whole item, or the selected
+    fields only """
+
+    def __init__(self, stream, fields=None):
+        self.stream = stream
+        self.fields = fields
+
+    def writeItem(self, item):
+        if self.fields:
+            item = dict((field, fieldValue(item, field)) for field in self.fields)
+        self.stream.write(json.dumps(item, separators=(',', ':')) + "\n")
+
+    def close(self):
+        pass
+
+
+def outputWriter(output_type, stream, fields=None):
+    """ Streaming writer for a given output type (text, csv or ndjson) """
+    if output_type == "ndjson":
+        return NdjsonWriter(stream, fields)
+    if output_type == "csv":
+        return CsvWriter(stream, fields or DEFAULT_FIELDS["csv"])
+    return TableWriter(stream, fields or DEFAULT_FIELDS["text"])
@@ -0,0 +1,82 @@
+# Python edgegrid module
+""" Copyright 2021 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+import os
+import json
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_PAGE_SIZE = 100
+
+
+def pages(fetch, cursor=None, prefetch=True):
+    """ Lazily yields the pages of a listing as (cursor, items, next
+    cursor) tuples. fetch(cursor) returns the items of a page and the
+    cursor of the next one (None on the last page). With prefetch, the
+    next page is requested while the current one is consumed, so at most
+    two pages are held in memory """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch") if prefetch else None
+    future = None
+    try:
+        page = fetch(cursor)
+        while True:
+            items, next_cursor = page
+            if next_cursor is not None:
+                if next_cursor == cursor:
+                    raise ValueError("The API returned the cursor %s again" % next_cursor)
+                if executor is not None:
+                    future = executor.submit(fetch, next_cursor)
+            yield cursor, items, next_cursor
+            if next_cursor is None:
+                return
+            cursor = next_cursor
+            page = future.result() if future is not None else fetch(cursor)
+            future = None
+    finally:
+        if executor is not None:
+            # An abandoned listing does not wait for its prefetched page
+            if future is not None:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+
+class CursorFile():
+    """ Progress of a listing written to a file: the cursor of the next page
+    to fetch, and the size of the output once the previous pages were
+    written. Saved after every page, so an interrupted listing resumes
+    without losing or repeating items """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+
+    def read(self):
+        """ Saved progress ({"cursor", "offset", "items"}), or None """
+        try:
+            with open(self.file_name) as cursor_file:
+                return json.load(cursor_file)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def save(self, cursor, offset, items):
+        directory = os.path.dirname(os.path.abspath(self.file_name))
+        handle, temp_name = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(handle, "w") as temp_file:
+            json.dump({"cursor": cursor, "offset": offset, "items": items}, temp_file)
+        os.replace(temp_name, self.file_name)
+
+    def remove(self):
+        if os.path.exists(self.file_name):
+            os.remove(self.file_name)
@@ -0,0 +1,189 @@
+# Python edgegrid module
+""" Copyright 2021 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+import os
+import re
+import time
+import sqlite3
+import json_codec
+from cache import DEFAULT_DATA_DIR
+from policy_utils import policyHash
+
+DEFAULT_INDEX_FILE = os.path.join(DEFAULT_DATA_DIR, 'policies.db')
+
+FILTER_RE = re.compile(r'^(?P<path>[^=!<>~]+?)\s*(?:(?P<op>!=|>=|<=|=|>|<|~)\s*(?P<value>.*))?$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS policies (
+    account_key TEXT NOT NULL,
+    policy_set TEXT NOT NULL,
+    network TEXT NOT NULL,
+    name TEXT NOT NULL,
+    version INTEGER,
+    date_created TEXT,
+    hash TEXT NOT NULL,
+    body TEXT NOT NULL,
+    indexed_at REAL NOT NULL,
+    PRIMARY KEY (account_key, policy_set, network, name)
+)
+"""
+
+
+class PolicyIndex():
+    """ Local SQLite copy of the policies of one or more policy sets. Each
+    row holds the JSON of a policy as returned by the API, along with the
+    version and creation date used to refresh the index incrementally """
+
+    def __init__(self, file_name=DEFAULT_INDEX_FILE):
+        self.file_name = os.path.expanduser(file_name)
+        directory = os.path.dirname(self.file_name)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(self.file_name)
+        self.connection.execute(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def versions(self, account_key, policy_set, network):
+        """ Indexed policy name -> (version, dateCreated) """
+        rows = self.connection.execute(
+            "SELECT name, version, date_created FROM policies "
+            "WHERE account_key = ? AND policy_set = ? AND network = ?",
+            (account_key, policy_set, network))
+        return dict((name, (version, date_created)) for name, version, date_created in rows)
+
+    def staleNames(self, account_key, policy_set, network, items):
+        """ Names of the listed policies that are missing from the index or
+        whose version or creation date changed, and names of the indexed
+        policies that are no longer listed """
+        indexed = self.versions(account_key, policy_set, network)
+        stale = [my_item["id"] for my_item in items
+                 if indexed.get(my_item["id"]) != (my_item.get("version"),
+                                                   my_item.get("dateCreated"))]
+        listed = set(my_item["id"] for my_item in items)
+        removed = sorted(name for name in indexed if name not in listed)
+        return stale, removed
+
+    def update(self, account_key, policy_set, network, policies, removed=()):
+        """ Stores policies (name -> policy JSON) and drops removed names,
+        in a single transaction """
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO policies VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(account_key, policy_set, network, name, policy.get("version"),
+                  policy.get("dateCreated"), policyHash(policy), json_codec.dumps(policy), now)
+                 for name, policy in policies.items()])
+            self.connection.executemany(
+                "DELETE FROM policies WHERE account_key = ? AND policy_set = ? "
+                "AND network = ? AND name = ?",
+                [(account_key, policy_set, network, name) for name in removed])
+
+    def policies(self, policy_set=None, network=None, name_pattern=None):
+        """ Yields (policy set, network, policy JSON) of the indexed
+        policies, optionally narrowed to a policy set, a network and a name
+        glob pattern """
+        query = "SELECT policy_set, network, body FROM policies WHERE 1 = 1"
+        arguments = []
+        if policy_set is not None:
+            query += " AND policy_set = ?"
+            arguments.append(policy_set)
+        if network is not None:
+            query += " AND network = ?"
+            arguments.append(network)
+        if name_pattern is not None:
+            query += " AND name GLOB ?"
+            arguments.append(name_pattern)
+        query += " ORDER BY policy_set, network, name"
+        for policy_set, network, body in self.connection.execute(query, arguments):
+            yield policy_set, network, json_codec.loads(body)
+
+
+def parseFilter(text):
+    """ Parses a query filter: a dotted path, optionally followed by an
+    operator (=, !=, >, >=, <, <= or ~ for contains) and a value. Values
+    are read as JSON when possible (numbers, lists...), as text otherwise.
+    Returns (path keys, operator, value); a path alone tests existence """
+    match = FILTER_RE.match(text.strip())
+    if match is None:
+        raise ValueError("Invalid filter: %s" % text)
+    value = match.group("value")
+    if value is not None:
+        try:
+            value = json_codec.loads(value)
+        except ValueError:
+            pass
+    return match.group("path").strip().split("."), match.group("op"), value
+
+
+def pathValues(value, keys):
+    """ Yields the values found at a path. A "*" key matches every item of
+    a list (or value of an object), "**" any number of levels """
+    if not keys:
+        yield value
+        return
+    key, rest = keys[0], keys[1:]
+    children = value.values() if isinstance(value, dict) else \
+        value if isinstance(value, list) else []
+    if key == "**":
+        for found in pathValues(value, rest):
+            yield found
+        for child in children:
+            for found in pathValues(child, keys):
+                yield found
+    elif key == "*":
+        for child in children:
+            for found in pathValues(child, rest):
+                yield found
+    elif isinstance(value, dict) and key in value:
+        for found in pathValues(value[key], rest):
+            yield found
+    elif isinstance(value, list) and key.isdigit() and int(key) < len(value):
+        for found in pathValues(value[int(key)], rest):
+            yield found
+
+
+def compareValue(found, operator, value):
+    try:
+        if operator == "=":
+            return found == value
+        if operator == "!=":
+            return found != value
+        if operator == "~":
+            if isinstance(found, str):
+                return str(value) in found
+            return isinstance(found, (list, dict)) and value in found
+        if isinstance(found, bool) or isinstance(value, bool):
+            return False
+        if operator == ">":
+            return found > value
+        if operator == ">=":
+            return found >= value
+        if operator == "<":
+            return found < value
+        return found <= value
+    except TypeError:
+        return False
+
+
+def matchesFilter(policy, policyFilter):
+    """ Whether any value at the filter path satisfies its condition """
+    keys, operator, value = policyFilter
+    for found in pathValues(policy, keys):
+        if operator is None or compareValue(found, operator, value):
+            return True
+    return False
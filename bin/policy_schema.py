@@ -0,0 +1,165 @@
+# Python edgegrid module
+""" Copyright 2021 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+ Local validation of Image and Video policies against the JSON schemas
+ in schemas/. Only the JSON Schema keywords those schemas use are
+ supported: type, enum, properties, required, additionalProperties,
+ items, minimum, maximum, minLength and local $ref. Schemas are compiled
+ into nested checking functions once per process. Wherever a scalar is
+ expected, a policy variable reference ({"$var": "name"}) is accepted too.
+"""
+import os
+import json
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schemas")
+
+TYPES = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "boolean": lambda value: isinstance(value, bool),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+}
+
+validators = {}
+
+
+def isVariable(value):
+    return isinstance(value, dict) and list(value) == ["$var"] and isinstance(value["$var"], str)
+
+
+def compileSchema(schema, root):
+    """ Turns a schema into a function(value, path, errors) that appends
+    (path, message) tuples to errors """
+    if "$ref" in schema:
+        target = root
+        for key in schema["$ref"].lstrip("#/").split("/"):
+            target = target[key]
+        return compileSchema(target, root)
+
+    checks = []
+    scalar = schema.get("type") not in ["object", "array"]
+
+    if "type" in schema:
+        is_type = TYPES[schema["type"]]
+
+        def checkType(value, path, errors):
+            if not is_type(value):
+                errors.append((path, "expected %s, got %s" % (schema["type"], json.dumps(value))))
+                return False
+            return True
+        checks.append(checkType)
+
+    if "enum" in schema:
+        allowed = schema["enum"]
+
+        def checkEnum(value, path, errors):
+            if value not in allowed or isinstance(value, bool) != isinstance(allowed[0], bool):
+                options = ", ".join(json.dumps(option) for option in allowed[:8])
+                if len(allowed) > 8:
+                    options += "..."
+                errors.append((path, "%s is not one of %s" % (json.dumps(value), options)))
+                return False
+            return True
+        checks.append(checkEnum)
+
+    for keyword, test, message in [("minimum", lambda value, limit: value >= limit, "below the minimum %s"),
+                                   ("maximum", lambda value, limit: value <= limit, "above the maximum %s"),
+                                   ("minLength", lambda value, limit: len(value) >= limit, "shorter than %s characters")]:
+        if keyword in schema:
+            def checkLimit(value, path, errors, limit=schema[keyword], test=test, message=message):
+                if not test(value, limit):
+                    errors.append((path, "%s is %s" % (json.dumps(value), message % limit)))
+                    return False
+                return True
+            checks.append(checkLimit)
+
+    if "properties" in schema or "required" in schema or "additionalProperties" in schema:
+        properties = dict((key, compileSchema(subschema, root))
+                          for key, subschema in schema.get("properties", {}).items())
+        required = schema.get("required", [])
+        additional = schema.get("additionalProperties", True)
+        if isinstance(additional, dict):
+            additional = compileSchema(additional, root)
+
+        def checkObject(value, path, errors):
+            for key in required:
+                if key not in value:
+                    errors.append((path, "missing required field %s" % key))
+            for key, child in value.items():
+                child_path = path + "." + key if path else key
+                if key in properties:
+                    properties[key](child, child_path, errors)
+                elif additional is False:
+                    errors.append((child_path, "unknown field"))
+                elif additional is not True:
+                    additional(child, child_path, errors)
+            return True
+        checks.append(checkObject)
+
+    if "items" in schema:
+        items = compileSchema(schema["items"], root)
+
+        def checkItems(value, path, errors):
+            for index, child in enumerate(value):
+                items(child, path + "." + str(index) if path else str(index), errors)
+            return True
+        checks.append(checkItems)
+
+    def validate(value, path, errors):
+        if scalar and isVariable(value):
+            return
+        for check in checks:
+            # Later checks assume the type is right
+            if not check(value, path, errors):
+                return
+    return validate
+
+
+def validator(policy_type):
+    """ Compiled validator of a policy type (image or video), cached """
+    if policy_type not in validators:
+        with open(os.path.join(SCHEMA_DIR, policy_type + "-policy.json")) as schema_file:
+            schema = json.load(schema_file)
+        validators[policy_type] = compileSchema(schema, schema)
+    return validators[policy_type]
+
+
+def policyType(policy, default="image"):
+    """ Video policies are flagged with "video": true """
+    if isinstance(policy, dict) and isinstance(policy.get("video"), bool):
+        return "video" if policy["video"] else "image"
+    return default
+
+
+def validatePolicy(policy, default_type="image"):
+    """ Returns the list of (path, message) errors of a parsed policy, empty
+    if it is valid """
+    errors = []
+    validator(policyType(policy, default_type))(policy, "", errors)
+    return errors
+
+
+def validatePolicyJSON(policyJSON, default_type="image"):
+    """ Validates a policy document given as JSON text. Returns a list of
+    error messages, empty if it is valid """
+    try:
+        policy = json.loads(policyJSON)
+    except ValueError as error:
+        return ["Invalid JSON: %s" % error]
+    return [(path or "(policy)") + ": " + message
+            for path, message in validatePolicy(policy, default_type)]
@@ -0,0 +1,121 @@
+# Python edgegrid module - policy helpers for ImgMan CLI module
+""" Copyright 2021 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+import os
+import json
+import hashlib
+
+# Fields set by the Imaging API on every policy version; they are not part
+# of what a user deploys, so they are ignored when comparing policies
+SERVER_FIELDS = ["id", "version", "previousVersion", "dateCreated", "user"]
+
+
+def normalizePolicy(policy):
+    """ Returns a copy of the policy without the server managed fields.
+    Values that are not JSON objects (hence not policies) are returned as is """
+    if not isinstance(policy, dict):
+        return policy
+    return dict((key, value) for key, value in policy.items()
+                if key not in SERVER_FIELDS)
+
+
+def canonicalJson(value):
+    """ Serializes a JSON value in a key order independent way """
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+
+def policyHash(policy):
+    """ Content hash of a policy, ignoring the server managed fields """
+    return hashlib.sha256(canonicalJson(normalizePolicy(policy)).encode('utf-8')).hexdigest()
+
+
+def parsePolicyJSON(policyJSON):
+    """ Parses the text of a policy file. Returns (policy, None), or
+    (None, error) if it is not a JSON object """
+    try:
+        policy = json.loads(policyJSON)
+    except ValueError as error:
+        return None, "Invalid JSON: %s" % error
+    if not isinstance(policy, dict):
+        return None, "Invalid policy: a policy must be a JSON object"
+    return policy, None
+
+
+def readPolicyDir(directory):
+    """ Reads every <policy name>.json file in a directory. Returns a dict
+    of policy name -> (raw text, parsed policy or None, error or None) """
+    policies = {}
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith(".json"):
+            continue
+        with open(os.path.join(directory, file_name)) as policy_file:
+            policyJSON = policy_file.read()
+        policies[file_name[:-5]] = (policyJSON,) + parsePolicyJSON(policyJSON)
+    return policies
+
+
+def hashTree(value):
+    """ Hashes a JSON value bottom-up: every object and list gets a digest
+    built from the digests of its children (key order independent), so
+    equal subtrees are detected without comparing them. Returns a
+    (digest, value, children) node; children is a dict for objects, a
+    list for lists and None for scalars """
+    if isinstance(value, dict):
+        children = dict((key, hashTree(child)) for key, child in value.items())
+        digest = hashlib.sha1(b"{" + b"".join(
+            canonicalJson(key).encode('utf-8') + children[key][0]
+            for key in sorted(children))).digest()
+    elif isinstance(value, list):
+        children = [hashTree(child) for child in value]
+        digest = hashlib.sha1(b"[" + b"".join(child[0] for child in children)).digest()
+    else:
+        children = None
+        digest = hashlib.sha1(canonicalJson(value).encode('utf-8')).digest()
+    return (digest, value, children)
+
+
+def diffTrees(left, right, path=""):
+    """ Yields (change, path, old value, new value) for every difference
+    between two hash trees, change being added, removed or changed.
+    Subtrees with equal digests are skipped without being walked """
+    if left[0] == right[0]:
+        return
+    if isinstance(left[2], dict) and isinstance(right[2], dict):
+        keys = list(left[2]) + [key for key in right[2] if key not in left[2]]
+        pairs = [(key, left[2].get(key), right[2].get(key)) for key in keys]
+    elif isinstance(left[2], list) and isinstance(right[2], list):
+        size = max(len(left[2]), len(right[2]))
+        pairs = [(str(index), left[2][index] if index < len(left[2]) else None,
+                  right[2][index] if index < len(right[2]) else None)
+                 for index in range(size)]
+    else:
+        yield ("changed", path, left[1], right[1])
+        return
+    for key, leftChild, rightChild in pairs:
+        childPath = path + "." + key if path else key
+        if rightChild is None:
+            yield ("removed", childPath, leftChild[1], None)
+        elif leftChild is None:
+            yield ("added", childPath, None, rightChild[1])
+        else:
+            for difference in diffTrees(leftChild, rightChild, childPath):
+                yield difference
+
+
+def diffPolicies(left, right):
+    """ Path level differences between two policies, ignoring the server
+    managed fields. See diffTrees """
+    return list(diffTrees(hashTree(normalizePolicy(left)), hashTree(normalizePolicy(right))))
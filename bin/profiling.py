@@ -0,0 +1,107 @@
+# Python edgegrid module - profiling for ImgMan CLI module
+""" Copyright 2021 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+import time
+import pstats
+import cProfile
+import threading
+
+DEFAULT_TOP = 25
+
+
+class Profiler():
+    """ Profiles a run with cProfile. cProfile only sees the thread that
+    enabled it, so functions run by worker threads are wrapped (see
+    profiled) to get a profile of their own, merged into the report, and
+    to account their wall and CPU time per thread """
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.thread_profiles = []
+        self.workers = {}
+        self.thread_id = None
+        self.started = None
+        self.elapsed = (0.0, 0.0)
+
+    def start(self):
+        self.thread_id = threading.get_ident()
+        self.started = (time.time(), time.process_time())
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.elapsed = (time.time() - self.started[0], time.process_time() - self.started[1])
+
+    def threadProfile(self):
+        """ Profile of the current worker thread, or None where profilers
+        are process wide (Python 3.12+, whose cProfile already sees every
+        thread and refuses a second profiler) """
+        if not hasattr(self.local, "profile"):
+            self.local.profile = cProfile.Profile()
+            try:
+                self.local.profile.enable()
+                self.local.profile.disable()
+            except ValueError:
+                self.local.profile = None
+            else:
+                with self.lock:
+                    self.thread_profiles.append(self.local.profile)
+        return self.local.profile
+
+    def profiled(self, function):
+        """ Wraps a function run by worker threads """
+        def run(*args, **kwargs):
+            profile = None
+            if threading.get_ident() != self.thread_id:
+                profile = self.threadProfile()
+            wall, cpu = time.time(), time.thread_time()
+            if profile is not None:
+                profile.enable()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                if profile is not None:
+                    profile.disable()
+                self.account(threading.current_thread().name, time.time() - wall,
+                             time.thread_time() - cpu)
+        return run
+
+    def account(self, name, wall, cpu):
+        with self.lock:
+            jobs, total_wall, total_cpu = self.workers.get(name, (0, 0.0, 0.0))
+            self.workers[name] = (jobs + 1, total_wall + wall, total_cpu + cpu)
+
+    def report(self, file_name, stream, top=DEFAULT_TOP, sort="cumulative"):
+        """ Saves the merged profile as a pstats file, then writes the top
+        functions and the per worker breakdown to stream """
+        stats = pstats.Stats(self.profile, stream=stream)
+        for profile in self.thread_profiles:
+            stats.add(profile)
+        stats.dump_stats(file_name)
+        stream.write("Profile saved to %s (wall %.2f s, CPU %.2f s); open it with: "
+                     "python -m pstats %s\n" % ((file_name,) + self.elapsed + (file_name,)))
+        stats.sort_stats(sort).print_stats(top)
+        if self.workers:
+            self.writeWorkers(stream)
+
+    def writeWorkers(self, stream):
+        stream.write("%-24s %6s %10s %10s %6s\n" % ("WORKER", "JOBS", "WALL s", "CPU s", "CPU %"))
+        for name in sorted(self.workers):
+            jobs, wall, cpu = self.workers[name]
+            stream.write("%-24s %6d %10.3f %10.3f %6.1f\n"
+                         % (name, jobs, wall, cpu, 100.0 * cpu / wall if wall else 0.0))
@@ -0,0 +1,206 @@
+# Python edgegrid module - request timings for ImgMan CLI module
+""" Copyright 2021 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+import os
+import re
+import math
+import sys
+import json
+import time
+import socket
+import threading
+import tempfile
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Connection setup timings of the request being sent by the current thread
+current = threading.local()
+
+SPAN_FIELDS = ["dns", "connect", "tls", "ttfb", "total"]
+
+
+def resetConnectionTimings():
+    current.connection = {"dns": 0.0, "connect": 0.0, "tls": 0.0}
+
+
+def connectionTimings():
+    return getattr(current, "connection", None) or {"dns": 0.0, "connect": 0.0, "tls": 0.0}
+
+
+class TimedConnectionMixin(object):
+    """ Measures DNS resolution, TCP connect and TLS handshake of new
+    connections. Reused (keep-alive) connections report zero for all """
+
+    def _new_conn(self):
+        timings = connectionTimings()
+        start = time.time()
+        dns_host = self._dns_host
+        try:
+            address = socket.getaddrinfo(dns_host, self.port, 0, socket.SOCK_STREAM)[0][4][0]
+        except socket.error:
+            # Let urllib3 resolve again and raise its own error
+            return super(TimedConnectionMixin, self)._new_conn()
+        resolved = time.time()
+        # host is a property over _dns_host: connect to the resolved address,
+        # but restore the name before the TLS handshake uses it
+        self._dns_host = address
+        try:
+            conn = super(TimedConnectionMixin, self)._new_conn()
+        finally:
+            self._dns_host = dns_host
+        timings["dns"] = (resolved - start) * 1000
+        timings["connect"] = (time.time() - resolved) * 1000
+        current.connection = timings
+        return conn
+
+    def connect(self):
+        start = time.time()
+        super(TimedConnectionMixin, self).connect()
+        timings = connectionTimings()
+        if isinstance(self, HTTPSConnection):
+            timings["tls"] = max(0.0, (time.time() - start) * 1000 - timings["dns"] - timings["connect"])
+        current.connection = timings
+
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+def endpointTemplate(endpoint):
+    """ Groups endpoints by removing the query string, network and ids """
+    path = endpoint.split("?", 1)[0]
+    path = re.sub(r"/network/[^/]+", "/network/{network}", path)
+    path = re.sub(r"/policies/history/[^/]+", "/policies/history/{policyId}", path)
+    path = re.sub(r"/policies/(?!history)[^/]+", "/policies/{policyId}", path)
+    return path
+
+
+def percentile(values, fraction):
+    """ Nearest-rank percentile of a sorted list """
+    if not values:
+        return 0.0
+    # Rounded first, so float noise (0.07 * 100 = 7.000000000000001) does
+    # not move the rank up
+    rank = math.ceil(round(fraction * len(values), 9))
+    index = max(0, min(len(values) - 1, rank - 1))
+    return values[index]
+
+
+class TimingRecorder():
+    """ Collects one span per API request: method, endpoint template, status,
+    bytes, retries and the dns/connect/tls/ttfb/total latencies (ms) """
+
+    def __init__(self):
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def record(self, method, endpoint, status, size, retries, ttfb, total, timings=None):
+        timings = timings or {}
+        span = {"time": time.time(), "method": method, "endpoint": endpointTemplate(endpoint),
+                "status": status, "bytes": size, "retries": retries,
+                "dns": round(timings.get("dns", 0.0), 3),
+                "connect": round(timings.get("connect", 0.0), 3),
+                "tls": round(timings.get("tls", 0.0), 3),
+                "ttfb": round(ttfb, 3), "total": round(total, 3)}
+        with self.lock:
+            self.spans.append(span)
+        return span
+
+    def groups(self):
+        grouped = {}
+        with self.lock:
+            spans = list(self.spans)
+        for span in spans:
+            grouped.setdefault((span["method"], span["endpoint"]), []).append(span)
+        return sorted(grouped.items())
+
+    def summary(self, stream=sys.stderr):
+        """ Prints p50/p95/p99 total latency (and request counts, bytes and
+        retries) per endpoint """
+        stream.write("%-6s %-50s %6s %9s %9s %9s %10s %7s\n" % (
+            "METHOD", "ENDPOINT", "CALLS", "P50 ms", "P95 ms", "P99 ms", "BYTES", "RETRIES"))
+        for (method, endpoint), spans in self.groups():
+            totals = sorted(span["total"] for span in spans)
+            stream.write("%-6s %-50s %6d %9.1f %9.1f %9.1f %10d %7d\n" % (
+                method, endpoint, len(spans), percentile(totals, 0.50), percentile(totals, 0.95),
+                percentile(totals, 0.99), sum(span["bytes"] for span in spans),
+                sum(span["retries"] for span in spans)))
+
+    def writeSpans(self, file_name):
+        """ Appends the spans to a JSON lines file """
+        with self.lock:
+            spans = list(self.spans)
+        with open(file_name, "a") as spans_file:
+            for span in spans:
+                spans_file.write(json.dumps(span) + "\n")
+
+    def writePrometheus(self, file_name):
+        """ Writes the metrics for the node_exporter textfile collector. The
+        file is replaced atomically so it is never scraped half written """
+        lines = [
+            "# HELP akamai_im_api_requests_total API requests made by the last run.",
+            "# TYPE akamai_im_api_requests_total gauge",
+        ]
+        groups = self.groups()
+        for (method, endpoint), spans in groups:
+            statuses = {}
+            for span in spans:
+                statuses[span["status"]] = statuses.get(span["status"], 0) + 1
+            for status, count in sorted(statuses.items(), key=lambda item: str(item[0])):
+                lines.append('akamai_im_api_requests_total{method="%s",endpoint="%s",status="%s"} %d'
+                             % (method, endpoint, status, count))
+        lines += ["# HELP akamai_im_api_request_duration_seconds API request latency of the last run.",
+                  "# TYPE akamai_im_api_request_duration_seconds summary"]
+        for (method, endpoint), spans in groups:
+            labels = 'method="%s",endpoint="%s"' % (method, endpoint)
+            totals = sorted(span["total"] / 1000 for span in spans)
+            for quantile in [0.5, 0.95, 0.99]:
+                lines.append('akamai_im_api_request_duration_seconds{%s,quantile="%s"} %.6f'
+                             % (labels, quantile, percentile(totals, quantile)))
+            lines.append('akamai_im_api_request_duration_seconds_sum{%s} %.6f' % (labels, sum(totals)))
+            lines.append('akamai_im_api_request_duration_seconds_count{%s} %d' % (labels, len(totals)))
+        lines += ["# HELP akamai_im_api_response_bytes API response bytes of the last run.",
+                  "# TYPE akamai_im_api_response_bytes gauge"]
+        lines += ['akamai_im_api_response_bytes{method="%s",endpoint="%s"} %d'
+                  % (method, endpoint, sum(span["bytes"] for span in spans))
+                  for (method, endpoint), spans in groups]
+        lines += ["# HELP akamai_im_api_retries API request retries of the last run.",
+                  "# TYPE akamai_im_api_retries gauge"]
+        lines += ['akamai_im_api_retries{method="%s",endpoint="%s"} %d'
+                  % (method, endpoint, sum(span["retries"] for span in spans))
+                  for (method, endpoint), spans in groups]
+        lines += ["# HELP akamai_im_last_run_timestamp_seconds End of the last run.",
+                  "# TYPE akamai_im_last_run_timestamp_seconds gauge",
+                  "akamai_im_last_run_timestamp_seconds %d" % time.time()]
+
+        directory = os.path.dirname(os.path.abspath(file_name))
+        handle, temp_name = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(handle, "w") as metrics_file:
+            metrics_file.write("\n".join(lines) + "\n")
+        os.chmod(temp_name, 0o644)
+        os.replace(temp_name, file_name)
@@ -0,0 +1,140 @@
+# Python edgegrid module
+""" Copyright 2021 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+import ssl
+import socket
+import weakref
+import threading
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 120.0
+# Probe idle pooled connections, so dead ones are noticed before reuse
+KEEPALIVE_IDLE = 30
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_COUNT = 3
+
+
+def keepAliveSocketOptions():
+    """ Socket options of the pooled connections: urllib3's defaults
+    (TCP_NODELAY) plus TCP keep-alive probes where the platform has them """
+    options = list(HTTPConnection.default_socket_options)
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    for name, value in [("TCP_KEEPIDLE", KEEPALIVE_IDLE), ("TCP_KEEPINTVL", KEEPALIVE_INTERVAL),
+                        ("TCP_KEEPCNT", KEEPALIVE_COUNT)]:
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+class ResumingSSLSocket(ssl.SSLSocket):
+    """ SSL socket handing its TLS session back to its context when closed,
+    as TLS 1.3 session tickets only arrive after the handshake """
+
+    def close(self):
+        self.context.remember(self)
+        ssl.SSLSocket.close(self)
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """ SSL context that resumes the TLS session of the previous connection
+    to the same host, which saves a full handshake on every new pooled
+    connection. Configured like urllib3's default context (urllib3 checks
+    the host names itself) """
+    sslsocket_class = ResumingSSLSocket
+
+    def __new__(cls, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        context = ssl.SSLContext.__new__(cls, protocol)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_REQUIRED
+        context.options |= ssl.OP_NO_COMPRESSION
+        return context
+
+    def __init__(self, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.sockets = {}
+        self.resumed = 0
+
+    def remember(self, sock):
+        """ Keeps the session of a socket for its next connection """
+        try:
+            session = sock.session
+        except (ValueError, OSError, AttributeError):
+            return
+        if session is not None and sock.server_hostname is not None:
+            with self.lock:
+                self.sessions[sock.server_hostname] = session
+
+    def session(self, hostname):
+        """ Latest session of a host, asking the last socket again while it
+        is open """
+        reference = self.sockets.get(hostname)
+        sock = reference() if reference is not None else None
+        if sock is not None:
+            try:
+                if sock.session is not None:
+                    self.sessions[hostname] = sock.session
+            except (ValueError, OSError):
+                pass
+        return self.sessions.get(hostname)
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        hostname = kwargs.get("server_hostname")
+        if hostname is not None and kwargs.get("session") is None:
+            with self.lock:
+                kwargs["session"] = self.session(hostname)
+        wrapped = ssl.SSLContext.wrap_socket(self, sock, *args, **kwargs)
+        if hostname is not None:
+            with self.lock:
+                self.sockets[hostname] = weakref.ref(wrapped)
+                if wrapped.session_reused:
+                    self.resumed += 1
+        return wrapped
+
+
+class TransportAdapter(HTTPAdapter):
+    """ HTTPAdapter with a configurable connection pool, TCP keep-alive (or
+    one connection per request without it) and TLS session resumption.
+    With timed, connections also measure their setup (see timings) """
+
+    def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, keep_alive=True, ssl_context=None,
+                 timed=False):
+        # Used by init_poolmanager, which HTTPAdapter.__init__ calls
+        self.keep_alive = keep_alive
+        self.ssl_context = ssl_context
+        self.timed = timed
+        HTTPAdapter.__init__(self, pool_connections=pool_connections,
+                             pool_maxsize=pool_maxsize)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        if self.keep_alive:
+            pool_kwargs["socket_options"] = keepAliveSocketOptions()
+        if self.ssl_context is not None:
+            pool_kwargs["ssl_context"] = self.ssl_context
+        HTTPAdapter.init_poolmanager(self, connections, maxsize, block, **pool_kwargs)
+        if self.timed:
+            from timings import TimedHTTPConnectionPool, TimedHTTPSConnectionPool
+            self.poolmanager.pool_classes_by_scheme = {"http": TimedHTTPConnectionPool,
+                                                       "https": TimedHTTPSConnectionPool}
+
+    def add_headers(self, request, **kwargs):
+        if not self.keep_alive:
+            request.headers["Connection"] = "close"
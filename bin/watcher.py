@@ -0,0 +1,162 @@
+# Python edgegrid module
+""" Copyright 2021 Akamai Technologies, Inc. All Rights Reserved.
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+
+ You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+"""
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+
+logger = logging.getLogger(__name__)
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")
+
+DEFAULT_DEBOUNCE = 0.2
+DEFAULT_POLL_INTERVAL = 0.5
+
+
+class InotifyWatcher():
+    """ Reports the files written (closed after writing) or moved into a
+    directory, using the Linux inotify API through ctypes """
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory),
+                                  IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, "inotify_add_watch failed on %s" % directory)
+        self.directory = directory
+
+    def changes(self, timeout):
+        """ Names of the files changed within timeout seconds (empty if
+        none). None means that events were lost and everything may have
+        changed """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except OSError as error:
+            if error.errno == errno.EAGAIN:
+                return set()
+            raise
+        names = set()
+        offset = 0
+        while offset < len(buffer):
+            _, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            if mask & IN_Q_OVERFLOW:
+                return None
+            names.add(os.fsdecode(buffer[offset:offset + length].rstrip(b"\0")))
+            offset += length
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher():
+    """ Reports changed files by comparing the modification time and size
+    of the files of a directory at a regular interval """
+
+    def __init__(self, directory, interval=DEFAULT_POLL_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self.state = self.scan()
+
+    def scan(self):
+        state = {}
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            state[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return state
+
+    def changes(self, timeout):
+        deadline = time.time() + timeout
+        while True:
+            state = self.scan()
+            names = set(name for name, signature in state.items()
+                        if self.state.get(name) != signature)
+            self.state = state
+            remaining = deadline - time.time()
+            if names or remaining <= 0:
+                return names
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+class DirectoryWatcher():
+    """ Waits for changes to the JSON files of a directory, with inotify
+    when available and polling otherwise. Bursts of events (editors often
+    write a file several times when saving) are merged into one batch """
+
+    def __init__(self, directory, debounce=DEFAULT_DEBOUNCE, poll_interval=DEFAULT_POLL_INTERVAL,
+                 polling=False):
+        self.directory = directory
+        self.debounce = debounce
+        self.watcher = None
+        if not polling and sys.platform.startswith("linux"):
+            try:
+                self.watcher = InotifyWatcher(directory)
+            except (OSError, AttributeError) as error:
+                logger.debug("inotify unavailable, polling instead: %s", error)
+        if self.watcher is None:
+            self.watcher = PollingWatcher(directory, poll_interval)
+        self.mode = "inotify" if isinstance(self.watcher, InotifyWatcher) else "polling"
+
+    def allFiles(self):
+        return set(name for name in os.listdir(self.directory))
+
+    def wait(self, timeout=None):
+        """ Returns the names of the JSON files changed, once no more events
+        came for the debounce delay. Empty after timeout seconds (if any)
+        without changes """
+        deadline = None if timeout is None else time.time() + timeout
+        names = set()
+        while not names:
+            remaining = 1.0 if deadline is None else deadline - time.time()
+            if remaining <= 0:
+                return set()
+            changed = self.watcher.changes(remaining)
+            names = self.allFiles() if changed is None else changed
+        while True:
+            changed = self.watcher.changes(self.debounce)
+            if changed is not None and not changed:
+                break
+            names |= self.allFiles() if changed is None else changed
+        return set(name for name in names if name.endswith(".json"))
+
+    def close(self):
+        self.watcher.close()
@@ -0,0 +1,125 @@
+""" The CLI modules live in bin/ and import each other as top-level modules """
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bin"))
+
+import json
+from urllib.parse import urlsplit
+
+import pytest
+import requests
+
+POLICIES_PATH = "/imaging/v2/network/"
+
+
+class FakeImagingSession(requests.Session):
+    """ In-memory stand-in for the Imaging API policy endpoints, keyed by
+    policy set (Luna-Token header) and network. failures maps a (method,
+    path) to the status its calls fail with """
+
+    def __init__(self):
+        requests.Session.__init__(self)
+        self.policies = {}
+        self.failures = {}
+        self.calls = []
+
+    def addPolicy(self, lunaToken, network, policy):
+        self.policies.setdefault((lunaToken, network), {})[policy["id"]] = dict(policy)
+
+    def request(self, method, url, params=None, data=None, headers=None, **kwargs):
+        path = urlsplit(url).path
+        self.calls.append((method, path))
+        if (method, path) in self.failures:
+            return self.response(self.failures[(method, path)], {"detail": "Injected failure"})
+        network, _, rest = path[len(POLICIES_PATH):].partition("/policies")
+        key = ((headers or {}).get("Luna-Token"), network)
+        policies = self.policies.setdefault(key, {})
+        name = rest.lstrip("/")
+        if not name:
+            return self.response(200, {"items": list(policies.values()),
+                                       "totalItems": len(policies)})
+        if method == "GET":
+            if name not in policies:
+                return self.response(404, {"detail": "Policy %s not found" % name})
+            return self.response(200, policies[name])
+        if method == "PUT":
+            previous = policies.get(name)
+            policy = json.loads(data)
+            policy.update({"id": name, "version": previous["version"] + 1 if previous else 1})
+            policies[name] = policy
+            return self.response(200, {"operationPerformed": "UPDATED" if previous else "CREATED",
+                                       "id": name})
+        if method == "DELETE":
+            policies.pop(name, None)
+            return self.response(200, {"operationPerformed": "DELETED", "id": name})
+        return self.response(405, {"detail": "Unsupported"})
+
+    def response(self, status, body):
+        response = requests.Response()
+        response.status_code = status
+        response.headers["content-type"] = "application/json"
+        response._content = json.dumps(body).encode("utf-8")
+        response._content_consumed = True
+        return response
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """ Points the commands of common to a FakeImagingSession """
+    import common
+    from http_calls import EdgeGridHttpCaller
+    session = FakeImagingSession()
+    monkeypatch.setattr(common, "session", session)
+    monkeypatch.setattr(common, "HttpCaller",
+                        EdgeGridHttpCaller(session, False, False, "https://example.com/",
+                                           max_retries=0))
+    monkeypatch.setattr(common, "transport", {"pool_maxsize": 100, "keep_alive": True})
+    monkeypatch.setattr(common, "baseurl", "https://example.com/")
+    monkeypatch.setattr(common, "max_retries", 0)
+    return session
+
+
+class FakeAsyncResponse():
+    """ aiohttp response of a FakeImagingSession response """
+
+    def __init__(self, response):
+        self.status = response.status_code
+        self.headers = response.headers
+        self.body = response.content
+        self.content = self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def read(self):
+        return self.body
+
+    async def iter_chunked(self, size):
+        for start in range(0, len(self.body), size):
+            yield self.body[start:start + size]
+
+
+class FakeAsyncClient():
+    """ aiohttp client session serving the requests of a FakeImagingSession """
+
+    def __init__(self, session):
+        self.session = session
+
+    def request(self, method, url, data=None, headers=None):
+        return FakeAsyncResponse(self.session.request(method, url, data=data, headers=headers))
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture(params=[False, True], ids=["threads", "async"])
+def use_async(request, api, monkeypatch):
+    """ Runs a test with the thread pool, then with the asyncio caller """
+    if request.param:
+        aiohttp = pytest.importorskip("aiohttp")
+        monkeypatch.setattr(aiohttp, "ClientSession", lambda **kwargs: FakeAsyncClient(api))
+    return request.param
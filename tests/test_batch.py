@@ -0,0 +1,61 @@
+import io
+import json
+import socket
+from types import SimpleNamespace
+
+import pytest
+
+import common
+
+
+class FakeCaller():
+    """ Answers GETs, fails PUTs the way httpErrors does on a 400 """
+
+    def getResult(self, endpoint, parameters=None, cached=True, headers=None):
+        return {"items": [], "endpoint": endpoint}
+
+    def putResult(self, endpoint, body, parameters=None, headers=None):
+        raise SystemExit("ERROR: Call to %s failed with a 400 result\n"
+                         "ERROR: Problem details: Bad Request\n" % endpoint)
+
+
+@pytest.fixture
+def batch(monkeypatch):
+    monkeypatch.setattr(common, "config", SimpleNamespace(account_key='', policy_set="ps1",
+                                                          no_validate=True))
+    monkeypatch.setattr(common, "HttpCaller", FakeCaller())
+
+
+def test_failed_calls_are_errors(batch):
+    output = io.StringIO()
+    failures = common.runBatch([
+        json.dumps({"id": 1, "command": "list-policies", "network": "staging"}),
+        json.dumps({"id": 2, "command": "set-policy", "name": "p1", "policy": {}}),
+        "not json",
+    ], output)
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert failures == 2
+    assert [result["status"] for result in results] == ["ok", "error", "error"]
+    assert "400" in results[1]["error"]
+
+
+def test_serve_refuses_other_files(tmp_path):
+    regular = tmp_path / "batch.sock"
+    regular.write_text("keep me")
+    with pytest.raises(SystemExit):
+        common.serveBatch(str(regular))
+    assert regular.read_text() == "keep me"
+
+
+def test_serve_replaces_stale_socket(tmp_path, monkeypatch):
+    path = str(tmp_path / "batch.sock")
+    stale = socket.socket(socket.AF_UNIX)
+    stale.bind(path)
+    stale.close()
+
+    def serve_forever(self):
+        raise KeyboardInterrupt
+
+    import socketserver
+    monkeypatch.setattr(socketserver.UnixStreamServer, "serve_forever", serve_forever)
+    common.serveBatch(path)
@@ -0,0 +1,52 @@
+import os
+import time
+
+from cache import ResponseCache
+
+
+def entryFiles(cache):
+    return sorted(name for name in os.listdir(cache.directory) if name.endswith(".json"))
+
+
+def test_get_set_and_expiry(tmp_path):
+    cache = ResponseCache(str(tmp_path), ttl=60)
+    key = cache.key("https://example.com/", "token", "/policies")
+    assert cache.get(key) is None
+    cache.set(key, {"items": [1]})
+    assert cache.get(key) == {"items": [1]}
+    assert cache.get(cache.key("https://example.com/", "other", "/policies")) is None
+    cache.ttl = 0
+    time.sleep(0.01)
+    assert cache.get(key) is None
+    assert entryFiles(cache) == []
+
+
+def test_refresh_skips_reads(tmp_path):
+    cache = ResponseCache(str(tmp_path), refresh=True)
+    cache.set("k", {"a": 1})
+    assert cache.get("k") is None
+    assert entryFiles(cache) == ["k.json"]
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    body = {"data": "x" * 1000}
+    cache = ResponseCache(str(tmp_path), max_size=2500.0 / (1024 * 1024))
+    for index, key in enumerate(["a", "b"]):
+        cache.set(key, body)
+        os.utime(cache.path(key), (1000 + index, 1000 + index))
+    # Reading "a" makes "b" the least recently used entry
+    assert cache.get("a") == body
+    cache.set("c", body)
+    assert entryFiles(cache) == ["a.json", "c.json"]
+    assert cache.size <= cache.max_size
+
+
+def test_raw_entries(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.set("raw", {"id": "p1"}, b'{"id":"p1"}')
+    assert cache.get("raw") == {"id": "p1"}
+    assert cache.getRaw("raw") == b'{"id":"p1"}'
+    cache.set("decoded", {"id": "p1"})
+    assert cache.get("decoded") == {"id": "p1"}
+    assert cache.getRaw("decoded") is None
+    assert cache.getRaw("missing") is None
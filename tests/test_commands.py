@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+import common
+
+
+@pytest.mark.parametrize("command, expected", [
+    (SimpleNamespace(command="query-policies"), False),
+    (SimpleNamespace(command="diff-policies", source="dir1", target="snapshot.json"), False),
+    (SimpleNamespace(command="diff-policies", source="dir1", target="staging"), True),
+    (SimpleNamespace(command="set-policy", validate_only=True), False),
+    (SimpleNamespace(command="set-policy", validate_only=False), True),
+    (SimpleNamespace(command="sync-policies", validate_only=True), False),
+    (SimpleNamespace(command="sync-policies", validate_only=False), True),
+    (SimpleNamespace(command="list-policies"), True),
+])
+def test_api_commands(monkeypatch, command, expected):
+    monkeypatch.setattr(common, "config", command)
+    assert common.apiCommand() == expected
+
+
+@pytest.mark.parametrize("arguments, required", [
+    (["diff-policies", "dir1", "dir2"], False),
+    (["diff-policies", "dir1", "staging"], True),
+    (["query-policies", "video"], False),
+    (["list-policies"], True),
+])
+def test_policy_set_requirement(tmp_path, arguments, required):
+    edgerc = tmp_path / "edgerc"
+    edgerc.write_text("[image-manager]\nhost = akab-test.luna.akamaiapis.net\n"
+                      "client_token = a\nclient_secret = b\naccess_token = c\n")
+    for directory in ["dir1", "dir2"]:
+        (tmp_path / directory).mkdir()
+    script = os.path.join(os.path.dirname(common.__file__), "akamai-image-manager")
+    result = subprocess.run([sys.executable, script, "-e", str(edgerc)] + arguments,
+                            capture_output=True, text=True, cwd=str(tmp_path),
+                            env=dict(os.environ, AKAMAI_CLI_HOME=str(tmp_path)))
+    assert ("required: --policy-set" in result.stderr) == required
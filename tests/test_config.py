@@ -0,0 +1,74 @@
+""" The command line and the credentials file are parsed by EdgeGridConfig,
+whose argument parser can only be set up once per process, so each
+configuration is loaded by a separate interpreter """
+import json
+import os
+import subprocess
+import sys
+
+BIN_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bin")
+
+SETTINGS = """
+import sys, json
+sys.path.insert(0, %r)
+import common
+sys.argv = ["akamai-image-manager"] + json.loads(sys.argv[1])
+common.loadConfig()
+common.connect()
+adapter = common.session.get_adapter("https://example.com/")
+print(json.dumps({
+    "cache": common.cache,
+    "max_retries": common.HttpCaller.max_retries,
+    "timeout": common.HttpCaller.timeout,
+    "pool_connections": adapter._pool_connections,
+    "pool_maxsize": adapter.poolmanager.connection_pool_kw["maxsize"],
+    "keep_alive": "socket_options" in adapter.poolmanager.connection_pool_kw,
+    "tls_session_reuse": adapter.ssl_context is not None,
+}))
+""" % BIN_DIR
+
+
+def loadSettings(tmp_path, edgerc_keys, arguments):
+    edgerc = tmp_path / "edgerc"
+    edgerc.write_text("[image-manager]\nhost = akab-test.luna.akamaiapis.net\nclient_token = akab-client\n"
+                      "client_secret = c2VjcmV0\naccess_token = akab-access\ncache_dir = %s\n"
+                      % (tmp_path / "cache") +
+                      "".join("%s = %s\n" % item for item in edgerc_keys.items()))
+    command = ["-e", str(edgerc)] + arguments + \
+        ["--policy-set", "example_com", "list-policies"]
+    result = subprocess.run([sys.executable, "-c", SETTINGS, json.dumps(command)],
+                            capture_output=True, text=True, cwd=str(tmp_path))
+    assert result.returncode == 0 and result.stdout, result.stderr
+    return json.loads(result.stdout)
+
+
+def test_credentials_file_settings(tmp_path):
+    settings = loadSettings(tmp_path, {"pool_maxsize": 20, "read_timeout": 30,
+                                       "max_retries": 1, "keep_alive": "False"}, [])
+    assert settings["pool_maxsize"] == 20
+    assert settings["timeout"] == [10.0, 30.0]
+    assert settings["max_retries"] == 1
+    assert settings["keep_alive"] is False
+
+
+def test_command_line_overrides_credentials_file(tmp_path):
+    settings = loadSettings(tmp_path, {"pool_maxsize": 20, "pool_connections": 4,
+                                       "connect_timeout": 5, "read_timeout": 30,
+                                       "max_retries": 1, "keep_alive": "True",
+                                       "tls_session_reuse": "True"},
+                            ["--pool-maxsize", "40", "--pool-connections", "8",
+                             "--connect-timeout", "2", "--read-timeout", "60",
+                             "--max-retries", "5", "--no-keep-alive", "--no-tls-session-reuse"])
+    assert settings["pool_maxsize"] == 40
+    assert settings["pool_connections"] == 8
+    assert settings["timeout"] == [2.0, 60.0]
+    assert settings["max_retries"] == 5
+    assert settings["keep_alive"] is False
+    assert settings["tls_session_reuse"] is False
+
+
+def test_cache_flag_with_credentials_file_key(tmp_path):
+    assert loadSettings(tmp_path, {"cache": "True"}, ["--cache"])["cache"] is True
+    assert loadSettings(tmp_path, {"cache": "False"}, ["--cache"])["cache"] is True
+    assert loadSettings(tmp_path, {"cache": "True"}, [])["cache"] is True
+    assert loadSettings(tmp_path, {"cache": "True"}, ["--no-cache"])["cache"] is False
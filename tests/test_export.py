@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+import common
+
+POLICIES = [{"id": "p%d" % index, "version": 1, "breakpoints": {"widths": [320 * index]}}
+            for index in range(1, 4)]
+
+
+@pytest.fixture
+def policies(api):
+    for policy in POLICIES:
+        api.addPolicy("example_com", "staging", policy)
+    return api
+
+
+@pytest.mark.parametrize("pretty", [False, True])
+def test_export_writes_every_policy(policies, use_async, tmp_path, pretty):
+    output_dir = tmp_path / "export"
+    result = common.exportPolicies("example_com", "staging", str(output_dir), 2,
+                                   use_async=use_async, pretty=pretty)
+    assert [(name, error) for name, _, error in result] == [("p1", None), ("p2", None),
+                                                            ("p3", None)]
+    for policy in POLICIES:
+        text = (output_dir / (policy["id"] + ".json")).read_text()
+        assert json.loads(text) == policy
+        assert ("\n  " in text) == pretty
+    assert sorted(path.name for path in output_dir.iterdir()) == ["p1.json", "p2.json", "p3.json"]
+
+
+@pytest.mark.parametrize("pretty", [False, True])
+def test_failed_downloads_leave_no_file(policies, use_async, tmp_path, pretty):
+    policies.failures[("GET", "/imaging/v2/network/staging/policies/p2")] = 404
+    output_dir = tmp_path / "export"
+    result = common.exportPolicies("example_com", "staging", str(output_dir), 2,
+                                   use_async=use_async, pretty=pretty)
+    errors = dict((name, error) for name, _, error in result)
+    assert errors["p1"] is None and errors["p3"] is None
+    assert "404" in errors["p2"]
+    assert [name for name, file_name, _ in result if file_name is None] == ["p2"]
+    assert sorted(path.name for path in output_dir.iterdir()) == ["p1.json", "p3.json"]
@@ -0,0 +1,16 @@
+from history_store import HistoryStore, DEFAULT_HISTORY_DIR
+from cache import DEFAULT_CACHE_DIR
+
+
+def test_history_is_not_in_the_cache():
+    assert not DEFAULT_HISTORY_DIR.startswith(DEFAULT_CACHE_DIR)
+
+
+def test_logs_are_per_account(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    content_hash = store.putObject({"id": "p1", "version": 3, "breakpoints": {"widths": [320]}})
+    store.writeLog("1-ABC:1-DEF", "ps1", "staging", "p1", {"3": {"hash": content_hash}})
+    assert store.latestVersion("1-ABC:1-DEF", "ps1", "staging", "p1") == 3
+    assert store.latestVersion("", "ps1", "staging", "p1") == 0
+    assert store.latestVersion("1-XYZ", "ps1", "staging", "p1") == 0
+    assert store.getObject(content_hash) == {"breakpoints": {"widths": [320]}}
@@ -0,0 +1,253 @@
+import asyncio
+import json
+import threading
+
+import pytest
+import requests
+
+from cache import ResponseCache
+from http_calls import EdgeGridHttpCaller, AdaptiveLimiter
+
+
+class FailingSession(requests.Session):
+    """ Session whose requests fail with a given exception """
+
+    def __init__(self, error):
+        requests.Session.__init__(self)
+        self.error = error
+
+    def request(self, *args, **kwargs):
+        raise self.error
+
+
+def caller(session):
+    return EdgeGridHttpCaller(session, False, False, "https://example.com/", max_retries=0)
+
+
+@pytest.mark.parametrize("status", [400, 401, 409, 422])
+def test_client_errors_exit(status):
+    with pytest.raises(SystemExit):
+        caller(requests.Session()).httpErrors(status, "/policies/p1", {"detail": "Bad"})
+
+
+def test_success_passes():
+    caller(requests.Session()).httpErrors(200, "/policies/p1", {"id": "p1"})
+
+
+@pytest.mark.parametrize("error", [requests.exceptions.InvalidURL("bad"),
+                                   requests.exceptions.ChunkedEncodingError("cut"),
+                                   requests.exceptions.ConnectionError("refused")])
+def test_send_releases_limiter_slot(error):
+    http_caller = caller(FailingSession(error))
+    http_caller.limiter = AdaptiveLimiter(1)
+    for _ in range(3):
+        with pytest.raises(type(error)):
+            http_caller.send("GET", "/policies")
+    assert http_caller.limiter.in_flight == 0
+
+
+def test_async_request_releases_limiter_slot():
+    aiohttp = pytest.importorskip("aiohttp")
+    from async_http_calls import AsyncEdgeGridHttpCaller, AsyncAdaptiveLimiter
+
+    class FailingClient():
+        def request(self, *args, **kwargs):
+            return self
+
+        async def __aenter__(self):
+            raise aiohttp.ClientPayloadError("truncated body")
+
+        async def __aexit__(self, *exc_info):
+            return False
+
+    async def run():
+        http_caller = AsyncEdgeGridHttpCaller(requests.Session(), False, False,
+                                              "https://example.com/", max_retries=0)
+        http_caller.client = FailingClient()
+        http_caller.limiter = AsyncAdaptiveLimiter(1)
+        for _ in range(3):
+            with pytest.raises(aiohttp.ClientPayloadError):
+                await http_caller.request("GET", "/policies")
+        return http_caller.limiter.in_flight
+
+    assert asyncio.run(run()) == 0
+
+
+def test_async_download_retry_rewrites_body(tmp_path, monkeypatch):
+    aiohttp = pytest.importorskip("aiohttp")
+    import async_http_calls
+    from async_http_calls import AsyncEdgeGridHttpCaller, AsyncAdaptiveLimiter
+    monkeypatch.setattr(async_http_calls, "retryDelay", lambda headers, attempt: 0)
+
+    class Content():
+        def __init__(self, fail):
+            self.fail = fail
+
+        async def iter_chunked(self, size):
+            yield b'{"id": "p1", '
+            if self.fail:
+                raise aiohttp.ServerDisconnectedError()
+            yield b'"version": 2}'
+
+    class FlakyClient():
+        """ Drops the connection in the middle of the first body """
+        attempts = 0
+
+        def request(self, *args, **kwargs):
+            self.attempts += 1
+            self.status, self.headers = 200, {}
+            self.content = Content(self.attempts == 1)
+            return self
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc_info):
+            return False
+
+    async def run(output):
+        http_caller = AsyncEdgeGridHttpCaller(requests.Session(), False, False,
+                                              "https://example.com/", max_retries=1)
+        http_caller.client = FlakyClient()
+        http_caller.limiter = AsyncAdaptiveLimiter(1)
+        return await http_caller.request("GET", "/policies/p1", output=output)
+
+    file_name = tmp_path / "p1.json"
+    with open(str(file_name), "wb") as output:
+        status, _ = asyncio.run(run(output))
+    assert status == 200
+    assert file_name.read_bytes() == b'{"id": "p1", "version": 2}'
+
+
+class JSONSession(requests.Session):
+    """ Session answering every request with a JSON body """
+
+    def __init__(self, body):
+        requests.Session.__init__(self)
+        self.body = body
+        self.calls = 0
+
+    def request(self, *args, **kwargs):
+        self.calls += 1
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["content-type"] = "application/json"
+        response._content = json.dumps(self.body).encode("utf-8")
+        response._content_consumed = True
+        return response
+
+
+@pytest.mark.parametrize("cached, store, calls, stored", [(True, True, 1, 1),
+                                                           (False, True, 2, 1),
+                                                           (True, False, 2, 0)])
+def test_get_result_cache(tmp_path, cached, store, calls, stored):
+    session = JSONSession({"items": []})
+    http_caller = caller(session)
+    http_caller.cache = ResponseCache(str(tmp_path))
+    for _ in range(2):
+        assert http_caller.getResult("/images", {"limit": 1}, cached=cached,
+                                     store=store) == {"items": []}
+    assert session.calls == calls
+    assert len(list(tmp_path.glob("*.json"))) == stored
+
+
+def test_limiter_halves_once_per_cooldown():
+    limiter = AdaptiveLimiter(8, cooldown=60)
+    limiter.adjust(True)
+    limiter.adjust(True)
+    assert limiter.limit == 4
+    for _ in range(5):
+        limiter.last_decrease = 0.0
+        limiter.adjust(True)
+    assert limiter.limit == limiter.min_limit == 1
+
+
+def test_limiter_grows_back_to_its_maximum():
+    limiter = AdaptiveLimiter(4)
+    limiter.limit = 2.0
+    # One slot for every limit's worth of successful calls
+    limiter.adjust(False)
+    limiter.adjust(False)
+    assert int(limiter.limit) == 2
+    for _ in range(20):
+        limiter.adjust(False)
+    assert limiter.limit == 4
+
+
+def test_limiter_blocks_over_its_limit():
+    limiter = AdaptiveLimiter(2)
+    limiter.acquire()
+    limiter.acquire()
+    acquired = threading.Event()
+    worker = threading.Thread(target=lambda: (limiter.acquire(), acquired.set()))
+    worker.start()
+    assert not acquired.wait(0.05)
+    limiter.release()
+    assert acquired.wait(1)
+    worker.join()
+    assert limiter.in_flight == 2
+
+
+def test_async_attempts_are_signed_once_they_get_a_slot(monkeypatch):
+    pytest.importorskip("aiohttp")
+    import async_http_calls
+    from async_http_calls import AsyncEdgeGridHttpCaller, AsyncAdaptiveLimiter
+    monkeypatch.setattr(async_http_calls, "retryDelay", lambda headers, attempt: 0)
+    events = []
+
+    class RecordingLimiter(AsyncAdaptiveLimiter):
+        async def acquire(self):
+            await AsyncAdaptiveLimiter.acquire(self)
+            events.append("acquire")
+
+        async def release(self, throttled=False):
+            events.append("release")
+            await AsyncAdaptiveLimiter.release(self, throttled)
+
+    def sign(request):
+        events.append("sign")
+        return request
+
+    class ThrottlingClient():
+        """ Throttles the first attempt """
+        statuses = [429, 200]
+
+        def request(self, *args, **kwargs):
+            self.status, self.headers = self.statuses.pop(0), {}
+            return self
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc_info):
+            return False
+
+        async def read(self):
+            return b'{}'
+
+    async def run():
+        session = requests.Session()
+        session.auth = sign
+        http_caller = AsyncEdgeGridHttpCaller(session, False, False, "https://example.com/",
+                                              max_retries=1)
+        http_caller.client = ThrottlingClient()
+        http_caller.limiter = RecordingLimiter(1)
+        return await http_caller.request("GET", "/policies")
+
+    assert asyncio.run(run()) == (200, {})
+    assert events == ["acquire", "sign", "release"] * 2
+
+
+def test_get_raw_writes_the_same_bytes_when_cached(tmp_path):
+    session = JSONSession({"id": "p1", "output": {"quality": 80}})
+    http_caller = caller(session)
+    http_caller.cache = ResponseCache(str(tmp_path / "cache"))
+    outputs = []
+    for _ in range(2):
+        with open(str(tmp_path / "p1.json"), "wb") as output:
+            http_caller.getRaw("/policies/p1", output)
+        outputs.append((tmp_path / "p1.json").read_bytes())
+        # Caches the response for the next round
+        http_caller.getResult("/policies/p1")
+    assert session.calls == 2
+    assert outputs[0] == outputs[1] == json.dumps(session.body).encode("utf-8")
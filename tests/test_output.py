@@ -0,0 +1,99 @@
+import io
+import json
+
+import pytest
+
+from output import fieldValue, fieldText, outputWriter, TableWriter, CsvWriter, NdjsonWriter
+
+POLICY = {"id": "HeroBanner", "version": 3, "user": "jdoe",
+          "breakpoints": {"widths": [320, 640]},
+          "transformations": [{"transformation": "Resize", "width": 640}]}
+
+
+@pytest.mark.parametrize("field, value", [
+    ("id", "HeroBanner"),
+    ("breakpoints.widths", [320, 640]),
+    ("breakpoints.widths.1", 640),
+    ("transformations.0.transformation", "Resize"),
+    ("breakpoints.widths.2", None),
+    ("breakpoints.heights", None),
+    ("id.length", None),
+    ("transformations.first", None),
+])
+def test_field_value(field, value):
+    assert fieldValue(POLICY, field) == value
+
+
+def test_field_text():
+    assert fieldText(None) == ""
+    assert fieldText(3) == "3"
+    assert fieldText({"widths": [320, 640]}) == '{"widths":[320,640]}'
+
+
+def write(writer, items):
+    for item in items:
+        writer.writeItem(item)
+    writer.close()
+
+
+def test_table():
+    stream = io.StringIO()
+    write(TableWriter(stream, ["id", "user"]), [POLICY, {"id": "a" * 35}])
+    assert stream.getvalue() == (
+        "+--------------------------------+---------------------------+\n"
+        "|          Policy name           |           User            |\n"
+        "+================================+===========================+\n"
+        "|           HeroBanner           |           jdoe            |\n"
+        "+--------------------------------+---------------------------+\n"
+        "| aaaaaaaaaaaaaaaaaaaaaaaaaaaaaa |                           |\n"
+        "|             aaaaa              |                           |\n"
+        "+--------------------------------+---------------------------+\n")
+
+
+def test_empty_table_has_a_header():
+    stream = io.StringIO()
+    write(TableWriter(stream, ["id"]), [])
+    assert stream.getvalue() == ("+--------------------------------+\n"
+                                 "|          Policy name           |\n"
+                                 "+================================+\n")
+
+
+def test_csv():
+    stream = io.StringIO()
+    write(CsvWriter(stream, ["id", "breakpoints.widths", "user"]),
+          [POLICY, {"id": "p, 2"}])
+    assert stream.getvalue().splitlines() == ["id,breakpoints.widths,user",
+                                              'HeroBanner,"[320,640]",jdoe',
+                                              '"p, 2",,']
+
+
+def test_ndjson():
+    stream = io.StringIO()
+    write(NdjsonWriter(stream), [POLICY])
+    write(NdjsonWriter(stream, ["id", "breakpoints.widths.0", "hosts"]), [POLICY])
+    lines = stream.getvalue().splitlines()
+    assert json.loads(lines[0]) == POLICY
+    assert json.loads(lines[1]) == {"id": "HeroBanner", "breakpoints.widths.0": 320,
+                                    "hosts": None}
+
+
+@pytest.mark.parametrize("output_type, writer_class, fields", [
+    ("text", TableWriter, ["id", "dateCreated", "user"]),
+    ("csv", CsvWriter, ["network", "id", "version", "dateCreated", "user"]),
+    ("ndjson", NdjsonWriter, None),
+])
+def test_output_writer_defaults(output_type, writer_class, fields):
+    writer = outputWriter(output_type, io.StringIO())
+    assert isinstance(writer, writer_class)
+    assert writer.fields == fields
+
+
+def test_format_output(capsys):
+    import common
+    policyList = {"items": [POLICY], "totalItems": 1}
+    common.formatOutput(policyList, "csv", None, "staging")
+    assert capsys.readouterr().out.splitlines() == ["network,id,version,dateCreated,user",
+                                                    "staging,HeroBanner,3,,jdoe"]
+    common.formatOutput(policyList, "json", ["id", "breakpoints.widths"])
+    assert json.loads(capsys.readouterr().out) == {
+        "items": [{"id": "HeroBanner", "breakpoints.widths": [320, 640]}], "totalItems": 1}
@@ -0,0 +1,57 @@
+import pytest
+
+from pagination import pages, CursorFile
+
+LISTING = {None: ([1, 2], "c1"), "c1": ([3, 4], "c2"), "c2": ([5], None)}
+
+
+@pytest.mark.parametrize("prefetch", [True, False])
+def test_pages(prefetch):
+    fetched = []
+
+    def fetch(cursor):
+        fetched.append(cursor)
+        return LISTING[cursor]
+    assert list(pages(fetch, prefetch=prefetch)) == [(None, [1, 2], "c1"),
+                                                     ("c1", [3, 4], "c2"),
+                                                     ("c2", [5], None)]
+    assert fetched == [None, "c1", "c2"]
+
+
+def test_pages_resume_from_cursor():
+    assert [items for _, items, _ in pages(LISTING.get, "c1")] == [[3, 4], [5]]
+
+
+def test_repeated_cursor_stops_the_listing():
+    listing = pages(lambda cursor: ([1], "same"), "same")
+    with pytest.raises(ValueError):
+        next(listing)
+
+
+def test_abandoned_listing_stops_prefetching():
+    fetched = []
+
+    def fetch(cursor):
+        fetched.append(cursor)
+        return LISTING[cursor]
+    listing = pages(fetch)
+    next(listing)
+    listing.close()
+    assert fetched in [[None], [None, "c1"]]
+
+
+def test_cursor_file(tmp_path):
+    cursor_file = CursorFile(str(tmp_path / "images.cursor"))
+    assert cursor_file.read() is None
+    cursor_file.save("c1", 120, 2)
+    cursor_file.save("c2", 240, 4)
+    assert cursor_file.read() == {"cursor": "c2", "offset": 240, "items": 4}
+    assert [path.name for path in tmp_path.iterdir()] == ["images.cursor"]
+    cursor_file.remove()
+    cursor_file.remove()
+    assert cursor_file.read() is None
+
+
+def test_corrupt_cursor_file(tmp_path):
+    (tmp_path / "images.cursor").write_text("{")
+    assert CursorFile(str(tmp_path / "images.cursor")).read() is None
@@ -0,0 +1,129 @@
+import pytest
+
+import common
+from policy_index import PolicyIndex, parseFilter, matchesFilter
+
+POLICY = {"id": "HeroBanner", "version": 3, "video": False,
+          "breakpoints": {"widths": [320, 640, 5000]},
+          "output": {"perceptualQuality": "mediumHigh", "allowedFormats": ["webp", "jpeg"]},
+          "transformations": [{"transformation": "Compound", "transformations": [
+              {"transformation": "Composite", "image": {"url": "https://example.com/logo.png"}}]}]}
+
+
+@pytest.mark.parametrize("text, parsed", [
+    ("video", (["video"], None, None)),
+    ("output.quality = 80", (["output", "quality"], "=", 80)),
+    ("id!=HeroBanner", (["id"], "!=", "HeroBanner")),
+    ("breakpoints.widths.* >= 3000", (["breakpoints", "widths", "*"], ">=", 3000)),
+    ("output.allowedFormats = [\"webp\"]", (["output", "allowedFormats"], "=", ["webp"])),
+    ("id ~ Hero", (["id"], "~", "Hero")),
+])
+def test_parse_filter(text, parsed):
+    assert parseFilter(text) == parsed
+
+
+def test_parse_invalid_filter():
+    with pytest.raises(ValueError):
+        parseFilter("= 3")
+
+
+@pytest.mark.parametrize("text, matches", [
+    ("video", True),
+    ("hosts", False),
+    ("video = false", True),
+    ("video != false", False),
+    ("version = 3", True),
+    ("version > 3", False),
+    ("version >= 3", True),
+    ("version < 4", True),
+    ("version <= 2", False),
+    ("video < 1", False),
+    ("id > 3", False),
+    ("id ~ Banner", True),
+    ("output.allowedFormats ~ webp", True),
+    ("output.allowedFormats ~ avif", False),
+    ("output.perceptualQuality = mediumHigh", True),
+    ("breakpoints.widths.* > 3000", True),
+    ("breakpoints.widths.0 > 3000", False),
+    ("breakpoints.widths.9 > 0", False),
+    ("transformations.*.transformation = Composite", False),
+    ("**.transformation = Composite", True),
+    ("**.image.url ~ logo", True),
+    ("output.quality.value = 1", False),
+])
+def test_matches_filter(text, matches):
+    assert matchesFilter(POLICY, parseFilter(text)) == matches
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = PolicyIndex(str(tmp_path / "data" / "policies.db"))
+    yield index
+    index.close()
+
+
+def test_stale_names(index):
+    items = [{"id": "a", "version": 1, "dateCreated": "d1"},
+             {"id": "b", "version": 1, "dateCreated": "d1"}]
+    assert index.staleNames("", "example_com", "staging", items) == (["a", "b"], [])
+    index.update("", "example_com", "staging", dict((item["id"], item) for item in items))
+    assert index.staleNames("", "example_com", "staging", items) == ([], [])
+    # Other policy sets, networks and accounts are indexed apart
+    assert index.staleNames("", "example_com", "production", items) == (["a", "b"], [])
+    assert index.staleNames("B-1", "example_com", "staging", items) == (["a", "b"], [])
+    changed = [{"id": "a", "version": 2, "dateCreated": "d2"}, {"id": "c", "version": 1}]
+    assert index.staleNames("", "example_com", "staging", changed) == (["a", "c"], ["b"])
+
+
+def test_update_and_policies(index):
+    index.update("", "example_com", "staging", {"a": {"id": "a"}, "b": {"id": "b"}})
+    index.update("", "example_com", "production", {"a": {"id": "a", "version": 2}})
+    index.update("", "other_com", "staging", {"hero": {"id": "hero"}})
+    assert [(policy_set, network, policy["id"]) for policy_set, network, policy
+            in index.policies()] == [("example_com", "production", "a"),
+                                     ("example_com", "staging", "a"),
+                                     ("example_com", "staging", "b"),
+                                     ("other_com", "staging", "hero")]
+    index.update("", "example_com", "staging", {}, removed=["a"])
+    assert [policy["id"] for _, _, policy in index.policies("example_com", "staging")] == ["b"]
+    assert [policy["id"] for _, _, policy in index.policies(name_pattern="h*")] == ["hero"]
+
+
+def fetchedNames(api):
+    return sorted(path.rsplit("/", 1)[1] for method, path in api.calls
+                  if method == "GET" and not path.endswith("/policies"))
+
+
+def test_index_fetches_changed_policies_only(api, index, use_async):
+    for name in ["a", "b", "c"]:
+        api.addPolicy("example_com", "staging", {"id": name, "version": 1})
+    result = common.indexPolicies("example_com", ["staging"], 4, index, use_async=use_async)
+    assert result == [("staging", 3, 0, 0, [])]
+    assert fetchedNames(api) == ["a", "b", "c"]
+
+    api.calls = []
+    assert common.indexPolicies("example_com", ["staging"], 4, index,
+                                use_async=use_async) == [("staging", 0, 3, 0, [])]
+    assert fetchedNames(api) == []
+
+    api.calls = []
+    api.addPolicy("example_com", "staging", {"id": "b", "version": 2, "video": True})
+    del api.policies[("example_com", "staging")]["c"]
+    assert common.indexPolicies("example_com", ["staging"], 4, index,
+                                use_async=use_async) == [("staging", 1, 1, 1, [])]
+    assert fetchedNames(api) == ["b"]
+    assert [(policy["id"], policy["network"]) for policy
+            in common.queryPolicies(index, [parseFilter("video = true")])] == [("b", "staging")]
+    assert [policy["id"] for policy in common.queryPolicies(index, [])] == ["a", "b"]
+
+
+def test_failed_fetches_are_indexed_next_time(api, index):
+    for name in ["a", "b"]:
+        api.addPolicy("example_com", "staging", {"id": name, "version": 1})
+    api.failures[("GET", "/imaging/v2/network/staging/policies/b")] = 500
+    [(_, fetched, _, _, failures)] = common.indexPolicies("example_com", ["staging"], 4, index)
+    assert fetched == 1 and [name for name, _ in failures] == ["b"]
+    del api.failures[("GET", "/imaging/v2/network/staging/policies/b")]
+    api.calls = []
+    common.indexPolicies("example_com", ["staging"], 4, index)
+    assert fetchedNames(api) == ["b"]
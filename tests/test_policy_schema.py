@@ -0,0 +1,56 @@
+import json
+import os
+
+import pytest
+
+from policy_schema import validatePolicy, validatePolicyJSON, policyType
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+
+@pytest.fixture
+def exported():
+    with open(os.path.join(DATA_DIR, "exported-image-policy.json")) as policy_file:
+        return json.load(policy_file)
+
+
+def test_exported_policy_is_valid(exported):
+    assert validatePolicy(exported) == []
+
+
+def test_typos_are_reported_with_their_path(exported):
+    exported["output"]["perceptualQuality"] = "hihg"
+    exported["transformations"][1]["transformation"] = "Blurr"
+    exported["imQuery"]["allowedTransformations"].append("Rotat")
+    paths = [path for path, _ in validatePolicy(exported)]
+    assert paths == ["output.perceptualQuality", "transformations.1.transformation",
+                     "imQuery.allowedTransformations.5"]
+
+
+def test_variables_replace_scalars(exported):
+    exported["output"]["quality"] = {"$var": "quality"}
+    assert validatePolicy(exported) == []
+    exported["output"]["quality"] = {"$var": 1}
+    assert validatePolicy(exported) != []
+
+
+def test_types_and_limits():
+    errors = validatePolicy({"rolloutDuration": 60, "hosts": "example.com",
+                             "output": {"quality": True}})
+    assert sorted(path for path, _ in errors) == ["hosts", "output.quality", "rolloutDuration"]
+
+
+def test_video_policies():
+    video = {"video": True, "breakpoints": {"widths": [854, 1280]},
+             "output": {"perceptualQuality": "high", "placeholderVideoUrl": "/p.mp4"}}
+    assert policyType(video) == "video"
+    assert validatePolicy(video) == []
+    assert validatePolicy({"output": {"perceptualQuality": "high"}}, "video") == []
+    assert validatePolicy({"video": "yes"}) != []
+
+
+def test_policy_json():
+    assert validatePolicyJSON('{"breakpoints": ')[0].startswith("Invalid JSON")
+    assert validatePolicyJSON('{"breakpoints": {"widths": [0]}}') == \
+        ["breakpoints.widths.0: 0 is below the minimum 1"]
+    assert validatePolicyJSON('[]') == ["(policy): expected object, got []"]
@@ -0,0 +1,53 @@
+from policy_utils import normalizePolicy, policyHash, readPolicyDir, hashTree, diffTrees, \
+    diffPolicies
+
+
+def test_normalize_drops_server_fields():
+    assert normalizePolicy({"id": "p1", "version": 2, "user": "jdoe",
+                            "breakpoints": {"widths": [320]}}) == {"breakpoints": {"widths": [320]}}
+
+
+def test_normalize_keeps_non_objects():
+    assert normalizePolicy([1, 2]) == [1, 2]
+    assert policyHash([1]) != policyHash({})
+
+
+def test_read_policy_dir_reports_non_objects(tmp_path):
+    (tmp_path / "good.json").write_text('{"breakpoints": {"widths": [320]}}')
+    (tmp_path / "list.json").write_text('[1, 2]')
+    (tmp_path / "broken.json").write_text('{"breakpoints": ')
+    (tmp_path / "notes.txt").write_text('ignored')
+    policies = readPolicyDir(str(tmp_path))
+    assert sorted(policies) == ["broken", "good", "list"]
+    assert policies["good"][1] == {"breakpoints": {"widths": [320]}}
+    assert policies["good"][2] is None
+    assert policies["list"][1] is None and "JSON object" in policies["list"][2]
+    assert policies["broken"][2].startswith("Invalid JSON")
+
+
+def diff(left, right):
+    return list(diffTrees(hashTree(left), hashTree(right)))
+
+
+def test_diff_equal_trees():
+    assert diff({"a": [1, {"b": 2}], "c": 3}, {"c": 3, "a": [1, {"b": 2}]}) == []
+
+
+def test_diff_paths():
+    left = {"output": {"quality": 80, "formats": ["webp", "jpeg"]}, "hosts": ["a"]}
+    right = {"output": {"quality": 75, "formats": ["webp"]}, "video": False}
+    assert diff(left, right) == [
+        ("changed", "output.quality", 80, 75),
+        ("removed", "output.formats.1", "jpeg", None),
+        ("removed", "hosts", ["a"], None),
+        ("added", "video", None, False),
+    ]
+
+
+def test_diff_type_change():
+    assert diff({"a": [1]}, {"a": {"0": 1}}) == [("changed", "a", [1], {"0": 1})]
+
+
+def test_diff_policies_ignores_server_fields():
+    assert diffPolicies({"id": "p1", "version": 1, "hosts": ["a"]},
+                        {"id": "p1", "version": 7, "hosts": ["a"]}) == []
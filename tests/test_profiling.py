@@ -0,0 +1,56 @@
+import io
+import pstats
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from profiling import Profiler
+
+
+def busyWorker(job):
+    """ Spins for a while, then sleeps as long """
+    deadline = time.thread_time() + 0.02
+    while time.thread_time() < deadline:
+        pass
+    time.sleep(0.02)
+    return job
+
+
+def test_threaded_run(tmp_path):
+    profiler = Profiler()
+    profiler.start()
+    worker = profiler.profiled(busyWorker)
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="worker") as executor:
+        assert list(executor.map(worker, range(6))) == list(range(6))
+    profiler.stop()
+
+    stream = io.StringIO()
+    file_name = str(tmp_path / "run.pstats")
+    profiler.report(file_name, stream, top=10)
+    report = stream.getvalue()
+    assert report.startswith("Profile saved to %s" % file_name)
+
+    # Functions run by the workers are in the merged profile
+    stats = pstats.Stats(file_name)
+    assert any(function == "busyWorker" for _, _, function in stats.stats)
+
+    lines = report.splitlines()
+    table = lines[lines.index(next(line for line in lines if line.startswith("WORKER"))):]
+    assert table[0].split() == ["WORKER", "JOBS", "WALL", "s", "CPU", "s", "CPU", "%"]
+    rows = [line.split() for line in table[1:]]
+    assert sorted(row[0] for row in rows) == ["worker_0", "worker_1"]
+    assert sum(int(row[1]) for row in rows) == 6
+    for name, jobs, wall, cpu, share in rows:
+        assert float(wall) >= 0.04 * int(jobs) * 0.9
+        assert 0.0 < float(cpu) < float(wall)
+        assert 0.0 < float(share) < 100.0
+    # One profile per worker thread, unless profilers are process wide
+    assert len(profiler.thread_profiles) in [0, 2]
+
+
+def test_jobs_of_the_profiling_thread_use_its_profile():
+    profiler = Profiler()
+    profiler.start()
+    assert profiler.profiled(busyWorker)(1) == 1
+    profiler.stop()
+    assert list(profiler.workers) == ["MainThread"]
+    assert profiler.thread_profiles == []
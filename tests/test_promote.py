@@ -0,0 +1,75 @@
+import pytest
+
+import common
+
+STAGING = "/imaging/v2/network/staging/policies/"
+PRODUCTION = "/imaging/v2/network/production/policies/"
+
+
+@pytest.fixture
+def policies(api):
+    for name, widths in [("new", [320]), ("same", [640]), ("changed", [1024])]:
+        api.addPolicy("example_com", "staging", {"id": name, "version": 4, "user": "jdoe",
+                                                 "breakpoints": {"widths": widths}})
+    api.addPolicy("example_com", "production", {"id": "same", "version": 1,
+                                                "breakpoints": {"widths": [640]}})
+    api.addPolicy("example_com", "production", {"id": "changed", "version": 1,
+                                                "breakpoints": {"widths": [2048]}})
+    return api
+
+
+def rows(promoteResult):
+    return [(row["id"], row["action"], row["result"]) for row in promoteResult]
+
+
+def puts(api):
+    return sorted(path for method, path in api.calls if method == "PUT")
+
+
+def test_promote_all(policies, use_async):
+    assert rows(common.promotePolicies("example_com", [], 4, promote_all=True,
+                                       use_async=use_async)) == [
+        ("new", "create", "promoted"), ("same", "unchanged", "skipped"),
+        ("changed", "update", "promoted")]
+    assert puts(policies) == [PRODUCTION + "changed", PRODUCTION + "new"]
+    production = policies.policies[("example_com", "production")]
+    assert production["changed"]["breakpoints"] == {"widths": [1024]}
+    assert production["new"] == {"id": "new", "version": 1, "breakpoints": {"widths": [320]}}
+
+
+def test_plan_only(policies, use_async):
+    assert rows(common.promotePolicies("example_com", ["*"], 4, plan_only=True,
+                                       use_async=use_async)) == [
+        ("new", "create", "planned"), ("same", "unchanged", "skipped"),
+        ("changed", "update", "planned")]
+    assert puts(policies) == []
+
+
+def test_patterns(policies, use_async):
+    assert rows(common.promotePolicies("example_com", ["ch*", "gone*"], 4,
+                                       use_async=use_async)) == [
+        ("gone*", "missing", "failed"), ("changed", "update", "promoted")]
+
+
+@pytest.mark.parametrize("failed", [STAGING + "changed", PRODUCTION + "changed"])
+def test_failed_fetch_of_a_production_policy(policies, use_async, failed):
+    policies.failures[("GET", failed)] = 500
+    result = common.promotePolicies("example_com", ["*"], 4, use_async=use_async)
+    assert rows(result) == [("new", "create", "promoted"), ("same", "unchanged", "skipped"),
+                            ("changed", "update", "failed")]
+    assert "500" in result[2]["details"]
+    assert puts(policies) == [PRODUCTION + "new"]
+
+
+def test_failed_fetch_of_a_new_policy(policies, use_async):
+    policies.failures[("GET", STAGING + "new")] = 500
+    assert rows(common.promotePolicies("example_com", ["new"], 4, use_async=use_async)) == [
+        ("new", "create", "failed")]
+    assert puts(policies) == []
+
+
+def test_failed_put(policies, use_async):
+    policies.failures[("PUT", PRODUCTION + "new")] = 400
+    assert rows(common.promotePolicies("example_com", ["new", "changed"], 4,
+                                       use_async=use_async)) == [
+        ("new", "create", "failed"), ("changed", "update", "promoted")]
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+import common
+from policy_utils import readPolicyDir
+
+SAME = {"breakpoints": {"widths": [320, 640]}}
+CHANGED = {"breakpoints": {"widths": [1024]}}
+NEW = {"output": {"quality": 80}}
+
+
+@pytest.fixture
+def policy_dir(tmp_path):
+    for name, policy in [("same", SAME), ("changed", CHANGED), ("new", NEW)]:
+        (tmp_path / (name + ".json")).write_text(json.dumps(policy))
+    return tmp_path
+
+
+@pytest.fixture
+def remote(api):
+    # Server managed fields do not count as changes
+    api.addPolicy("example_com", "staging", dict(SAME, id="same", version=3, user="jdoe"))
+    api.addPolicy("example_com", "staging", {"id": "changed", "version": 1,
+                                             "breakpoints": {"widths": [2048]}})
+    api.addPolicy("example_com", "production", dict(SAME, id="same", version=1))
+    return api
+
+
+def puts(api):
+    return sorted(path for method, path in api.calls if method == "PUT")
+
+
+def test_plan(remote, policy_dir, use_async):
+    plan = common.planSync("example_com", readPolicyDir(str(policy_dir)),
+                           ["staging", "production"], 4, use_async=use_async)
+    assert sorted(plan) == [("production", "changed", "create"),
+                            ("production", "new", "create"),
+                            ("production", "same", "unchanged"),
+                            ("staging", "changed", "update"),
+                            ("staging", "new", "create"),
+                            ("staging", "same", "unchanged")]
+    assert puts(remote) == []
+
+
+def test_plan_only_deploys_nothing(remote, policy_dir, use_async, capsys):
+    result, invalid = common.syncPolicies("example_com", str(policy_dir), "staging", 4,
+                                          plan_only=True, use_async=use_async)
+    assert (result, invalid) == ([], [])
+    assert puts(remote) == []
+    assert "STAGING: 2 to deploy, 1 unchanged" in capsys.readouterr().out
+
+
+def test_sync_puts_changed_policies_only(remote, policy_dir, use_async):
+    result, invalid = common.syncPolicies("example_com", str(policy_dir), "staging", 4,
+                                          use_async=use_async)
+    assert sorted((job, error) for job, _, error in result) == [
+        (("staging", "changed"), None), (("staging", "new"), None)]
+    assert puts(remote) == ["/imaging/v2/network/staging/policies/changed",
+                            "/imaging/v2/network/staging/policies/new"]
+    staging = remote.policies[("example_com", "staging")]
+    assert staging["changed"]["breakpoints"] == CHANGED["breakpoints"]
+    assert staging["changed"]["version"] == 2
+
+    # Everything is deployed now
+    remote.calls = []
+    result, _ = common.syncPolicies("example_com", str(policy_dir), "staging", 4,
+                                    use_async=use_async)
+    assert result == [] and puts(remote) == []
+
+
+def test_invalid_files_are_skipped(remote, policy_dir, use_async, capsys):
+    (policy_dir / "typo.json").write_text('{"output": {"perceptualQuality": "hihg"}}')
+    (policy_dir / "broken.json").write_text('{"output": ')
+    result, invalid = common.syncPolicies("example_com", str(policy_dir), "staging", 4,
+                                          use_async=use_async)
+    assert sorted(name for name, _ in invalid) == ["broken", "typo"]
+    assert "SKIPPED: typo (Invalid policy: output.perceptualQuality" in capsys.readouterr().out
+    assert [path.rsplit("/", 1)[1] for path in puts(remote)] == ["changed", "new"]
+
+
+def test_failed_puts_are_reported(remote, policy_dir, use_async):
+    remote.failures[("PUT", "/imaging/v2/network/staging/policies/new")] = 400
+    result, _ = common.syncPolicies("example_com", str(policy_dir), "staging", 4,
+                                    use_async=use_async)
+    errors = dict((job[1], error) for job, _, error in result)
+    assert errors["changed"] is None
+    assert "400" in errors["new"] and "Injected failure" in errors["new"]
+
+
+def test_failed_listing_stops_the_sync(remote, policy_dir, use_async):
+    remote.failures[("GET", "/imaging/v2/network/staging/policies")] = 403
+    with pytest.raises(SystemExit):
+        common.syncPolicies("example_com", str(policy_dir), "staging", 4, use_async=use_async)
+    assert puts(remote) == []
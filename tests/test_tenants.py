@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+import common
+
+
+def tenantsFile(tmp_path, tenants):
+    file_name = tmp_path / "tenants.json"
+    file_name.write_text(tenants if isinstance(tenants, str) else json.dumps(tenants))
+    return str(file_name)
+
+
+def test_read_tenants(tmp_path):
+    tenants = tenantsFile(tmp_path, [
+        {"name": "Acme", "policy_sets": ["acme_com", "acme_net"], "account_key": "B-1"},
+        {"policy_set": "example_com"},
+        {"name": "Null key", "policy_sets": "null_com", "account_key": None},
+    ])
+    assert common.readTenants(tenants) == [("Acme", "acme_com", "B-1"),
+                                           ("Acme", "acme_net", "B-1"),
+                                           ("tenant2", "example_com", ""),
+                                           ("Null key", "null_com", "")]
+
+
+@pytest.mark.parametrize("tenants, message", [
+    ("[{", "Cannot read the tenants file"),
+    ({"name": "Acme"}, "must hold a JSON list"),
+    (["acme_com"], "is not a JSON object"),
+    ([{"name": "Acme"}], "has no policy_sets"),
+    ([{"policy_sets": []}], "has no policy_sets"),
+    ([{"policy_sets": [None]}], "has no policy_sets"),
+    ([{"policy_sets": ["acme_com"], "account_key": 12}], "has an invalid account_key"),
+])
+def test_invalid_tenants(tmp_path, tenants, message):
+    with pytest.raises(SystemExit) as exit_info:
+        common.readTenants(tenantsFile(tmp_path, tenants))
+    assert message in str(exit_info.value)
+
+
+def test_inventory(api, tmp_path, use_async):
+    api.addPolicy("acme_com", "staging", {"id": "hero", "version": 2})
+    api.addPolicy("example_com", "production", {"id": "banner", "version": 1})
+    api.failures[("GET", "/imaging/v2/network/production/policies")] = 403
+    tenants = common.readTenants(tenantsFile(tmp_path, [
+        {"name": "Acme", "policy_set": "acme_com", "account_key": None},
+        {"name": "Example", "policy_set": "example_com", "account_key": "B-2"},
+    ]))
+    items, failures = common.inventoryPolicies(tenants, ["staging", "production"], 4,
+                                               use_async)
+    assert [(item["tenant"], item["policy_set"], item["network"], item["id"],
+             item["account_key"]) for item in items] == [("Acme", "acme_com", "staging",
+                                                          "hero", "")]
+    assert [failure[:3] for failure in failures] == [("Acme", "acme_com", "production"),
+                                                     ("Example", "example_com", "production")]
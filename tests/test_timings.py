@@ -0,0 +1,18 @@
+import pytest
+
+from timings import percentile
+
+SAMPLES = [float(value) for value in range(1, 101)]
+
+
+@pytest.mark.parametrize("fraction, expected", [
+    (0.5, 50.0), (0.95, 95.0), (0.99, 99.0), (0.07, 7.0), (1.0, 100.0), (0.0, 1.0)])
+def test_nearest_rank(fraction, expected):
+    assert percentile(SAMPLES, fraction) == expected
+
+
+def test_small_lists():
+    assert percentile([], 0.95) == 0.0
+    assert percentile([3.0], 0.5) == 3.0
+    assert percentile([1.0, 2.0], 0.5) == 1.0
+    assert percentile([1.0, 2.0], 0.51) == 2.0
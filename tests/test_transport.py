@@ -0,0 +1,68 @@
+import socket
+import ssl
+
+import requests
+
+import common
+from transport import TransportAdapter, ResumingSSLContext, keepAliveSocketOptions, \
+    DEFAULT_POOL_MAXSIZE
+
+
+def test_keep_alive_socket_options():
+    options = keepAliveSocketOptions()
+    assert (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) in options
+    assert (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1) in options
+
+
+def test_adapter_pool():
+    adapter = TransportAdapter(pool_connections=4, pool_maxsize=32)
+    assert adapter.poolmanager.connection_pool_kw["maxsize"] == 32
+    assert adapter.poolmanager.pools._maxsize == 4
+    assert adapter.poolmanager.connection_pool_kw["socket_options"] == keepAliveSocketOptions()
+    assert "ssl_context" not in adapter.poolmanager.connection_pool_kw
+    pool = adapter.poolmanager.connection_from_url("https://example.com/")
+    assert pool.pool.maxsize == 32
+
+
+def test_adapter_without_keep_alive():
+    adapter = TransportAdapter(keep_alive=False)
+    assert "socket_options" not in adapter.poolmanager.connection_pool_kw
+    request = requests.Request("GET", "https://example.com/").prepare()
+    adapter.add_headers(request)
+    assert request.headers["Connection"] == "close"
+    keep_alive = requests.Request("GET", "https://example.com/").prepare()
+    TransportAdapter().add_headers(keep_alive)
+    assert "Connection" not in keep_alive.headers
+
+
+def test_adapter_tls_session_reuse():
+    context = ResumingSSLContext()
+    assert context.verify_mode == ssl.CERT_REQUIRED and not context.check_hostname
+    adapter = TransportAdapter(ssl_context=context)
+    assert adapter.poolmanager.connection_pool_kw["ssl_context"] is context
+    assert context.session("example.com") is None
+
+
+def test_timed_adapter_pools():
+    from timings import TimedHTTPConnectionPool, TimedHTTPSConnectionPool
+    adapter = TransportAdapter(timed=True)
+    assert isinstance(adapter.poolmanager.connection_from_url("https://example.com/"),
+                      TimedHTTPSConnectionPool)
+    assert isinstance(adapter.poolmanager.connection_from_url("http://example.com/"),
+                      TimedHTTPConnectionPool)
+
+
+def test_pool_grows_with_the_workers(monkeypatch):
+    session = requests.Session()
+    monkeypatch.setattr(common, "session", session)
+    monkeypatch.setattr(common, "transport", {"pool_connections": 2, "keep_alive": False,
+                                              "ssl_context": None, "timed": False})
+    common.mountTransport(DEFAULT_POOL_MAXSIZE)
+    common.sizeConnectionPool(4)
+    assert session.get_adapter("https://example.com/")._pool_maxsize == DEFAULT_POOL_MAXSIZE
+    common.sizeConnectionPool(64)
+    for url in ["https://example.com/", "http://example.com/"]:
+        adapter = session.get_adapter(url)
+        assert adapter._pool_maxsize == 64 and adapter._pool_connections == 2
+        assert adapter.keep_alive is False
+    assert common.transport["pool_maxsize"] == 64
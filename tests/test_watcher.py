@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+
+from watcher import DirectoryWatcher, PollingWatcher
+
+
+def writeLater(directory, writes, delay=0.05):
+    """ Writes (file name, text) pairs from a thread, delay seconds apart """
+    def run():
+        for name, text in writes:
+            time.sleep(delay)
+            (directory / name).write_text(text)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_polling_watcher_reports_changed_files(tmp_path):
+    (tmp_path / "a.json").write_text("{}")
+    watcher = PollingWatcher(str(tmp_path), interval=0.01)
+    assert watcher.changes(0.05) == set()
+    (tmp_path / "a.json").write_text('{"id": "a"}')
+    (tmp_path / "b.json").write_text("{}")
+    assert watcher.changes(0.05) == {"a.json", "b.json"}
+    assert watcher.changes(0.05) == set()
+
+
+@pytest.mark.parametrize("polling", [True, False], ids=["polling", "native"])
+def test_writes_within_the_debounce_delay_are_one_batch(tmp_path, polling):
+    watcher = DirectoryWatcher(str(tmp_path), debounce=0.3, poll_interval=0.01,
+                               polling=polling)
+    try:
+        thread = writeLater(tmp_path, [("a.json", "{"), ("a.json", '{"id"'),
+                                       ("b.json", "{}"), ("notes.txt", "draft"),
+                                       ("a.json", '{"id": "a"}')])
+        started = time.time()
+        assert watcher.wait(timeout=5) == {"a.json", "b.json"}
+        thread.join()
+        # Returned once the directory was quiet for the debounce delay
+        assert time.time() - started >= 0.25 + 0.3
+        assert watcher.wait(timeout=0.2) == set()
+    finally:
+        watcher.close()
+
+
+def test_timeout_without_changes(tmp_path):
+    watcher = DirectoryWatcher(str(tmp_path), polling=True, poll_interval=0.01)
+    started = time.time()
+    assert watcher.wait(timeout=0.1) == set()
+    assert time.time() - started < 1
+
+
+def test_lost_events_report_every_file(tmp_path):
+    class OverflowingWatcher():
+        batches = [{"a.json"}, None, set()]
+
+        def changes(self, timeout):
+            return self.batches.pop(0)
+
+    for name in ["a.json", "b.json", "notes.txt"]:
+        (tmp_path / name).write_text("{}")
+    watcher = DirectoryWatcher(str(tmp_path), polling=True)
+    watcher.watcher = OverflowingWatcher()
+    assert watcher.wait() == {"a.json", "b.json"}